@@ -1,12 +1,21 @@
 import os
+import asyncio
 import logging
 import json
+import threading
+import time
+from concurrent.futures import Future
 from tree_of_thought import TreeOfThought
-from api_utils import make_api_call, AnthropicAPIError, CLAUDE_MODEL
+from thought import Thought
+from typing import Dict, List, Optional, Tuple
+from api_utils import make_api_call_async, run_in_thread, AnthropicAPIError, TokenBucket, cache_breakpoint
+from checkpoints import checkpointed
+from deadlines import degrade, remaining_time, reserve, within_deadline
+from model_routing import stage
+from progress import ProgressCallback, report_progress
+from response_cache import ResponseCache, make_cache_key
+from tracing import annotate, span
 from dotenv import load_dotenv
-from tavily import TavilyClient
-import requests
-from ratelimit import limits, sleep_and_retry
 
 load_dotenv()
 
@@ -14,41 +23,171 @@ logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
 
 TAVILY_API_KEY = os.getenv("TAVILY_API_KEY")
+TAVILY_SEARCHES_PER_MINUTE = int(os.getenv("TAVILY_SEARCHES_PER_MINUTE", "20"))
+# A successful key check is trusted for this many seconds; a failed one is retried after a minute.
+TAVILY_KEY_CHECK_TTL = float(os.getenv("TAVILY_KEY_CHECK_TTL", "3600"))
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+class SearchService:
+    """
+    Tavily access shared by every agent: one pooled client, a TTL cache keyed on the normalized
+    query, and single-flight deduplication so concurrent identical searches share one request.
+    Requests are paced by the service's own `limiter`, a TAVILY_SEARCHES_PER_MINUTE bucket by default.
+    """
+
+    def __init__(self, api_key: Optional[str] = TAVILY_API_KEY, api_base_url: Optional[str] = None,
+                 cache: Optional[ResponseCache] = None, limiter: Optional[TokenBucket] = None):
+        self.api_key = api_key
+        self.api_base_url = api_base_url
+        self._client = None
+        self.cache = cache if cache is not None else ResponseCache(ttl=3600)
+        self.limiter = limiter or TokenBucket("searches", TAVILY_SEARCHES_PER_MINUTE)
+        self._in_flight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.deduplicated = 0
+
+    @property
+    def client(self) -> "TavilyClient":
+        # tavily (and requests with it) is imported when the first search needs it.
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from tavily import TavilyClient
+                    self._client = TavilyClient(api_key=self.api_key, api_base_url=self.api_base_url)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def _fetch(self, query: str, search_depth: str, max_results: int) -> str:
+        wait = self.limiter.reserve()
+        if wait > 0:
+            logger.debug(f"Search rate limit delaying request by {wait:.2f}s")
+            time.sleep(wait)
+        with self._lock:
+            self.requests_sent += 1
+        logger.debug(f"Sending request to Tavily API with query: {query}")
+        search_result = self.client.get_search_context(
+            query=query,
+            search_depth=search_depth,
+            max_results=max_results,
+        )
+        return json.dumps(search_result)
+
+    def search(self, query: str, search_depth: str = "advanced", max_results: int = 3) -> str:
+        key = make_cache_key(query=normalize_query(query), search_depth=search_depth, max_results=max_results)
+        cached = self.cache.get(key)
+        if cached is not None:
+            annotate(cached=True)
+            return cached
+
+        with self._lock:
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._in_flight[key] = Future()
+            else:
+                self.deduplicated += 1
+        if not is_owner:
+            annotate(deduplicated=True)
+            return future.result()
+
+        try:
+            result = self._fetch(query, search_depth, max_results)
+            self.cache.set(key, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # Errors go to every waiter but are not cached, so the next search tries again.
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"requests_sent": self.requests_sent, "deduplicated": self.deduplicated, "cache_hits": self.cache.hits}
+
+_search_service: Optional[SearchService] = None
+_search_service_lock = threading.Lock()
+
+def get_search_service() -> SearchService:
+    global _search_service
+    with _search_service_lock:
+        if _search_service is None:
+            cache = ResponseCache(path=os.getenv("SEARCH_CACHE_DB"), ttl=float(os.getenv("SEARCH_CACHE_TTL", "3600")))
+            _search_service = SearchService(cache=cache)
+        return _search_service
+
+def _dump_tot_result(result: Tuple[List[Thought], str]) -> str:
+    thoughts, synthesis = result
+    return json.dumps({"thoughts": [[t.content, t.evaluation, t.score] for t in thoughts], "synthesis": synthesis})
+
+def _load_tot_result(saved: str) -> Tuple[List[Thought], str]:
+    result = json.loads(saved)
+    return [Thought(*thought) for thought in result["thoughts"]], result["synthesis"]
+
+def _tot_succeeded(result: Tuple[List[Thought], str]) -> bool:
+    thoughts, synthesis = result
+    return bool(thoughts) and not synthesis.startswith("Unable to synthesize")
 
 class Agent:
-    def __init__(self, name: str, tot_depth: int = 2, tot_branching: int = 2):
+    def __init__(self, name: str, tot_depth: int = 2, tot_branching: int = 2, search_service: Optional[SearchService] = None,
+                 **tot_options):
         self.name = name
-        self.tot = TreeOfThought(max_depth=tot_depth, branching_factor=tot_branching)
-        self.tavily_client = TavilyClient(api_key=TAVILY_API_KEY)
+        self.tot = TreeOfThought(max_depth=tot_depth, branching_factor=tot_branching, **tot_options)
+        self.search_service = search_service or get_search_service()
+
+    @property
+    def tavily_client(self) -> "TavilyClient":
+        return self.search_service.client
 
-    @sleep_and_retry
-    @limits(calls=20, period=60)
     def search_internet(self, query: str) -> str:
+        import requests
+
         if not self.tavily_client.api_key:
             logger.error("Tavily API key is missing or invalid.")
             return "Error: Tavily API key is missing or invalid."
 
         try:
-            logger.debug(f"Sending request to Tavily API with query: {query}")
-            search_result = self.tavily_client.get_search_context(
-                query=query,
-                search_depth="advanced",
-                max_results=3,
-            )
-            return json.dumps(search_result)
+            with span("search"):
+                return self.search_service.search(query)
         except requests.exceptions.RequestException as e:
             error_message = f"Error: {str(e)}"
             logging.error(f"Error searching the internet: {str(e)}")
             return error_message
     
-    def process(self, input: str) -> str:
-        internet_info = self.search_internet(input)
-        thoughts, synthesis = self.tot.process(input)
+    async def process_async(self, input: str, on_progress: Optional[ProgressCallback] = None) -> str:
+        with span("agent", agent=self.name):
+            return await self._process_async(input, on_progress)
+
+    async def _process_async(self, input: str, on_progress: Optional[ProgressCallback]) -> str:
+        # The search and the Tree of Thought run are independent, so overlap their network waits.
+        # Under a deadline they get half of the time left; the response that uses them needs the rest.
+        with reserve(0.5):
+            internet_info, (thoughts, synthesis) = await asyncio.gather(
+                within_deadline(run_in_thread(self.search_internet, input), lambda: "Error: the search ran out of time.",
+                                f"search for Agent {self.name}"),
+                checkpointed(f"tot/{self.name}", lambda: self.tot.process_async(input),
+                             dump=_dump_tot_result, load=_load_tot_result, keep=_tot_succeeded),
+            )
+        report_progress(on_progress, "tot", f"Agent {self.name}: Tree of Thought explored {len(thoughts)} thoughts", agent=self.name)
         
-        system_prompt = f"""You are AI Agent {self.name} with direct access to internet search results. Use the provided thoughts, synthesis from the Tree of Thought process, and internet information to generate a comprehensive response to the input.
+        system_prompt = """You are an AI Agent with direct access to internet search results. Use the provided thoughts, synthesis from the Tree of Thought process, and internet information to generate a comprehensive response to the input.
         Include key insights from the thoughts and explain your reasoning. If you need more information, you can request another internet search."""
 
-        user_prompt = f"""Input: {input}
+        # The input and search results are the same for every agent in a layer, so they go first
+        # and end a cacheable prefix; this agent's own Tree of Thought output follows.
+        shared_prompt = f"""Input: {input}
+
+Internet Information:
+{internet_info}"""
+
+        agent_prompt = f"""You are AI Agent {self.name}.
 
 Tree of Thought process:
 Thoughts:
@@ -56,46 +195,74 @@ Thoughts:
 
 Synthesis: {synthesis}
 
-Internet Information:
-{internet_info}
-
 Based on these thoughts, synthesis, and internet information, provide a comprehensive response. If you need more information, say "SEARCH:" followed by your search query:"""
+        user_content = [cache_breakpoint(shared_prompt), {"type": "text", "text": agent_prompt}]
         
-        try:
-            response = make_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=4096)
-            
-            # Check if the response includes a search request
-            if "SEARCH:" in response:
-                search_query = response.split("SEARCH:", 1)[1].strip()
-                new_info = self.search_internet(search_query)
+        with stage("agent"):
+            try:
+                start_time = time.perf_counter()
+                # Out of time, the Tree of Thought's synthesis stands in for the response.
+                response = await within_deadline(
+                    make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_content}], max_tokens=4096),
+                    lambda: synthesis, f"response of Agent {self.name}")
+
+                # Check if the response includes a search request
+                remaining = remaining_time()
+                if "SEARCH:" in response and remaining is not None and remaining < 2 * (time.perf_counter() - start_time):
+                    # A follow-up search and call take about twice as long as the first call did; answer without them.
+                    degrade(f"follow-up search of Agent {self.name}", f"{remaining:.1f}s left")
+                    response = response.split("SEARCH:", 1)[0].strip()
+                elif "SEARCH:" in response:
+                    search_query = response.split("SEARCH:", 1)[1].strip()
+                    new_info = await within_deadline(run_in_thread(self.search_internet, search_query), lambda: "Error: the search ran out of time.",
+                                                     f"follow-up search of Agent {self.name}")
                 
-                if "Error" in new_info:
-                    logger.warning(f"Error during additional internet search: {new_info}")
-                    follow_up_prompt = f"{response}\n\nUnable to perform additional search. Please provide your response based on the available information:"
-                else:
-                    follow_up_prompt = f"{response}\n\nAdditional Internet Information:\n{new_info}\n\nNow, provide your final response:"
+                    if "Error" in new_info:
+                        logger.warning(f"Error during additional internet search: {new_info}")
+                        follow_up_prompt = f"{response}\n\nUnable to perform additional search. Please provide your response based on the available information:"
+                    else:
+                        follow_up_prompt = f"{response}\n\nAdditional Internet Information:\n{new_info}\n\nNow, provide your final response:"
                 
-                response = make_api_call(system=system_prompt, messages=[{"role": "user", "content": follow_up_prompt}], max_tokens=4096)
+                    response = await within_deadline(
+                        make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": follow_up_prompt}], max_tokens=4096),
+                        lambda: response.split("SEARCH:", 1)[0].strip(), f"follow-up response of Agent {self.name}")
             
-            return response
-        except AnthropicAPIError as e:
-            logger.error(f"Error processing input in Agent {self.name}: {str(e)}")
-            return f"Error processing input in Agent {self.name}: {str(e)}"
+                return response
+            except AnthropicAPIError as e:
+                logger.error(f"Error processing input in Agent {self.name}: {str(e)}")
+                return f"Error processing input in Agent {self.name}: {str(e)}"
+
+    def process(self, input: str) -> str:
+        return asyncio.run(self.process_async(input))
 
     @staticmethod
-    def verify_tavily_api_key():
-        if not TAVILY_API_KEY:
-            logger.error("Tavily API key is missing. Please add it to your .env file.")
-            return False
-        
-        client = TavilyClient(api_key=TAVILY_API_KEY)
-        try:
-            client.get_search_context("test query", max_tokens=100)
-            logger.info("Tavily API key verified successfully.")
-            return True
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to verify Tavily API key: {str(e)}", exc_info=True)
-            return False
-        except Exception as e:
-            logger.error(f"Unexpected error verifying Tavily API key: {str(e)}", exc_info=True)
-            return False
\ No newline at end of file
+    def verify_tavily_api_key() -> bool:
+        """Live check of the Tavily key, made at most once per TAVILY_KEY_CHECK_TTL seconds per process."""
+        global _key_check
+        with _key_check_lock:
+            if _key_check is not None and time.monotonic() < _key_check[0]:
+                return _key_check[1]
+            verified = _check_tavily_api_key()
+            _key_check = (time.monotonic() + (TAVILY_KEY_CHECK_TTL if verified else min(TAVILY_KEY_CHECK_TTL, 60)), verified)
+            return verified
+
+# (expiry, result) of the last key check
+_key_check: Optional[Tuple[float, bool]] = None
+_key_check_lock = threading.Lock()
+
+def _check_tavily_api_key() -> bool:
+    import requests
+    if not TAVILY_API_KEY:
+        logger.error("Tavily API key is missing. Please add it to your .env file.")
+        return False
+
+    try:
+        get_search_service().client.get_search_context("test query", max_tokens=100)
+        logger.info("Tavily API key verified successfully.")
+        return True
+    except requests.exceptions.RequestException as e:
+        logger.error(f"Failed to verify Tavily API key: {str(e)}", exc_info=True)
+        return False
+    except Exception as e:
+        logger.error(f"Unexpected error verifying Tavily API key: {str(e)}", exc_info=True)
+        return False
\ No newline at end of file
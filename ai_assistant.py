@@ -1,20 +1,140 @@
-from typing import List, Tuple, Dict
+import asyncio
+import contextvars
+import queue
+import re
+import threading
+import uuid
+from typing import Any, ContextManager, Iterator, List, Optional, Tuple, Dict
+from checkpoints import CheckpointStore, checkpoint_run, checkpoint_scope, checkpointed, get_checkpoint_store, is_complete, request_id_for
+from conversation_memory import ConversationMemory
+from deadlines import deadline, reserve, within_deadline
 from mixture_of_agents import MixtureOfAgents
-from api_utils import make_api_call, AnthropicAPIError, chunk_text
+from model_routing import stage
+from thought_store import ThoughtStore
+from api_utils import make_api_call_async, run_in_thread, stream_api_call, AnthropicAPIError, chunk_text
+from progress import ProgressCallback, report_progress
+from tracing import Trace, span, start_trace
 import logging
 
 logger = logging.getLogger(__name__)
 
+# With fast_path on, inputs of at most this many words and none of the words below get a single API call.
+TRIVIAL_MAX_WORDS = 12
+_NON_TRIVIAL_WORDS = re.compile(r"\b(explain|why|how|compare|versus|vs|analy[sz]e|design|plan|write|implement|code|describe|discuss|"
+                                r"evaluate|summari[sz]e|recommend|pros|cons|difference|strategy|essay|research|latest|current|today|news)\b",
+                                re.IGNORECASE)
+
+# respond() plans to finish within this share of its timeout; the rest is slack before the request is cut off.
+SOFT_DEADLINE = 0.9
+# Share of the time left that the agents leave for the final synthesis.
+FINAL_SYNTHESIS_SHARE = 0.25
+
+def is_trivial_input(user_input: str) -> bool:
+    """Short, single-line questions that need neither reasoning nor fresh information, e.g. "What is the capital of France?"."""
+    text = user_input.strip()
+    return 0 < len(text.split()) <= TRIVIAL_MAX_WORDS and "\n" not in text and not _NON_TRIVIAL_WORDS.search(text)
+
 class AIAssistant:
-    def __init__(self, num_layers: int = 2, agents_per_layer: int = 2, tot_depth: int = 2, tot_branching: int = 2):
-        self.moa = MixtureOfAgents(num_layers, agents_per_layer, tot_depth, tot_branching)
+    def __init__(self, num_layers: int = 2, agents_per_layer: int = 2, tot_depth: int = 2, tot_branching: int = 2, max_concurrency: int = 4,
+                 tot_options: Optional[Dict[str, Any]] = None, max_parallel_chunks: int = 4, reduce_fan_in: int = 4,
+                 memory: Optional[ConversationMemory] = None, fast_path: bool = False, early_exit_threshold: Optional[float] = None,
+                 thought_store: Optional[ThoughtStore] = None, checkpoints: Optional[CheckpointStore] = None):
+        self.moa = MixtureOfAgents(num_layers, agents_per_layer, tot_depth, tot_branching, max_concurrency, tot_options, memory,
+                                   early_exit_threshold, thought_store)
+        self.fast_path = fast_path  # Answer trivial inputs with one API call instead of the full pipeline
         self.max_tokens = 4096
+        self.max_parallel_chunks = max_parallel_chunks  # Input chunks run through the MoA at the same time
+        self.reduce_fan_in = max(reduce_fan_in, 2)  # Partial answers merged per reduce call
+        self.checkpoints = checkpoints if checkpoints is not None else get_checkpoint_store()
+        # Request IDs are scoped to this assistant, so assistants sharing a store never resume (or clear) each other's stages.
+        self.instance_id = uuid.uuid4().hex
+
+    def request_id(self, user_input: str) -> str:
+        return request_id_for(user_input, self.moa.conversation_history, self.instance_id)
+
+    def resumable(self, user_input: str, request_id: Optional[str] = None) -> ContextManager[None]:
+        """Context for handling one request: completed stages are checkpointed, and reused if the request is retried."""
+        return checkpoint_run(self.checkpoints, request_id or self.request_id(user_input))
+
+    def rollback_history(self, length: int):
+        """Forget the turns of an unfinished request, so that asking again gets the same request ID."""
+        del self.moa.conversation_history[length:]
+
+    def partial_response(self, request_id: str) -> Optional[str]:
+        """The furthest-along output of each input chunk of an unfinished request, or None if nothing completed."""
+        stages = self.checkpoints.stages(request_id) if self.checkpoints is not None else {}
+        best: Dict[str, Tuple[int, str]] = {}
+        rank = {"moa": 3, "synthesis": 2, "agent": 1}
+        for stage, output in stages.items():  # Oldest first, so later layers replace earlier ones
+            chunk, _, name = stage.partition("/")
+            kind = name.split("/", 1)[0]
+            if kind in rank and rank[kind] >= best.get(chunk, (0, ""))[0]:
+                best[chunk] = (rank[kind], output)
+        if not best:
+            return None
+        parts = [best[chunk][1] for chunk in sorted(best, key=lambda chunk: int(chunk[len("chunk"):]))]
+        return "I ran out of time before finishing this answer. Here is what I had so far:\n\n" + "\n\n".join(parts)
 
     def _process_with_moa(self, input: str) -> str:
         final_output, _ = self.moa.process(input)
         return final_output
 
-    def _synthesize_final_response(self, user_input: str, moa_output: str, concise: bool = False) -> str:
+    @staticmethod
+    def _input_preview(user_input: str, limit: int = 2000) -> str:
+        return user_input if len(user_input) <= limit else user_input[:limit] + "..."
+
+    async def _merge_partials_async(self, user_input: str, partials: List[str]) -> str:
+        system_prompt = """You are an AI assistant merging partial answers. Each partial answer was produced by a Mixture of Agents from one section of a long user input.
+        Combine them into a single coherent answer that keeps every relevant fact, removes repetition and resolves contradictions."""
+        user_prompt = f"Original user input (may be truncated): {self._input_preview(user_input)}\n\n"
+        user_prompt += "\n\n".join(f"Partial answer {i+1}:\n{partial}" for i, partial in enumerate(partials))
+        user_prompt += "\n\nMerge these partial answers into one answer:"
+
+        try:
+            with span("merge", partials=len(partials)), stage("merge"):
+                return await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens)
+        except AnthropicAPIError as e:
+            logger.error(f"Error merging partial answers: {str(e)}")
+            return "\n\n".join(partials)
+
+    async def _map_reduce_async(self, user_input: str, on_progress: Optional[ProgressCallback] = None) -> str:
+        """Run every input chunk through the MoA concurrently, then merge the partial outputs tree-style."""
+        input_chunks = chunk_text(user_input, self.max_tokens)
+        semaphore = asyncio.Semaphore(self.max_parallel_chunks)
+        context = await self.moa.memory.context_async(self.moa.conversation_history)
+
+        async def run_moa(chunk: str) -> str:
+            output, _ = await self.moa.process_async(chunk, on_progress, record_history=False, context=context)
+            return output
+
+        async def map_chunk(i: int, chunk: str) -> str:
+            async with semaphore:
+                if len(input_chunks) > 1:
+                    report_progress(on_progress, "chunk", f"Processing input chunk {i + 1}/{len(input_chunks)}", chunk=i)
+                with span("chunk", chunk=i), checkpoint_scope(f"chunk{i}"):
+                    return await checkpointed("moa", lambda: run_moa(chunk), keep=is_complete)
+
+        partials = list(await asyncio.gather(*(map_chunk(i, chunk) for i, chunk in enumerate(input_chunks))))
+
+        # Each round merges groups of reduce_fan_in partials, so n chunks take about log(n) rounds.
+        while len(partials) > 1:
+            groups = [partials[i:i + self.reduce_fan_in] for i in range(0, len(partials), self.reduce_fan_in)]
+            report_progress(on_progress, "reduce", f"Merging {len(partials)} partial answers into {len(groups)}")
+
+            async def reduce_group(group: List[str]) -> str:
+                if len(group) == 1:
+                    return group[0]
+                async with semaphore:
+                    return await within_deadline(self._merge_partials_async(user_input, group), lambda: "\n\n".join(group),
+                                                 "merging partial answers")
+
+            partials = list(await asyncio.gather(*(reduce_group(group) for group in groups)))
+
+        moa_output = partials[0]
+        self.moa.add_to_history(user_input, moa_output)
+        return moa_output
+
+    def _final_synthesis_prompts(self, user_input: str, moa_output: str, concise: bool) -> Tuple[str, str]:
         system_prompt = f"""You are an AI assistant with access to a large context window. Your task is to synthesize the output from a Mixture of Agents (which includes Tree of Thought processes) into a single, {'concise' if concise else 'comprehensive'} response.
         Your goal is to provide a clear, coherent, and complete answer to the original user input.
         Ensure that your response directly addresses the user's question and incorporates all relevant information from the provided input."""
@@ -25,34 +145,180 @@ Mixture of Agents output (including Tree of Thought processes):
 {moa_output}
 
 Based on this input, provide a {'concise' if concise else 'comprehensive'} response to the original user input. Be sure to incorporate all relevant information and insights:"""
+        return system_prompt, user_prompt
+
+    async def _synthesize_final_response_async(self, user_input: str, moa_output: str, concise: bool = False) -> str:
+        system_prompt, user_prompt = self._final_synthesis_prompts(user_input, moa_output, concise)
         
         try:
-            return make_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens)
+            with span("final_synthesis"), stage("final_synthesis"):
+                return await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens)
         except AnthropicAPIError as e:
             logger.error(f"Error in synthesizing final response: {str(e)}")
             return "I apologize, but I'm unable to provide a response at the moment. Please try again later."
 
-    def respond(self, user_input: str, timeout: int = 180, concise: bool = False) -> Tuple[str, List[Dict[str, str]]]:
+    def _synthesize_final_response(self, user_input: str, moa_output: str, concise: bool = False) -> str:
+        return asyncio.run(self._synthesize_final_response_async(user_input, moa_output, concise))
+
+    def uses_fast_path(self, user_input: str) -> bool:
+        return self.fast_path and is_trivial_input(user_input)
+
+    async def _direct_answer_prompts_async(self, user_input: str) -> Tuple[str, str]:
+        system_prompt = "You are a helpful AI assistant. Answer the user's question directly and accurately. Keep the answer short unless more detail is clearly needed."
+        context = await self.moa.memory.context_async(self.moa.conversation_history)
+        user_prompt = f"Context:\n{context}\n\nQuestion: {user_input}" if context else user_input
+        return system_prompt, user_prompt
+
+    async def _answer_directly_async(self, user_input: str) -> str:
+        system_prompt, user_prompt = await self._direct_answer_prompts_async(user_input)
+        try:
+            with span("fast_path"), stage("fast_path"):
+                response = await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens)
+        except AnthropicAPIError as e:
+            logger.error(f"Error answering directly: {str(e)}")
+            return "I apologize, but I'm unable to provide a response at the moment. Please try again later."
+        self.moa.add_to_history(user_input, response)
+        return response
+
+    def stream_direct_answer(self, user_input: str) -> Iterator[str]:
+        """Stream a single-call answer to a trivial input as text deltas, then record it in the history."""
+        system_prompt, user_prompt = asyncio.run(self._direct_answer_prompts_async(user_input))
+        pieces = []
+        for text in stream_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens,
+                                    stage="fast_path"):
+            pieces.append(text)
+            yield text
+        self.moa.add_to_history(user_input, "".join(pieces))
+
+    @staticmethod
+    async def _stream_events_async(tokens: Iterator[str], on_event: ProgressCallback) -> str:
+        """Pass a streamed response to on_event as token events from a worker thread; returns the whole text."""
+        stop = threading.Event()
+
+        def consume() -> str:
+            pieces = []
+            for text in tokens:
+                if stop.is_set():  # The request was cancelled or cut off mid-stream
+                    break
+                pieces.append(text)
+                on_event({"type": "token", "text": text})
+            return "".join(pieces)
+
         try:
-            input_chunks = chunk_text(user_input, self.max_tokens)
-            moa_outputs = []
-            for chunk in input_chunks:
-                moa_output = self._process_with_moa(chunk)
-                moa_outputs.append(moa_output)
-
-            combined_moa_output = " ".join(moa_outputs)
-            final_response_chunks = chunk_text(combined_moa_output, self.max_tokens)
-            final_responses = []
-
-            for chunk in final_response_chunks:
-                response = self._synthesize_final_response(user_input, chunk, concise)
-                final_responses.append(response)
-
-            final_response = " ".join(final_responses)
-            return final_response, self.moa.conversation_history
+            return await run_in_thread(consume)
+        finally:
+            stop.set()
+
+    async def run_pipeline_async(self, user_input: str, concise: bool = False, request_id: Optional[str] = None,
+                                 timeout: Optional[float] = None, on_event: Optional[ProgressCallback] = None) -> str:
+        """
+        The respond pipeline: fast path or map-reduce through the Mixture of Agents, then the final
+        synthesis, with the request's stages checkpointed. respond, respond_stream and the job queue
+        all run it. With a `timeout`, every stage works within the time left: Tree of Thought
+        searches stop early, follow-up searches and later layers are skipped, and cut-off calls fall
+        back to the best output so far, so the answer arrives on time.
+
+        With `on_event`, progress events go to it while the agents work, and the final answer is
+        streamed to it as {"type": "token", "text": ...} events.
+        """
+        with span("respond"), self.resumable(user_input, request_id), deadline(timeout):
+            if self.uses_fast_path(user_input):
+                if on_event is None:
+                    return await self._answer_directly_async(user_input)
+                report_progress(on_event, "fast_path", "Answering directly")
+                return await self._stream_events_async(self.stream_direct_answer(user_input), on_event)
+            with reserve(FINAL_SYNTHESIS_SHARE):
+                moa_output = await self._map_reduce_async(user_input, on_event)
+            if on_event is None:
+                return await within_deadline(self._synthesize_final_response_async(user_input, moa_output, concise),
+                                             lambda: moa_output, "final synthesis")
+            report_progress(on_event, "final_synthesis", "Writing the final response")
+            return await self._stream_events_async(self.stream_final_response(user_input, moa_output, concise), on_event)
+
+    async def respond_async(self, user_input: str, concise: bool = False, request_id: Optional[str] = None,
+                            timeout: Optional[float] = None) -> Tuple[str, List[Dict[str, str]]]:
+        """Answer within `timeout` seconds, degrading the pipeline to fit; see run_pipeline_async."""
+        return await self.run_pipeline_async(user_input, concise, request_id, timeout), self.moa.conversation_history
+
+    def respond(self, user_input: str, timeout: int = 180, concise: bool = False,
+                request_id: Optional[str] = None) -> Tuple[str, List[Dict[str, str]]]:
+        """
+        Answer within `timeout` seconds. The pipeline degrades to fit the deadline; if it still
+        overruns, it is cut off. A request that fails or is cut off keeps its completed stages, so
+        asking again (or passing the same `request_id`) resumes it; on timeout the furthest-along
+        partial output is returned.
+        """
+        request_id = request_id or self.request_id(user_input)
+        history_length = len(self.moa.conversation_history)
+        try:
+            return asyncio.run(asyncio.wait_for(self.respond_async(user_input, concise, request_id, timeout * SOFT_DEADLINE), timeout))
+        except asyncio.TimeoutError:
+            logger.warning(f"Request {request_id[:8]} hit its {timeout}s deadline; returning partial results")
+            self.rollback_history(history_length)
+            partial = self.partial_response(request_id)
+            return partial or "I apologize, but your request took too long to process. Please try again later.", self.moa.conversation_history
         except Exception as e:
-            logger.error(f"Unexpected error in respond method: {str(e)}")
+            logger.exception(f"Unexpected error in respond method (request {request_id[:8]} can be resumed): {str(e)}")
+            self.rollback_history(history_length)
             return "I apologize, but an unexpected error occurred. Please try again later.", []
 
+    def respond_with_trace(self, user_input: str, timeout: int = 180, concise: bool = False,
+                           request_id: Optional[str] = None) -> Tuple[str, List[Dict[str, str]], Trace]:
+        """Like respond, but also returns a Trace with a span for every API call, search and pipeline stage."""
+        with start_trace() as trace:
+            response, history = self.respond(user_input, timeout, concise, request_id)
+        return response, history, trace
+
+    def stream_final_response(self, user_input: str, moa_output: str, concise: bool = False) -> Iterator[str]:
+        """Stream the final synthesis of the agents' output as text deltas."""
+        system_prompt, user_prompt = self._final_synthesis_prompts(user_input, moa_output, concise)
+        return stream_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.max_tokens,
+                               stage="final_synthesis")
+
+    def respond_stream(self, user_input: str, timeout: int = 180, concise: bool = False,
+                       request_id: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Generator version of respond, with the same deadline and checkpoints. Yields progress
+        events while the agents work, then the final synthesis as {"type": "token", "text": ...}
+        events, and finally a {"type": "done", "response": ...} event (or {"type": "error", ...}
+        on failure; on timeout its message is the furthest-along partial output, if any).
+        """
+        events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        request_id = request_id or self.request_id(user_input)
+        history_length = len(self.moa.conversation_history)
+        outcome: Dict[str, Any] = {}
+
+        def run_pipeline():
+            # The pipeline runs on its own event loop in a worker thread so that this generator
+            # can hand its events to the caller while the agents are still working.
+            try:
+                outcome["response"] = asyncio.run(asyncio.wait_for(
+                    self.run_pipeline_async(user_input, concise, request_id, timeout * SOFT_DEADLINE, events.put), timeout))
+            except Exception as e:
+                outcome["error"] = e
+            finally:
+                events.put(None)
+
+        # Copy the caller's context so an active trace also sees the worker thread's spans.
+        threading.Thread(target=contextvars.copy_context().run, args=(run_pipeline,), daemon=True).start()
+        for event in iter(events.get, None):
+            yield event
+
+        error = outcome.get("error")
+        if error is None:
+            yield {"type": "done", "response": outcome["response"]}
+            return
+        self.rollback_history(history_length)
+        if isinstance(error, asyncio.TimeoutError):
+            logger.warning(f"Request {request_id[:8]} hit its {timeout}s deadline; returning partial results")
+            message = self.partial_response(request_id) or "I apologize, but your request took too long to process. Please try again later."
+        elif isinstance(error, AnthropicAPIError):
+            logger.error(f"Error in synthesizing final response: {str(error)}")
+            message = "I apologize, but I'm unable to provide a response at the moment. Please try again later."
+        else:
+            logger.error(f"Unexpected error in respond_stream method (request {request_id[:8]} can be resumed): {str(error)}")
+            message = "I apologize, but an unexpected error occurred. Please try again later."
+        yield {"type": "error", "message": message}
+
     def get_conversation_history(self) -> List[Dict[str, str]]:
         return self.moa.conversation_history
\ No newline at end of file
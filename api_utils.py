@@ -1,57 +1,504 @@
-import anthropic
+import asyncio
+import contextvars
+import json
 import os
 import logging
-from functools import wraps
+import math
+import sqlite3
+import sys
+import threading
+import weakref
+from contextlib import closing
+from functools import lru_cache, wraps, partial
 import time
-import random
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from ratelimit import limits, sleep_and_retry
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
 from dotenv import load_dotenv
-import tiktoken
-from typing import List
+from typing import Iterator, List, Optional, Tuple, Union
+from deadlines import cap, remaining_time
+import model_routing
+from model_routing import LARGE_MODEL, StageRoute, account, current_stage
+from response_cache import ResponseCache, make_cache_key
+from tracing import add_span, annotate, record, span
 
 load_dotenv()
 logger = logging.getLogger(__name__)
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-CLAUDE_MODEL = "claude-3-5-sonnet-20240620"
+CLAUDE_MODEL = LARGE_MODEL  # Calls outside a routed stage; see model_routing for the per-stage models
+# Mark stable prompt prefixes with cache_control so the API can reuse them across calls.
+PROMPT_CACHING = os.getenv("PROMPT_CACHING", "1") != "0"
+
+# The anthropic SDK takes over a second to import, so it is imported, and the clients created,
+# on first use rather than when this module loads.
+client: Optional["anthropic.Anthropic"] = None
+_client_lock = threading.Lock()
+# AsyncAnthropic holds an httpx connection pool bound to the event loop that created it,
+# so each loop gets its own client.
+_async_clients = weakref.WeakKeyDictionary()
 
 class AnthropicAPIError(Exception):
     pass
 
+def get_client() -> "anthropic.Anthropic":
+    global client
+    if client is None:
+        with _client_lock:
+            if client is None:
+                import anthropic
+                client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+    return client
+
+def get_async_client() -> "anthropic.AsyncAnthropic":
+    loop = asyncio.get_running_loop()
+    async_client = _async_clients.get(loop)
+    if async_client is None:
+        import anthropic
+        async_client = anthropic.AsyncAnthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+        _async_clients[loop] = async_client
+    return async_client
+
+async def run_in_thread(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    # Carry context variables (such as the current trace) into the worker thread.
+    context = contextvars.copy_context()
+    batch = current_batch.get()
+    if batch is None:
+        return await loop.run_in_executor(None, partial(context.run, func, *args, **kwargs))
+    # The batch runner holds its next batch back while a pipeline is busy in a thread.
+    with batch.working():
+        return await loop.run_in_executor(None, partial(context.run, func, *args, **kwargs))
+
+class MemoryRateLimitBackend:
+    """Process-local bucket state shared by every thread and event loop in the process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._blocked_until = 0.0
+
+    def reserve(self, name: str, amount: float, capacity: float, refill_per_second: float) -> float:
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second) - amount
+            self._buckets[name] = (tokens, now)
+        return max(-tokens / refill_per_second, 0.0)
+
+    def block_until(self, timestamp: float):
+        with self._lock:
+            self._blocked_until = max(self._blocked_until, timestamp)
+
+    def blocked_until(self) -> float:
+        with self._lock:
+            return self._blocked_until
+
+class SQLiteRateLimitBackend:
+    """Bucket state in a SQLite file so several processes on one host share a single quota."""
+
+    def __init__(self, path: str):
+        self.path = path
+        # A connection's context manager only ends its transaction, so closing() is what closes it.
+        with closing(self._connect()) as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (name TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+            conn.execute("CREATE TABLE IF NOT EXISTS blocks (id INTEGER PRIMARY KEY CHECK (id = 0), until REAL)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30, isolation_level=None)
+
+    def reserve(self, name: str, amount: float, capacity: float, refill_per_second: float) -> float:
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock up front so the read-modify-write is atomic across processes.
+            conn.execute("BEGIN IMMEDIATE")
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE name = ?", (name,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second) - amount
+            conn.execute("INSERT OR REPLACE INTO buckets (name, tokens, updated) VALUES (?, ?, ?)", (name, tokens, now))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+        return max(-tokens / refill_per_second, 0.0)
+
+    def block_until(self, timestamp: float):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT INTO blocks (id, until) VALUES (0, ?) "
+                         "ON CONFLICT(id) DO UPDATE SET until = MAX(until, excluded.until)", (timestamp,))
+        finally:
+            conn.close()
+
+    def blocked_until(self) -> float:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT until FROM blocks WHERE id = 0").fetchone()
+        finally:
+            conn.close()
+        return row[0] if row else 0.0
+
+class TokenBucket:
+    """
+    Per-minute budget. Reservations always succeed and may drive the balance negative; the
+    returned wait is how long the caller must pause before its reservation is covered, which
+    keeps callers in FIFO order without any rollback when several buckets are involved.
+    """
+
+    def __init__(self, name: str, per_minute: float, backend=None):
+        self.name = name
+        self.capacity = per_minute
+        self.refill_per_second = per_minute / 60
+        self.backend = backend or MemoryRateLimitBackend()
+
+    def reserve(self, amount: float = 1) -> float:
+        return self.backend.reserve(self.name, amount, self.capacity, self.refill_per_second)
+
+class AdaptiveConcurrency:
+    """AIMD limit on in-flight calls: +1 after a full window of successes, halved on a rate limit."""
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        self.limit = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.in_flight = 0
+        self._successes = 0
+        self._condition = threading.Condition()
+        self._async_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+    def try_acquire(self) -> bool:
+        with self._condition:
+            if self.in_flight < self.limit:
+                self.in_flight += 1
+                return True
+            return False
+
+    def acquire(self):
+        with self._condition:
+            self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._condition:
+                if self.in_flight < self.limit:
+                    self.in_flight += 1
+                    return
+                waiter = (loop, loop.create_future())
+                self._async_waiters.append(waiter)
+            try:
+                await waiter[1]
+            finally:
+                with self._condition:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+
+    def _notify(self):
+        # Threads wait on the condition; tasks, possibly on other threads' event loops, on futures. Every
+        # waiting task is woken to retry, so a task that is cancelled after being woken can't strand a free slot.
+        self._condition.notify()
+        for loop, future in self._async_waiters:
+            loop.call_soon_threadsafe(lambda future=future: future.done() or future.set_result(None))
+        self._async_waiters.clear()
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._notify()
+
+    def on_success(self):
+        with self._condition:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._notify()
+
+    def on_rate_limited(self):
+        with self._condition:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+        logger.info(f"Rate limited; concurrency limit reduced to {self.limit}")
+
+class RateLimiter:
+    def __init__(self, requests_per_minute: int = 40, tokens_per_minute: int = 40000, backend=None,
+                 concurrency: Optional[AdaptiveConcurrency] = None):
+        self.backend = backend or MemoryRateLimitBackend()
+        self.requests = TokenBucket("requests", requests_per_minute, self.backend)
+        self.tokens = TokenBucket("tokens", tokens_per_minute, self.backend)
+        self.concurrency = concurrency or AdaptiveConcurrency()
+
+    def is_blocked(self) -> bool:
+        return self.backend.blocked_until() > time.time()
+
+    def _reserve(self, tokens: int) -> float:
+        blocked = max(self.backend.blocked_until() - time.time(), 0.0)
+        return max(blocked, self.requests.reserve(1), self.tokens.reserve(tokens))
+
+    def acquire(self, tokens: int) -> float:
+        """Block until a call estimated at `tokens` input tokens may start. Returns the time spent waiting."""
+        start_time = time.monotonic()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.debug(f"Rate limiter delaying call by {wait:.2f}s")
+            time.sleep(wait)
+        self.concurrency.acquire()
+        return time.monotonic() - start_time
+
+    async def acquire_async(self, tokens: int) -> float:
+        start_time = time.monotonic()
+        wait = self._reserve(tokens)
+        if wait > 0:
+            logger.debug(f"Rate limiter delaying call by {wait:.2f}s")
+            await asyncio.sleep(wait)
+        await self.concurrency.acquire_async()
+        return time.monotonic() - start_time
+
+    def release(self):
+        self.concurrency.release()
+
+    def record_usage(self, output_tokens: int):
+        # Input tokens were reserved up front from an estimate; output tokens are only known afterwards.
+        self.tokens.reserve(output_tokens)
+
+    def on_success(self):
+        self.concurrency.on_success()
+
+    def on_rate_limited(self, retry_after: Optional[float] = None):
+        self.concurrency.on_rate_limited()
+        if retry_after:
+            self.backend.block_until(time.time() + retry_after)
+
+def _create_rate_limiter() -> RateLimiter:
+    shared_path = os.getenv("RATE_LIMIT_DB")
+    return RateLimiter(
+        requests_per_minute=int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", "40")),
+        tokens_per_minute=int(os.getenv("ANTHROPIC_TOKENS_PER_MINUTE", "40000")),
+        backend=SQLiteRateLimitBackend(shared_path) if shared_path else None,
+        concurrency=AdaptiveConcurrency(maximum=int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", "16"))),
+    )
+
+rate_limiter = _create_rate_limiter()
+
+def prompt_text(content: Union[str, list, None]) -> str:
+    """The plain text of a system prompt or message content, whether a string or a list of content blocks."""
+    if isinstance(content, list):
+        return "\n\n".join(block.get("text", "") for block in content)
+    return content or ""
+
+def cache_breakpoint(text: str) -> dict:
+    """A text block that ends a prompt prefix the API may cache and reuse across calls."""
+    block = {"type": "text", "text": text}
+    if PROMPT_CACHING:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+def estimate_request_tokens(system: Union[str, list], messages: list) -> int:
+    # Only used to budget, not to bill, so a character-based estimate is enough.
+    text = prompt_text(system) + "".join(prompt_text(message.get("content")) for message in messages or [])
+    return estimate_claude_tokens(text) + 1
+
+def _retry_after(error: "anthropic.RateLimitError") -> Optional[float]:
+    try:
+        return float(error.response.headers.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+def _call_args(args: tuple, kwargs: dict) -> Tuple[str, list, int]:
+    system = kwargs.get("system", args[0] if args else "")
+    messages = kwargs.get("messages", args[1] if len(args) > 1 else [])
+    max_tokens = kwargs.get("max_tokens", args[2] if len(args) > 2 else 4096)
+    return system, messages, max_tokens
+
+def _request_tokens(args: tuple, kwargs: dict) -> int:
+    system, messages, _ = _call_args(args, kwargs)
+    return estimate_request_tokens(system, messages)
+
+_exponential_wait = wait_exponential(multiplier=1, min=4, max=60)
+
+def _retry_wait(retry_state) -> float:
+    # A retry-after from the server is enforced by rate_limiter on the next attempt, so don't add to it.
+    if rate_limiter.is_blocked():
+        return 0
+    return _exponential_wait(retry_state)
+
+def _stop_at_deadline(retry_state) -> bool:
+    # Don't start a backoff that would outlast the request's deadline.
+    remaining = remaining_time()
+    return remaining is not None and remaining <= _retry_wait(retry_state)
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, AnthropicAPIError):
+        return True
+    # A RateLimitError can only exist once anthropic has been imported.
+    anthropic = sys.modules.get("anthropic")
+    return anthropic is not None and isinstance(error, anthropic.RateLimitError)
+
+def _before_retry_sleep(retry_state):
+    logger.info(f"Retrying API call, attempt {retry_state.attempt_number}")
+    record(retries=1)
+
+_api_retry = retry(
+    stop=stop_after_attempt(5) | _stop_at_deadline,
+    wait=_retry_wait,
+    retry=retry_if_exception(_is_retryable),
+    before_sleep=_before_retry_sleep,
+    reraise=True
+)
+
 def rate_limited_api_call(func):
     @wraps(func)
-    @sleep_and_retry
-    @limits(calls=40, period=60)
-    @retry(
-        stop=stop_after_attempt(5),
-        wait=wait_exponential(multiplier=1, min=4, max=60),
-        retry=retry_if_exception_type(exception_types=(AnthropicAPIError, anthropic.RateLimitError)),
-        before_sleep=lambda retry_state: logger.info(f"Retrying API call, attempt {retry_state.attempt_number}")
-    )
+    @_api_retry
     def wrapper(*args, **kwargs):
+        import anthropic
+        record(wait_time=rate_limiter.acquire(_request_tokens(args, kwargs)))
         try:
-            time.sleep(random.uniform(0.5, 1.5))
-            return func(*args, **kwargs)
+            result = func(*args, **kwargs)
+            rate_limiter.on_success()
+            return result
         except anthropic.RateLimitError as e:
             logger.warning(f"Rate limit reached: {str(e)}. Retrying after backoff.")
+            rate_limiter.on_rate_limited(_retry_after(e))
             raise AnthropicAPIError(f"Rate limit reached: {str(e)}")
         except anthropic.APIError as e:
             logger.error(f"Anthropic API error: {str(e)}")
             raise AnthropicAPIError(f"API call failed: {str(e)}")
+        finally:
+            rate_limiter.release()
     return wrapper
 
+def async_rate_limited_api_call(func):
+    @wraps(func)
+    @_api_retry
+    async def wrapper(*args, **kwargs):
+        if current_batch.get() is not None:
+            # The batch runner sends the call later, under the Message Batches API's own limits.
+            return await func(*args, **kwargs)
+        import anthropic
+        record(wait_time=await rate_limiter.acquire_async(_request_tokens(args, kwargs)))
+        try:
+            result = await func(*args, **kwargs)
+            rate_limiter.on_success()
+            return result
+        except anthropic.RateLimitError as e:
+            logger.warning(f"Rate limit reached: {str(e)}. Retrying after backoff.")
+            rate_limiter.on_rate_limited(_retry_after(e))
+            raise AnthropicAPIError(f"Rate limit reached: {str(e)}")
+        except anthropic.APIError as e:
+            logger.error(f"Anthropic API error: {str(e)}")
+            raise AnthropicAPIError(f"API call failed: {str(e)}")
+        finally:
+            rate_limiter.release()
+    return wrapper
+
+def _request_params(system: Union[str, list], messages: list, max_tokens: int,
+                    tools: Optional[list] = None, tool_choice: Optional[dict] = None, route: Optional[StageRoute] = None) -> dict:
+    # System prompts are the same on every call of a kind, so they always end a cacheable prefix.
+    if isinstance(system, str) and system and PROMPT_CACHING:
+        system = [cache_breakpoint(system)]
+    # The model, temperature and (if set) max_tokens come from the route of the stage making the call.
+    route = route or current_stage()[1]
+    params = dict(
+        model=route.model,
+        max_tokens=min(route.max_tokens or max_tokens, 4096),
+        temperature=route.temperature,
+        system=system,
+        messages=messages,
+        timeout=max(cap(30), 1)  # Seconds; never past the request's deadline
+    )
+    if tools:
+        params.update(tools=tools, tool_choice=tool_choice or {"type": "auto"})
+    return params
+
+# Set by batch_runner while it drives a set of pipelines: async API calls are queued for its next
+# Message Batch instead of being sent one by one.
+current_batch: contextvars.ContextVar = contextvars.ContextVar("current_batch", default=None)
+
+def response_text(response) -> str:
+    """The text of a Message, for callers that create Messages themselves (e.g. the batch runner)."""
+    # A forced tool call comes back as a tool_use block; its input is returned as JSON text.
+    for block in response.content:
+        if getattr(block, "type", None) == "tool_use":
+            return json.dumps(block.input)
+    return response.content[0].text.strip()
+
+def _create_response_cache() -> Optional[ResponseCache]:
+    if os.getenv("RESPONSE_CACHE", "1") == "0":
+        return None
+    return ResponseCache(
+        path=os.getenv("RESPONSE_CACHE_DB"),
+        ttl=float(os.getenv("RESPONSE_CACHE_TTL", "86400")),
+        max_memory_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "256")),
+    )
+
+response_cache = _create_response_cache()
+
+def _cache_key(args: tuple, kwargs: dict) -> str:
+    params = _request_params(*_call_args(args, kwargs), tools=kwargs.get("tools"), tool_choice=kwargs.get("tool_choice"),
+                             route=kwargs.get("route"))
+    params.pop("timeout")
+    return make_cache_key(**params)
+
+def cached_api_call(func):
+    # Sits outside the rate limiter so that cache hits don't use any quota.
+    @wraps(func)
+    def wrapper(*args, use_cache: bool = True, **kwargs):
+        with span("api_call"):
+            if not use_cache or response_cache is None:
+                return func(*args, **kwargs)
+            key = _cache_key(args, kwargs)
+            cached = response_cache.get(key)
+            if cached is not None:
+                logger.debug(f"Response cache hit for {key[:12]}")
+                annotate(cached=True)
+                return cached
+            response = func(*args, **kwargs)
+            response_cache.set(key, response)
+            return response
+    return wrapper
+
+def async_cached_api_call(func):
+    @wraps(func)
+    async def wrapper(*args, use_cache: bool = True, **kwargs):
+        with span("api_call"):
+            if not use_cache or response_cache is None:
+                return await func(*args, **kwargs)
+            key = _cache_key(args, kwargs)
+            cached = response_cache.get(key)
+            if cached is not None:
+                logger.debug(f"Response cache hit for {key[:12]}")
+                annotate(cached=True)
+                return cached
+            response = await func(*args, **kwargs)
+            response_cache.set(key, response)
+            return response
+    return wrapper
+
+def _record_usage(usage) -> dict:
+    """Record a response's token usage, including prompt cache reads and writes, on the current span."""
+    rate_limiter.record_usage(usage.output_tokens)
+    tokens = dict(input_tokens=usage.input_tokens, output_tokens=usage.output_tokens,
+                  cache_read_tokens=getattr(usage, "cache_read_input_tokens", None) or 0,
+                  cache_write_tokens=getattr(usage, "cache_creation_input_tokens", None) or 0)
+    if tokens["cache_read_tokens"] or tokens["cache_write_tokens"]:
+        logger.debug(f"Prompt cache: read {tokens['cache_read_tokens']} tokens, wrote {tokens['cache_write_tokens']} tokens")
+    record(**tokens)
+    return tokens
+
+@cached_api_call
 @rate_limited_api_call
-def make_api_call(system: str, messages: list, max_tokens: int = 4096):
+def make_api_call(system: Union[str, list], messages: list, max_tokens: int = 4096,
+                  tools: Optional[list] = None, tool_choice: Optional[dict] = None):
+    """
+    `system` and each message's content may be a string or a list of content blocks; use
+    cache_breakpoint() to mark the end of a prefix that other calls share. When `tools` are
+    given and the model calls one, the tool input is returned as a JSON string.
+    """
+    import anthropic
     try:
-        response = client.messages.create(
-            model=CLAUDE_MODEL,
-            max_tokens=min(max_tokens, 4096),
-            temperature=0.7,
-            system=system,
-            messages=messages,
-            timeout=30
-        )
-        return response.content[0].text.strip()
+        start_time = time.perf_counter()
+        response = get_client().messages.create(**_request_params(system, messages, max_tokens, tools, tool_choice))
+        account(_record_usage(response.usage), time.perf_counter() - start_time)
+        return response_text(response)
+    except anthropic.RateLimitError:
+        raise
     except anthropic.APITimeoutError:
         logger.error("API call timed out")
         raise AnthropicAPIError("API call timed out")
@@ -59,26 +506,127 @@ def make_api_call(system: str, messages: list, max_tokens: int = 4096):
         logger.error(f"Unexpected error in make_api_call: {str(e)}")
         raise AnthropicAPIError(f"Unexpected error: {str(e)}")
 
-def count_tokens(text: str) -> int:
-    encoder = tiktoken.encoding_for_model("gpt-3.5-turbo")
-    return len(encoder.encode(text))
+@async_cached_api_call
+@async_rate_limited_api_call
+async def make_api_call_async(system: Union[str, list], messages: list, max_tokens: int = 4096,
+                              tools: Optional[list] = None, tool_choice: Optional[dict] = None):
+    import anthropic
+    try:
+        start_time = time.perf_counter()
+        params = _request_params(system, messages, max_tokens, tools, tool_choice)
+        batch = current_batch.get()
+        response = await (batch.submit(params) if batch is not None else get_async_client().messages.create(**params))
+        account(_record_usage(response.usage), time.perf_counter() - start_time)
+        return response_text(response)
+    except (anthropic.RateLimitError, AnthropicAPIError):
+        raise
+    except anthropic.APITimeoutError:
+        logger.error("API call timed out")
+        raise AnthropicAPIError("API call timed out")
+    except Exception as e:
+        logger.error(f"Unexpected error in make_api_call_async: {str(e)}")
+        raise AnthropicAPIError(f"Unexpected error: {str(e)}")
+
+STREAM_ATTEMPTS = 5
+
+def stream_api_call(system: Union[str, list], messages: list, max_tokens: int = 4096, use_cache: bool = True,
+                    stage: Optional[str] = None) -> Iterator[str]:
+    """
+    Like make_api_call, but yields the response text as it arrives. A failed attempt is only
+    retried while nothing has been yielded yet; after that the error propagates. The generator
+    may run in another context than its caller's, so the routing `stage` is passed explicitly.
+    """
+    import anthropic
+    start_time = time.perf_counter()
+    stage, route = (stage, model_routing.model_router.route(stage)) if stage else current_stage()
+    key = _cache_key((), dict(system=system, messages=messages, max_tokens=max_tokens, route=route))
+    if use_cache and response_cache is not None:
+        cached = response_cache.get(key)
+        if cached is not None:
+            add_span("api_call", start_time, cached=True, streamed=True)
+            yield cached
+            return
+
+    pieces = []
+    usage = {"wait_time": 0.0, "retries": 0}
+    for attempt in range(1, STREAM_ATTEMPTS + 1):
+        usage["wait_time"] += rate_limiter.acquire(estimate_request_tokens(system, messages))
+        try:
+            with get_client().messages.stream(**_request_params(system, messages, max_tokens, route=route)) as stream:
+                for text in stream.text_stream:
+                    if not pieces:
+                        usage["time_to_first_token"] = time.perf_counter() - start_time
+                    pieces.append(text)
+                    yield text
+                final_usage = stream.get_final_message().usage
+                rate_limiter.record_usage(final_usage.output_tokens)
+                usage.update(input_tokens=final_usage.input_tokens, output_tokens=final_usage.output_tokens,
+                             cache_read_tokens=getattr(final_usage, "cache_read_input_tokens", None) or 0,
+                             cache_write_tokens=getattr(final_usage, "cache_creation_input_tokens", None) or 0)
+            rate_limiter.on_success()
+            cost = model_routing.model_router.account(stage, route.model, usage, time.perf_counter() - start_time)
+            add_span("api_call", start_time, streamed=True, stage=stage, model=route.model, cost=cost, **usage)
+            break
+        except anthropic.APIError as e:
+            if isinstance(e, anthropic.RateLimitError):
+                rate_limiter.on_rate_limited(_retry_after(e))
+            logger.error(f"Anthropic API error while streaming: {str(e)}")
+            backoff = 0 if rate_limiter.is_blocked() else min(4 * 2 ** (attempt - 1), 60)
+            remaining = remaining_time()
+            if pieces or attempt == STREAM_ATTEMPTS or (remaining is not None and remaining <= backoff):
+                raise AnthropicAPIError(f"API call failed: {str(e)}")
+        finally:
+            rate_limiter.release()
+        logger.info(f"Retrying streamed API call, attempt {attempt}")
+        usage["retries"] += 1
+        time.sleep(backoff)
+
+    if use_cache and response_cache is not None:
+        response_cache.set(key, "".join(pieces).strip())
+
+# Claude's tokenizer isn't published; about 3.5 characters per token matches it closely for English prose.
+CLAUDE_CHARS_PER_TOKEN = 3.5
+TOKEN_COUNTER = os.getenv("TOKEN_COUNTER", "tiktoken")
+
+@lru_cache(maxsize=None)
+def get_encoder() -> "tiktoken.Encoding":
+    import tiktoken
+    return tiktoken.encoding_for_model("gpt-3.5-turbo")
+
+def estimate_claude_tokens(text: str) -> int:
+    return math.ceil(len(text) / CLAUDE_CHARS_PER_TOKEN)
+
+def count_tokens(text: str, counter: Optional[str] = None) -> int:
+    return count_tokens_batch([text], counter)[0]
+
+def count_tokens_batch(texts: List[str], counter: Optional[str] = None) -> List[int]:
+    counter = counter or TOKEN_COUNTER
+    if counter == "claude":
+        return [estimate_claude_tokens(text) for text in texts]
+    if counter != "tiktoken":
+        raise ValueError(f"Unknown token counter '{counter}'. Expected 'tiktoken' or 'claude'")
+    return [len(tokens) for tokens in get_encoder().encode_ordinary_batch(texts)]
+
+def _split_sentences(text: str) -> List[str]:
+    # Each piece keeps its ". " separator, so joining the pieces gives back the original text.
+    pieces = text.split(". ")
+    return [piece + ". " for piece in pieces[:-1]] + [pieces[-1]]
 
-def chunk_text(text: str, max_tokens: int = 4000) -> List[str]:
+def chunk_text(text: str, max_tokens: int = 4000, counter: Optional[str] = None) -> List[str]:
+    sentences = _split_sentences(text)
     chunks = []
-    current_chunk = ""
+    current_chunk = []
     current_tokens = 0
 
-    for sentence in text.split(". "):
-        sentence_tokens = count_tokens(sentence)
-        if current_tokens + sentence_tokens > max_tokens:
-            chunks.append(current_chunk)
-            current_chunk = sentence
-            current_tokens = sentence_tokens
-        else:
-            current_chunk += sentence + ". "
-            current_tokens += sentence_tokens
+    for sentence, sentence_tokens in zip(sentences, count_tokens_batch(sentences, counter)):
+        if current_chunk and current_tokens + sentence_tokens > max_tokens:
+            chunks.append("".join(current_chunk))
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(sentence)
+        current_tokens += sentence_tokens
 
     if current_chunk:
-        chunks.append(current_chunk)
+        chunks.append("".join(current_chunk))
 
     return chunks
\ No newline at end of file
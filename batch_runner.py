@@ -0,0 +1,292 @@
+"""Answer a file of questions through the full pipeline, sending the API calls as Message Batches.
+
+Every question's pipeline runs at once, and their API calls are held back until all of them are
+waiting on a call, with none of them still busy in a thread such as a web search. Then the calls go out together as one batch. The questions therefore move forward stage by
+stage: the depth-1 Tree of Thought expansions of every agent of every question form one batch, the
+next depth another, then the agent responses, the layer syntheses and the final syntheses.
+Batches cost half as much as individual calls. The trade-off is latency, which offline workloads
+don't care about.
+
+    python batch_runner.py questions.txt --output answers.jsonl --checkpoint batch_checkpoint.jsonl
+    python batch_runner.py questions.txt --fake  # Offline, against the local fake batch endpoint
+
+The questions file has one question per line, or one {"id": ..., "question": ...} object per line.
+Every finished batch is appended to the checkpoint file. Rerunning with the same checkpoint
+replays the calls it already holds, so an interrupted run resumes after its last completed stage.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import logging
+import os
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import api_utils
+from ai_assistant import AIAssistant
+from api_utils import AnthropicAPIError, current_batch, response_text
+from response_cache import make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# Index of the pipeline (one per coroutine given to MessageBatcher.run) that the current task belongs to.
+_current_pipeline: contextvars.ContextVar = contextvars.ContextVar("current_pipeline", default=None)
+
+class BatchCheckpoint:
+    """Append-only JSON lines log of batch results, keyed by request like the response cache."""
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.results: Dict[str, str] = {}
+        if path and os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.results[entry["key"]] = entry["text"]
+            logger.info(f"Loaded {len(self.results)} checkpointed results from {path}")
+
+    def get(self, key: str) -> Optional[str]:
+        return self.results.get(key)
+
+    def add_stage(self, stage: int, results: Dict[str, str]):
+        self.results.update(results)
+        if not self.path:
+            return
+        with open(self.path, "a", encoding="utf-8") as f:
+            for key, text in results.items():
+                f.write(json.dumps({"stage": stage, "key": key, "text": text}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+def _replayed_response(text: str):
+    # Stands in for a Message: the text was already paid for, so no usage is recorded again.
+    usage = SimpleNamespace(input_tokens=0, output_tokens=0, cache_read_input_tokens=0, cache_creation_input_tokens=0)
+    return SimpleNamespace(content=[SimpleNamespace(type="text", text=text)], usage=usage)
+
+class MessageBatcher:
+    """
+    Collects the API calls made while it is current_batch and sends them as one Message Batch
+    once every running pipeline has a call waiting and none is busy in a thread (run_in_thread),
+    and nothing has changed for `settle` seconds. If the pipelines stop making progress without
+    reaching that point, and none is in a thread, the calls are sent after `max_wait` seconds anyway. Identical requests
+    in a stage are sent once.
+    """
+
+    def __init__(self, checkpoint: Optional[BatchCheckpoint] = None, poll_interval: float = 10.0, settle: float = 0.05,
+                 max_wait: float = 30.0, max_batch_size: int = 10000):
+        self.checkpoint = checkpoint or BatchCheckpoint()
+        self.poll_interval = poll_interval  # Seconds between batch status checks
+        self.settle = settle
+        self.max_wait = max_wait
+        self.max_batch_size = max_batch_size  # The API accepts up to 100,000 requests per batch
+        self._pending: Dict[str, Tuple[dict, List[asyncio.Future]]] = {}
+        self._waiting: Dict[Optional[int], int] = {}  # Calls blocked in submit(), per pipeline
+        self._working = 0  # run_in_thread calls in flight
+        self._changes = 0
+        self.stages = 0
+        self.stats = {"batches": 0, "requests": 0, "deduplicated": 0, "replayed": 0, "errored": 0}
+
+    def pending(self) -> int:
+        return sum(len(futures) for _, futures in self._pending.values())
+
+    @contextmanager
+    def working(self) -> Iterator[None]:
+        """Mark a pipeline as busy outside the event loop, so the next batch waits for it."""
+        self._working += 1
+        self._changes += 1
+        try:
+            yield
+        finally:
+            self._working -= 1
+            self._changes += 1
+
+    def _all_waiting(self, pipelines: List[int]) -> bool:
+        return self._working == 0 and all(self._waiting.get(pipeline, 0) > 0 for pipeline in pipelines)
+
+    async def _run_pipeline(self, index: int, coroutine):
+        _current_pipeline.set(index)  # The task's own context, inherited by the tasks it starts
+        return await coroutine
+
+    async def submit(self, params: dict):
+        params = {key: value for key, value in params.items() if key != "timeout"}
+        key = make_cache_key(**params)
+        replayed = self.checkpoint.get(key)
+        if replayed is not None:
+            self.stats["replayed"] += 1
+            return _replayed_response(replayed)
+        future = asyncio.get_running_loop().create_future()
+        if key in self._pending:
+            self.stats["deduplicated"] += 1
+            self._pending[key][1].append(future)
+        else:
+            self._pending[key] = (params, [future])
+        pipeline = _current_pipeline.get()
+        self._waiting[pipeline] = self._waiting.get(pipeline, 0) + 1
+        self._changes += 1
+        try:
+            return await future
+        finally:
+            self._waiting[pipeline] -= 1
+
+    async def run(self, coroutines: List) -> List[Any]:
+        """Run the coroutines to completion, flushing their API calls stage by stage."""
+        token = current_batch.set(self)
+        try:
+            tasks = [asyncio.ensure_future(self._run_pipeline(i, coroutine)) for i, coroutine in enumerate(coroutines)]
+        finally:
+            current_batch.reset(token)
+        try:
+            last_change = time.monotonic()
+            while True:
+                running = [i for i, task in enumerate(tasks) if not task.done()]
+                if not running:
+                    break
+                before = self._changes
+                await asyncio.wait([tasks[i] for i in running], timeout=self.settle)
+                if self._changes != before:
+                    last_change = time.monotonic()
+                    continue
+                running = [i for i, task in enumerate(tasks) if not task.done()]
+                if not self._pending:
+                    continue
+                if self._all_waiting(running):
+                    await self.flush()
+                elif self._working == 0 and time.monotonic() - last_change > self.max_wait:
+                    logger.warning(f"Pipelines made no progress for {self.max_wait:.0f}s; sending {self.pending()} waiting calls")
+                    await self.flush()
+                else:
+                    continue
+                last_change = time.monotonic()
+        except asyncio.CancelledError:
+            for task in tasks:
+                task.cancel()
+            raise
+        return [task.result() for task in tasks]
+
+    async def flush(self):
+        pending, self._pending = self._pending, {}
+        items = list(pending.items())
+        for start in range(0, len(items), self.max_batch_size):
+            await self._send_stage(items[start:start + self.max_batch_size])
+
+    async def _send_stage(self, items: List[Tuple[str, Tuple[dict, List[asyncio.Future]]]]):
+        self.stages += 1
+        stage, start_time = self.stages, time.perf_counter()
+        ids = {f"s{stage}-{i}": key for i, (key, _) in enumerate(items)}
+        futures = {key: futures for key, (_, futures) in items}
+        outcomes: Dict[str, Any] = {}
+        import anthropic
+        try:
+            client = api_utils.get_async_client()
+            batch = await client.messages.batches.create(
+                requests=[{"custom_id": custom_id, "params": params} for custom_id, (_, (params, _)) in zip(ids, items)])
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(items)
+            logger.info(f"Stage {stage}: sent batch {batch.id} with {len(items)} requests")
+            while batch.processing_status != "ended":
+                await asyncio.sleep(self.poll_interval)
+                batch = await client.messages.batches.retrieve(batch.id)
+            async for entry in await client.messages.batches.results(batch.id):
+                if entry.result.type == "succeeded":
+                    outcomes[ids[entry.custom_id]] = entry.result.message
+                else:
+                    self.stats["errored"] += 1
+                    outcomes[ids[entry.custom_id]] = AnthropicAPIError(f"Batch request {entry.result.type}")
+        except anthropic.APIError as e:
+            logger.error(f"Message batch for stage {stage} failed: {str(e)}")
+            error = AnthropicAPIError(f"Message batch failed: {str(e)}")
+            outcomes = {key: error for key in futures}
+
+        self.checkpoint.add_stage(stage, {key: response_text(outcome) for key, outcome in outcomes.items()
+                                          if not isinstance(outcome, Exception)})
+        logger.info(f"Stage {stage}: {len(outcomes)} results in {time.perf_counter() - start_time:.1f}s")
+        for key, waiting in futures.items():
+            # Errored requests raise in their pipeline, where the usual retry sends them with the next stage.
+            outcome = outcomes.get(key, AnthropicAPIError("Batch request missing from results"))
+            for future in waiting:
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+def load_questions(path: str) -> List[Dict[str, str]]:
+    questions = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            entry = json.loads(line) if line.startswith("{") else {"question": line}
+            entry.setdefault("id", str(len(questions) + 1))
+            questions.append(entry)
+    return questions
+
+class BatchRunner:
+    """Answers many independent questions with one AIAssistant each, batching their API calls stage by stage."""
+
+    def __init__(self, assistant_factory: Callable[[], AIAssistant] = AIAssistant, checkpoint_path: Optional[str] = None,
+                 poll_interval: float = 10.0, concise: bool = False):
+        self.assistant_factory = assistant_factory
+        self.batcher = MessageBatcher(BatchCheckpoint(checkpoint_path), poll_interval)
+        self.concise = concise
+
+    async def _answer(self, entry: Dict[str, str], output) -> Dict[str, Any]:
+        result = {"id": entry["id"], "question": entry["question"]}
+        try:
+            result["answer"], _ = await self.assistant_factory().respond_async(entry["question"], self.concise)
+        except Exception as e:
+            logger.exception(f"Question {entry['id']} failed: {str(e)}")
+            result["error"] = str(e)
+        if output is not None:
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+        return result
+
+    async def run_async(self, questions: List[Dict[str, str]], output_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        output = open(output_path, "w", encoding="utf-8") if output_path else None
+        try:
+            return await self.batcher.run([self._answer(entry, output) for entry in questions])
+        finally:
+            if output is not None:
+                output.close()
+
+    def run(self, questions: List[Dict[str, str]], output_path: Optional[str] = None) -> List[Dict[str, Any]]:
+        return asyncio.run(self.run_async(questions, output_path))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("questions", help="Questions file: one question, or one JSON object, per line")
+    parser.add_argument("--output", default="answers.jsonl", help="Where to write one JSON answer per line")
+    parser.add_argument("--checkpoint", default="batch_checkpoint.jsonl", help="Batch results log used to resume a run")
+    parser.add_argument("--layers", type=int, default=2)
+    parser.add_argument("--agents", type=int, default=2)
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--concise", action="store_true")
+    parser.add_argument("--poll-interval", type=float, default=10.0, help="Seconds between batch status checks")
+    parser.add_argument("--fake", action="store_true", help="Use the local fake Anthropic and Tavily backends")
+    args = parser.parse_args()
+
+    def new_assistant() -> AIAssistant:
+        return AIAssistant(num_layers=args.layers, agents_per_layer=args.agents, tot_depth=args.depth, tot_branching=args.branching)
+
+    questions = load_questions(args.questions)
+    runner = BatchRunner(new_assistant, args.checkpoint, args.poll_interval, args.concise)
+    start_time = time.perf_counter()
+    if args.fake:
+        from fake_backends import install_fake_backends
+        with install_fake_backends():
+            results = runner.run(questions, args.output)
+    else:
+        results = runner.run(questions, args.output)
+    failed = sum("error" in result for result in results)
+    print(f"{len(results)} questions ({failed} failed) in {time.perf_counter() - start_time:.1f}s, "
+          f"{runner.batcher.stages} stages: {json.dumps(runner.batcher.stats)}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
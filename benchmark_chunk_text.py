@@ -0,0 +1,75 @@
+"""Time chunk_text on multi-megabyte inputs against the previous per-sentence implementation.
+
+The tiktoken counter needs the cl100k_base encoding (downloaded on first use); pass
+--counter claude to benchmark the character-based estimate instead.
+
+    python benchmark_chunk_text.py --megabytes 1 2 4
+"""
+import argparse
+import random
+import time
+import tiktoken
+from api_utils import chunk_text, count_tokens
+
+WORDS = ("the quick brown fox jumps over lazy dog energy efficient wiring circuit breaker "
+         "socket consumer unit cable lighting kitchen bedroom labour materials cost").split()
+
+def make_text(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    sentences = []
+    size = 0
+    while size < megabytes * 1024 * 1024:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(5, 30))).capitalize()
+        sentences.append(sentence)
+        size += len(sentence) + 2
+    return ". ".join(sentences)
+
+def legacy_chunk_text(text: str, max_tokens: int = 4000):
+    # The implementation chunk_text replaced: a fresh encoder lookup per sentence and string +=.
+    def legacy_count_tokens(sentence):
+        return len(tiktoken.encoding_for_model("gpt-3.5-turbo").encode(sentence))
+
+    chunks = []
+    current_chunk = ""
+    current_tokens = 0
+    for sentence in text.split(". "):
+        sentence_tokens = legacy_count_tokens(sentence)
+        if current_tokens + sentence_tokens > max_tokens:
+            chunks.append(current_chunk)
+            current_chunk = sentence
+            current_tokens = sentence_tokens
+        else:
+            current_chunk += sentence + ". "
+            current_tokens += sentence_tokens
+    if current_chunk:
+        chunks.append(current_chunk)
+    return chunks
+
+def timed(func, *args, **kwargs):
+    start_time = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start_time, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--megabytes", type=float, nargs="+", default=[1.0, 4.0])
+    parser.add_argument("--max-tokens", type=int, default=4096)
+    parser.add_argument("--counter", choices=["tiktoken", "claude"], default="tiktoken")
+    parser.add_argument("--skip-legacy", action="store_true", help="Only time the current implementation")
+    args = parser.parse_args()
+
+    if args.counter == "tiktoken":
+        count_tokens("warm up the cached encoder")
+
+    print(f"{'size':>8}{'chunks':>8}{'chunk_text':>12}{'legacy':>10}{'speedup':>9}")
+    for megabytes in args.megabytes:
+        text = make_text(megabytes)
+        elapsed, chunks = timed(chunk_text, text, args.max_tokens, args.counter)
+        if args.skip_legacy or args.counter != "tiktoken":
+            print(f"{megabytes:>6.1f}MB{len(chunks):>8}{elapsed:>11.3f}s{'-':>10}{'-':>9}")
+            continue
+        legacy_elapsed, _ = timed(legacy_chunk_text, text, args.max_tokens)
+        print(f"{megabytes:>6.1f}MB{len(chunks):>8}{elapsed:>11.3f}s{legacy_elapsed:>9.3f}s{legacy_elapsed / elapsed:>8.1f}x")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""Time cold imports of the app's modules, each in a fresh interpreter, and list the heavy SDKs they load.
+
+The API SDKs are imported on first use, so importing a module should load none of them; the
+"first client" column is what the first request pays instead, when it creates the Anthropic client.
+
+    python benchmark_cold_start.py --runs 5
+    python benchmark_cold_start.py --max-seconds 0.5 --forbid anthropic tavily tiktoken requests  # Exit 1 on a regression
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ["anthropic", "tavily", "tiktoken", "requests", "httpx", "pydantic"]
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter() - start
+loaded = [name for name in {heavy!r} if name in sys.modules]
+import api_utils
+start = time.perf_counter()
+api_utils.get_client()
+print(json.dumps({{"import": imported, "first_client": time.perf_counter() - start, "loaded": loaded}}))
+"""
+
+def measure(module: str) -> dict:
+    result = subprocess.run([sys.executable, "-c", CHILD.format(module=module, heavy=HEAVY_MODULES)],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        return {"error": result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--modules", nargs="+", default=["api_utils", "agent", "ai_assistant", "job_queue", "main"])
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per module; the median is reported")
+    parser.add_argument("--max-seconds", type=float, help="Fail if a module's median import time is above this")
+    parser.add_argument("--forbid", nargs="*", default=[], help="Fail if importing a module loads any of these")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':<14}{'import':>9}{'first client':>14}  loaded")
+    for module in args.modules:
+        runs = [measure(module) for _ in range(args.runs)]
+        errors = [run["error"] for run in runs if "error" in run]
+        if errors:
+            print(f"{module:<14}{'-':>9}{'-':>14}  skipped: {errors[0]}")
+            continue
+        imported = statistics.median(run["import"] for run in runs)
+        first_client = statistics.median(run["first_client"] for run in runs)
+        loaded = sorted(set().union(*(run["loaded"] for run in runs)))
+        print(f"{module:<14}{imported:>8.3f}s{first_client:>13.3f}s  {', '.join(loaded) or '-'}")
+        if args.max_seconds is not None and imported > args.max_seconds:
+            print(f"  {module} took {imported:.3f}s to import, over the {args.max_seconds}s limit")
+            failed = True
+        forbidden = sorted(set(loaded) & set(args.forbid))
+        if forbidden:
+            print(f"  {module} loads {', '.join(forbidden)} at import time")
+            failed = True
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
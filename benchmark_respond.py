@@ -0,0 +1,137 @@
+"""Benchmark AIAssistant.respond end to end against fake Anthropic and Tavily backends.
+
+Runs offline: the clients are swapped for the fakes in fake_backends.py, which sleep for a
+sampled latency and can inject server errors and 429s. Every combination of the given
+layer/agent/depth/branching values is run, and p50/p95 latency, API calls per request and
+throughput are reported, along with the estimated dollar cost per request (--stages breaks the
+calls, latency and cost down by pipeline stage, to see what model routing saves). Save a baseline on main and compare a branch against it:
+
+    python benchmark_respond.py --layers 1 2 --agents 2 3 --save-baseline baseline.json
+    python benchmark_respond.py --layers 1 2 --agents 2 3 --baseline baseline.json
+"""
+import argparse
+import itertools
+import json
+import logging
+import model_routing
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from ai_assistant import AIAssistant
+from fake_backends import FakeAnthropic, FakeTavilyClient, LatencyModel, install_fake_backends
+from thought_store import ThoughtStore
+
+PROMPTS = [
+    "What is the capital of France?",
+    "Explain the concept of artificial intelligence in simple terms.",
+    "Compare heat pumps and gas boilers for a small flat.",
+    "Suggest a schema for storing chess games in a relational database.",
+]
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+def run_config(args, layers: int, agents: int, depth: int, branching: int) -> dict:
+    fake_anthropic = FakeAnthropic(LatencyModel.parse(args.latency, args.seed), args.error_rate, args.rate_limit_rate,
+                                   seed=args.seed)
+    fake_tavily = FakeTavilyClient(LatencyModel.parse(args.search_latency, args.seed), seed=args.seed)
+    model_routing.model_router.reset()
+    with install_fake_backends(fake_anthropic, fake_tavily):
+        def one_request(i: int) -> float:
+            assistant = AIAssistant(num_layers=layers, agents_per_layer=agents, tot_depth=depth, tot_branching=branching,
+                                    fast_path=args.fast_path, early_exit_threshold=args.early_exit,
+                                    tot_options={"convergence_threshold": args.tot_convergence, "structured": args.structured_thoughts},
+                                    thought_store=ThoughtStore(diversity=args.thought_diversity) if args.memoize_thoughts else None)
+            start = time.perf_counter()
+            assistant.respond(PROMPTS[i % len(PROMPTS)])
+            return time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = list(executor.map(one_request, range(args.requests)))
+        elapsed = time.perf_counter() - start
+    stages = model_routing.model_router.stats()
+    return {
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "calls_per_request": fake_anthropic.calls / args.requests,
+        "searches_per_request": fake_tavily.calls / args.requests,
+        "throughput": args.requests / elapsed,
+        "input_tokens_per_request": (fake_anthropic.input_tokens + fake_anthropic.cache_write_tokens) / args.requests,
+        "cached_input_fraction": fake_anthropic.cache_read_tokens / max(
+            fake_anthropic.input_tokens + fake_anthropic.cache_read_tokens + fake_anthropic.cache_write_tokens, 1),
+        "cost_per_request": sum(entry["cost"] for entry in stages.values()) / args.requests,
+        "stages": stages,
+    }
+
+def print_stages(result: dict, requests: int):
+    for stage, entry in sorted(result["stages"].items(), key=lambda item: -item[1]["cost"]):
+        print(f"  {stage:<20}{entry['calls'] / requests:>11.1f}{entry['latency'] / max(entry['calls'], 1):>10.2f}s"
+              f"{entry['escalations']:>13}{entry['cost'] / requests:>12.4f}")
+
+def regressions(name: str, result: dict, baseline: dict, tolerance: float) -> list:
+    found = []
+    if result["p95"] > baseline["p95"] * (1 + tolerance):
+        found.append(f"{name}: p95 {result['p95']:.2f}s vs baseline {baseline['p95']:.2f}s")
+    if result["calls_per_request"] > baseline["calls_per_request"] * (1 + tolerance):
+        found.append(f"{name}: {result['calls_per_request']:.1f} calls/request vs baseline {baseline['calls_per_request']:.1f}")
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--layers", type=int, nargs="+", default=[2])
+    parser.add_argument("--agents", type=int, nargs="+", default=[2])
+    parser.add_argument("--depth", type=int, nargs="+", default=[2])
+    parser.add_argument("--branching", type=int, nargs="+", default=[2])
+    parser.add_argument("--requests", type=int, default=8, help="Requests per configuration")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight at once")
+    parser.add_argument("--latency", default="lognormal:0.05,0.5", help="Anthropic latency, e.g. fixed:0.1 or uniform:0.05,0.2")
+    parser.add_argument("--search-latency", default="fixed:0.02")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of API calls failing with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fraction of API calls failing with a 429")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fast-path", action="store_true", help="Answer trivial prompts with a single call")
+    parser.add_argument("--early-exit", type=float, help="Agent agreement (0-1) at which to skip the remaining layers")
+    parser.add_argument("--tot-convergence", type=float, help="Thought agreement (0-1) at which to stop expanding a tree")
+    parser.add_argument("--memoize-thoughts", action="store_true", help="Share Tree of Thought expansions between agents")
+    parser.add_argument("--structured-thoughts", action="store_true", help="Have Tree of Thought expansions use the record_thoughts tool")
+    parser.add_argument("--thought-diversity", type=int, default=1, help="Variants the shared expansions are split into")
+    parser.add_argument("--baseline", help="Compare against results saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="Write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown relative to the baseline")
+    parser.add_argument("--stages", action="store_true", help="Break calls, latency and cost down by pipeline stage")
+    parser.add_argument("--verbose", action="store_true", help="Show the pipeline's log output")
+    args = parser.parse_args()
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    results, found = {}, []
+    print(f"{'config':<22}{'p50 s':>8}{'p95 s':>8}{'calls/req':>11}{'search/req':>12}{'req/s':>8}{'uncached in/req':>17}{'cached':>8}{'$/req':>9}")
+    for layers, agents, depth, branching in itertools.product(args.layers, args.agents, args.depth, args.branching):
+        name = f"L{layers}-A{agents}-D{depth}-B{branching}"
+        result = results[name] = run_config(args, layers, agents, depth, branching)
+        print(f"{name:<22}{result['p50']:>8.2f}{result['p95']:>8.2f}{result['calls_per_request']:>11.1f}"
+              f"{result['searches_per_request']:>12.1f}{result['throughput']:>8.2f}"
+              f"{result['input_tokens_per_request']:>17.0f}{result['cached_input_fraction']:>8.0%}"
+              f"{result['cost_per_request']:>9.4f}")
+        if args.stages:
+            print(f"  {'stage':<20}{'calls/req':>11}{'s/call':>11}{'escalations':>13}{'$/req':>12}")
+            print_stages(result, args.requests)
+        if name in baseline:
+            found.extend(regressions(name, result, baseline[name], args.tolerance))
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    for message in found:
+        print(f"REGRESSION {message}")
+    sys.exit(1 if found else 0)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
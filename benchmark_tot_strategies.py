@@ -0,0 +1,89 @@
+"""Compare Tree of Thought search strategies by API call count on a fixed prompt set.
+
+Runs offline: make_api_call_async is replaced by a deterministic fake whose thought
+evaluations are derived from a hash of the prompt, so every strategy sees the same tree.
+
+    python benchmark_tot_strategies.py --depth 3 --branching 3
+"""
+import argparse
+import asyncio
+import hashlib
+import re
+import tree_of_thought
+from api_utils import prompt_text
+from search_strategies import BFSStrategy, BeamSearchStrategy, BestFirstStrategy
+from tree_of_thought import TreeOfThought
+
+PROMPTS = [
+    "What is the capital of France?",
+    "Count from 1 to 5.",
+    "Explain the concept of artificial intelligence in simple terms.",
+    "Plan the electrics for a 3 bedroom semi-detached house in the UK.",
+    "Compare heat pumps and gas boilers for a small flat.",
+    "Outline a revision plan for a first-year calculus exam.",
+    "Why does ice float on water?",
+    "Suggest a schema for storing chess games in a relational database.",
+]
+
+class FakeThoughtModel:
+    def __init__(self):
+        self.calls = 0
+
+    def score(self, text: str) -> int:
+        return int(hashlib.md5(text.encode()).hexdigest(), 16) % 11
+
+    async def __call__(self, system: str, messages: list, max_tokens: int = 4096) -> str:
+        self.calls += 1
+        user_prompt = prompt_text(messages[0]["content"])
+        branching = int(re.search(r"Generate and evaluate (\d+)", system).group(1))
+        prompt = user_prompt.split("Prompt: ", 1)[1].split("\n", 1)[0]
+        lines = []
+        for i in range(branching):
+            content = f"{prompt[:60]} > step {i + 1}"
+            score = self.score(content)
+            evaluation = "sure" if score >= 9 else "impossible" if score <= 1 else "maybe"
+            lines.append(f"Thought {i + 1}: {content} - Evaluation: {evaluation} - Score: {score}")
+        lines.append("Synthesis: fake synthesis")
+        return "\n".join(lines)
+
+def run(strategy_factory, depth: int, branching: int, export=None):
+    fake = FakeThoughtModel()
+    tree_of_thought.make_api_call_async = fake
+    quality = []
+    for prompt in PROMPTS:
+        tot = TreeOfThought(max_depth=depth, branching_factor=branching, strategy=strategy_factory())
+        tree = asyncio.run(tot.search_tree_async(prompt))
+        solution = [tree.nodes[index] for index in tree.solution]
+        quality.append(sum(t.score or 0.0 for t in solution) / len(solution) if solution else 0.0)
+        if export is not None:
+            tree.write_jsonl(export)
+    return fake.calls, sum(quality) / len(quality)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--depth", type=int, default=2)
+    parser.add_argument("--branching", type=int, default=2)
+    parser.add_argument("--beam-width", type=int, default=2)
+    parser.add_argument("--export-trees", help="Append every explored tree to this JSON lines file, one node per line")
+    args = parser.parse_args()
+
+    strategies = {
+        "bfs": BFSStrategy,
+        f"beam(k={args.beam_width})": lambda: BeamSearchStrategy(width=args.beam_width),
+        "best_first": BestFirstStrategy,
+    }
+    original_call = tree_of_thought.make_api_call_async
+    export = open(args.export_trees, "w", encoding="utf-8") if args.export_trees else None
+    try:
+        print(f"{len(PROMPTS)} prompts, depth={args.depth}, branching={args.branching}")
+        print(f"{'strategy':<14}{'calls':>8}{'calls/prompt':>14}{'mean score':>12}")
+        for name, factory in strategies.items():
+            calls, quality = run(factory, args.depth, args.branching, export)
+            print(f"{name:<14}{calls:>8}{calls / len(PROMPTS):>14.2f}{quality:>12.2f}")
+    finally:
+        tree_of_thought.make_api_call_async = original_call
+        if export is not None:
+            export.close()
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
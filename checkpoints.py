@@ -0,0 +1,167 @@
+import contextvars
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar
+from tracing import record, tally
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class CheckpointStore:
+    """
+    Completed stage outputs of respond requests (Tree of Thought solutions, agent outputs, layer
+    syntheses, per-chunk answers), keyed by request ID and stage name. A request that fails or
+    runs out of time keeps its stages, so retrying it only pays for the work that is left.
+
+    Stages live in memory, or in a SQLite file when `path` is set so that they survive a restart.
+    Entries older than `ttl` seconds are ignored and eventually deleted.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 3600):
+        self.path = path
+        self.ttl = ttl
+        self._memory: Dict[str, Dict[str, tuple]] = {}
+        self._lock = threading.Lock()
+        self.resumed = 0
+        if path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS stages "
+                             "(request_id TEXT, stage TEXT, value TEXT, created REAL, PRIMARY KEY (request_id, stage))")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _query(self, sql: str, params: tuple) -> List[tuple]:
+        conn = self._connect()
+        try:
+            with conn:
+                return conn.execute(sql, params).fetchall()
+        finally:
+            conn.close()
+
+    def get(self, request_id: str, stage: str) -> Optional[str]:
+        return self.stages(request_id).get(stage)
+
+    def stages(self, request_id: str) -> Dict[str, str]:
+        """Every saved stage of the request, oldest first."""
+        cutoff = time.time() - self.ttl
+        if self.path:
+            rows = self._query("SELECT stage, value FROM stages WHERE request_id = ? AND created > ? ORDER BY created",
+                               (request_id, cutoff))
+            return dict(rows)
+        with self._lock:
+            saved = self._memory.get(request_id, {})
+            return {stage: value for stage, (value, created) in saved.items() if created > cutoff}
+
+    def put(self, request_id: str, stage: str, value: str):
+        now = time.time()
+        if self.path:
+            self._query("INSERT OR REPLACE INTO stages (request_id, stage, value, created) VALUES (?, ?, ?, ?)",
+                        (request_id, stage, value, now))
+            self._query("DELETE FROM stages WHERE created <= ?", (now - self.ttl,))
+            return
+        with self._lock:
+            self._memory.setdefault(request_id, {})[stage] = (value, now)
+            for expired in [key for key, saved in self._memory.items() if all(now - created >= self.ttl for _, created in saved.values())]:
+                del self._memory[expired]
+
+    def clear(self, request_id: Optional[str] = None):
+        """Forget one request's stages, or every request's."""
+        if self.path:
+            if request_id is None:
+                self._query("DELETE FROM stages", ())
+            else:
+                self._query("DELETE FROM stages WHERE request_id = ?", (request_id,))
+            return
+        with self._lock:
+            if request_id is None:
+                self._memory.clear()
+            else:
+                self._memory.pop(request_id, None)
+
+def request_id_for(user_input: str, history: List[Dict[str, str]], scope: str = "") -> str:
+    """
+    The same question asked at the same point in a conversation, within the same `scope` (e.g. one
+    assistant), gets the same ID, so retrying it resumes it.
+    """
+    payload = json.dumps([scope, history, user_input], separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("current_run", default=None)
+
+@contextmanager
+def checkpoint_run(store: Optional[CheckpointStore], request_id: str) -> Iterator[None]:
+    """
+    Checkpoint the stages completed in this context under `request_id`. The stages are dropped
+    when the block finishes normally, and kept when it raises or is cancelled.
+    """
+    if store is None:
+        yield
+        return
+    token = _current_run.set((store, request_id, ""))
+    try:
+        yield
+    finally:
+        _current_run.reset(token)
+    store.clear(request_id)
+
+@contextmanager
+def checkpoint_scope(name: str) -> Iterator[None]:
+    """Prefix the stage names checkpointed in this context, e.g. with the input chunk they belong to."""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+    store, request_id, prefix = run
+    token = _current_run.set((store, request_id, f"{prefix}{name}/"))
+    try:
+        yield
+    finally:
+        _current_run.reset(token)
+
+async def checkpointed(stage: str, compute: Callable[[], Awaitable[T]], dump: Callable[[T], str] = str,
+                       load: Callable[[str], T] = str, keep: Callable[[T], bool] = lambda value: True) -> T:
+    """
+    The stage's saved output if the current request already completed it, otherwise compute() and
+    save the result. Results that `keep` rejects, such as error messages, are not saved, and neither
+    are results that a deadline cut short (deadlines.degrade), so a retry with more time redoes them.
+    """
+    run = _current_run.get()
+    if run is None:
+        return await compute()
+    store, request_id, prefix = run
+    saved = store.get(request_id, prefix + stage)
+    if saved is not None:
+        logger.info(f"Resuming request {request_id[:8]} from checkpointed stage {prefix + stage}")
+        store.resumed += 1
+        record(resumed_stages=1)
+        return load(saved)
+    with tally() as usage:
+        value = await compute()
+    if keep(value) and not usage.get("degraded"):
+        store.put(request_id, prefix + stage, dump(value))
+    return value
+
+def is_complete(output: Any) -> bool:
+    # Stage functions report failures as text rather than raising; those must be retried, not resumed.
+    return isinstance(output, str) and bool(output) and not output.startswith("Error")
+
+_checkpoint_store: Optional[CheckpointStore] = None
+_checkpoint_store_lock = threading.Lock()
+
+def get_checkpoint_store() -> Optional[CheckpointStore]:
+    """The process-wide store that assistants checkpoint into by default; None when CHECKPOINTS=0."""
+    global _checkpoint_store
+    if os.getenv("CHECKPOINTS", "1") == "0":
+        return None
+    with _checkpoint_store_lock:
+        if _checkpoint_store is None:
+            _checkpoint_store = CheckpointStore(path=os.getenv("CHECKPOINT_DB"), ttl=float(os.getenv("CHECKPOINT_TTL", "3600")))
+        return _checkpoint_store
\ No newline at end of file
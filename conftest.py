@@ -0,0 +1,32 @@
+import asyncio
+import pytest
+import agent
+import ai_assistant
+import conversation_memory
+import mixture_of_agents
+import tree_of_thought
+from api_utils import prompt_text
+
+# Every module that calls the API through its own `make_api_call_async` import.
+PIPELINE_MODULES = (agent, tree_of_thought, mixture_of_agents, ai_assistant, conversation_memory)
+
+@pytest.fixture
+def fake_api_call(monkeypatch):
+    """
+    Installs `reply(system, messages)` in place of make_api_call_async throughout the pipeline,
+    with an optional latency per call. Returns the list of first-message prompts it was asked.
+    """
+    def install(reply, latency: float = 0.0):
+        prompts = []
+
+        async def fake_make_api_call_async(system, messages, max_tokens=4096):
+            prompts.append(prompt_text(messages[0]["content"]))
+            if latency:
+                await asyncio.sleep(latency)
+            return reply(system, messages)
+
+        for module in PIPELINE_MODULES:
+            monkeypatch.setattr(module, "make_api_call_async", fake_make_api_call_async)
+        return prompts
+
+    return install
\ No newline at end of file
@@ -0,0 +1,82 @@
+import logging
+from typing import Dict, List, Optional
+from api_utils import make_api_call_async, AnthropicAPIError, CLAUDE_CHARS_PER_TOKEN, chunk_text, count_tokens
+from model_routing import stage
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+class ConversationMemory:
+    """
+    Token-budgeted conversation context: a rolling summary of older messages plus the most
+    recent messages that fit in `recent_tokens`.
+
+    Messages are folded into the summary once, when they fall out of the recent window, so
+    each turn costs at most one summarization call no matter how long the conversation is.
+    """
+
+    def __init__(self, recent_tokens: int = 1000, summary_tokens: int = 300, max_message_tokens: int = 400,
+                 counter: Optional[str] = None):
+        self.recent_tokens = recent_tokens
+        self.summary_tokens = summary_tokens
+        self.max_message_tokens = max_message_tokens  # Long answers are cut to this many tokens in the context
+        self.counter = counter
+        self.summary = ""
+        self._summarized = 0  # Messages [0, _summarized) are covered by the summary
+        self._context_key = None
+        self._context = ""
+
+    def clear(self):
+        self.summary = ""
+        self._summarized = 0
+        self._context_key = None
+        self._context = ""
+
+    def _trim(self, content: str) -> str:
+        if count_tokens(content, self.counter) <= self.max_message_tokens:
+            return content
+        head = chunk_text(content, self.max_message_tokens, self.counter)[0]
+        return head[:int(self.max_message_tokens * CLAUDE_CHARS_PER_TOKEN)].rstrip() + " [...]"
+
+    def _recent_window(self, history: List[Dict[str, str]]) -> int:
+        """Index of the oldest message that still fits in the recent-token budget."""
+        start, used = len(history), 0
+        while start > self._summarized:
+            tokens = count_tokens(self._trim(history[start - 1]["content"]), self.counter)
+            if used + tokens > self.recent_tokens and start < len(history):
+                break
+            used += tokens
+            start -= 1
+        return start
+
+    async def _summarize_async(self, messages: List[Dict[str, str]]) -> str:
+        system_prompt = f"""You maintain a running summary of a conversation between a user and an AI assistant.
+        Update the summary with the new messages. Keep the facts, decisions, names and open questions a follow-up question might refer to, in at most {self.summary_tokens} tokens."""
+        user_prompt = f"Current summary:\n{self.summary or '(empty)'}\n\nNew messages:\n"
+        user_prompt += "\n".join(f"{msg['role']}: {self._trim(msg['content'])}" for msg in messages)
+        user_prompt += "\n\nUpdated summary:"
+        with span("memory_summary", messages=len(messages)), stage("memory_summary"):
+            return await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=self.summary_tokens)
+
+    async def context_async(self, history: List[Dict[str, str]]) -> str:
+        """The context string for the next turn. Computed once per turn, then cached until the history changes."""
+        if len(history) < self._summarized:
+            self.clear()
+        key = (len(history), id(history[-1]) if history else None)
+        if key == self._context_key:
+            return self._context
+
+        start = self._recent_window(history)
+        if start > self._summarized:
+            try:
+                self.summary = (await self._summarize_async(history[self._summarized:start])).strip()
+                self._summarized = start
+            except AnthropicAPIError as e:
+                # Leave the messages unsummarized; they are retried on the next turn.
+                logger.error(f"Error updating conversation summary: {str(e)}")
+
+        lines = [f"Summary of earlier conversation: {self.summary}"] if self.summary else []
+        lines.extend(f"{msg['role']}: {self._trim(msg['content'])}" for msg in history[start:])
+        self._context_key = key
+        self._context = "\n".join(lines)
+        return self._context
\ No newline at end of file
@@ -0,0 +1,73 @@
+import asyncio
+import contextvars
+import logging
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Iterator, Optional, TypeVar
+from tracing import record
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# time.monotonic() value by which the current request has to be answered.
+_current_deadline: contextvars.ContextVar = contextvars.ContextVar("current_deadline", default=None)
+
+def remaining_time() -> Optional[float]:
+    """Seconds left before the current deadline, or None when there is no deadline."""
+    current = _current_deadline.get()
+    if current is None:
+        return None
+    return max(current - time.monotonic(), 0.0)
+
+def expired() -> bool:
+    return remaining_time() == 0.0
+
+def cap(seconds: Optional[float]) -> Optional[float]:
+    """`seconds`, or the time left before the deadline if that is shorter; None if both are unbounded."""
+    remaining = remaining_time()
+    if remaining is None:
+        return seconds
+    return remaining if seconds is None else min(seconds, remaining)
+
+@contextmanager
+def _deadline_at(at: Optional[float]) -> Iterator[None]:
+    current = _current_deadline.get()
+    if at is None or (current is not None and current <= at):
+        yield
+        return
+    token = _current_deadline.set(at)
+    try:
+        yield
+    finally:
+        _current_deadline.reset(token)
+
+def deadline(seconds: Optional[float]):
+    """Run the block under a deadline `seconds` from now, or the enclosing one if that is sooner."""
+    return _deadline_at(None if seconds is None else time.monotonic() + seconds)
+
+def reserve(fraction: float):
+    """Move the deadline earlier by `fraction` of the time left, keeping that time for the work after the block."""
+    remaining = remaining_time()
+    return _deadline_at(None if remaining is None else time.monotonic() + remaining * (1 - fraction))
+
+def degrade(step: str, reason: str):
+    """Log and count a step the pipeline skipped or cut short to finish on time."""
+    logger.warning(f"Deadline: {step} ({reason})")
+    record(degraded=1)
+
+async def within_deadline(awaitable: Awaitable[T], fallback: Callable[[], T], step: str) -> T:
+    """Await `awaitable` until the deadline; if it isn't done by then, cancel it and return fallback()."""
+    remaining = remaining_time()
+    if remaining is None:
+        return await awaitable
+    if remaining <= 0:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        degrade(step, "no time left")
+        return fallback()
+    try:
+        return await asyncio.wait_for(awaitable, remaining)
+    except asyncio.TimeoutError:
+        degrade(step, f"cut off after {remaining:.1f}s")
+        return fallback()
\ No newline at end of file
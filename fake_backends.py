@@ -0,0 +1,311 @@
+"""Local stand-ins for the Anthropic and Tavily clients, for offline tests and benchmarks.
+
+    with install_fake_backends(FakeAnthropic(LatencyModel.parse("lognormal:0.8,0.4"))) as backends:
+        AIAssistant().respond("What is the capital of France?")
+        print(backends.anthropic.calls, backends.tavily.calls)
+"""
+import asyncio
+import json
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Optional, Tuple
+import anthropic
+import httpx
+import requests
+import agent
+import api_utils
+from agent import SearchService
+from api_utils import AdaptiveConcurrency, RateLimiter, TokenBucket, CLAUDE_CHARS_PER_TOKEN, estimate_claude_tokens, prompt_text
+
+class LatencyModel:
+    """Seeded latency distribution: fixed:<s>, uniform:<low>,<high> or lognormal:<median>,<sigma>."""
+
+    def __init__(self, kind: str = "fixed", a: float = 0.0, b: float = 0.0, seed: int = 0):
+        if kind not in ("fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+        self.kind = kind
+        self.a = a
+        self.b = b
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def parse(cls, spec: str, seed: int = 0) -> "LatencyModel":
+        kind, _, params = spec.partition(":")
+        values = [float(value) for value in params.split(",") if value] + [0.0, 0.0]
+        return cls(kind, values[0], values[1], seed)
+
+    def sample(self) -> float:
+        with self._lock:
+            if self.kind == "uniform":
+                return self._random.uniform(self.a, self.b)
+            if self.kind == "lognormal":
+                return self.a * self._random.lognormvariate(0, self.b)
+            return self.a
+
+PROMPT_CACHE_MIN_TOKENS = 1024  # Shorter prefixes are never cached by the API
+
+class _FaultInjector:
+    def __init__(self, latency: Optional[LatencyModel], error_rate: float, rate_limit_rate: float, seed: int):
+        self.latency = latency or LatencyModel()
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+        self.rate_limited = 0
+
+    def next_outcome(self) -> str:
+        with self._lock:
+            self.calls += 1
+            roll = self._random.random()
+            if roll < self.rate_limit_rate:
+                self.rate_limited += 1
+                return "rate_limited"
+            if roll < self.rate_limit_rate + self.error_rate:
+                self.errors += 1
+                return "error"
+            return "ok"
+
+def _status_error(status: int, retry_after: float = 0.0) -> anthropic.APIStatusError:
+    request = httpx.Request("POST", "https://api.anthropic.com/v1/messages")
+    if status == 429:
+        response = httpx.Response(429, headers={"retry-after": str(retry_after)}, request=request)
+        return anthropic.RateLimitError("Injected rate limit", response=response, body=None)
+    return anthropic.InternalServerError("Injected server error", response=httpx.Response(status, request=request), body=None)
+
+def canned_thoughts(system: str, user_prompt: str) -> Optional[dict]:
+    """The thoughts a Tree of Thought expansion prompt gets back, as record_thoughts tool input; None for other prompts."""
+    match = re.search(r"Generate and evaluate (\d+) thoughts", system)
+    if not match:
+        return None
+    depth = re.search(r"Depth: (\d+)", user_prompt)
+    depth = int(depth.group(1)) if depth else 1
+    thoughts = [{"content": f"Step {depth}.{i + 1} towards an answer",
+                 "evaluation": "sure" if (depth + i) % 3 == 0 else "maybe", "score": 7 - i}
+                for i in range(int(match.group(1)))]
+    return {"thoughts": thoughts, "synthesis": "The steps point towards a clear answer."}
+
+def canned_response(system: str, user_prompt: str) -> str:
+    """A plausible reply for each prompt the pipeline sends, including the Tree of Thought format."""
+    canned = canned_thoughts(system, user_prompt)
+    if canned:
+        lines = [f"Thought {i + 1}: {t['content']} - Evaluation: {t['evaluation']} - Score: {t['score']}"
+                 for i, t in enumerate(canned["thoughts"])]
+        lines.append(f"Synthesis: {canned['synthesis']}")
+        return "\n".join(lines)
+    return "Canned answer covering the key points of the question, with supporting reasoning."
+
+class _FakeStream:
+    def __init__(self, response, delay: float):
+        self.response = response
+        self.delay = delay
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        time.sleep(self.delay)
+        for word in re.findall(r"\S+\s*", self.response.content[0].text):
+            yield word
+
+    def get_final_message(self):
+        return self.response
+
+class FakeAnthropic:
+    """Stands in for anthropic.Anthropic and AsyncAnthropic; messages.create, messages.batches and (sync) messages.stream are provided."""
+
+    def __init__(self, latency: Optional[LatencyModel] = None, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.1, seed: int = 0):
+        self.faults = _FaultInjector(latency, error_rate, rate_limit_rate, seed)
+        self.retry_after = retry_after
+        self.input_tokens = 0
+        self.output_tokens = 0
+        self.cache_read_tokens = 0
+        self.cache_write_tokens = 0
+        self._cached_prefixes = set()
+        self.batches = FakeMessageBatches(self)
+        self.messages = SimpleNamespace(create=self._create, stream=self._stream, batches=self.batches)
+        self.async_client = SimpleNamespace(messages=SimpleNamespace(create=self._create_async, batches=_AsyncFakeMessageBatches(self.batches)))
+
+    @property
+    def calls(self) -> int:
+        return self.faults.calls
+
+    def _respond(self, params: dict, outcome: str):
+        if outcome == "rate_limited":
+            raise _status_error(429, self.retry_after)
+        if outcome == "error":
+            raise _status_error(500)
+        system, user_prompt = prompt_text(params["system"]), prompt_text(params["messages"][-1]["content"])
+        text = canned_response(system, user_prompt)
+        content = [SimpleNamespace(type="text", text=text)]
+        tool_input = canned_thoughts(system, user_prompt) if params.get("tools") else None
+        if tool_input:
+            text = json.dumps(tool_input)
+            content = [SimpleNamespace(type="tool_use", name=params["tools"][0]["name"], input=tool_input)]
+        with self.faults._lock:
+            cache_read, cache_write = self._prompt_cache_usage(params)
+            usage = SimpleNamespace(input_tokens=estimate_claude_tokens(system + user_prompt) - cache_read - cache_write,
+                                    output_tokens=estimate_claude_tokens(text),
+                                    cache_read_input_tokens=cache_read, cache_creation_input_tokens=cache_write)
+            self.input_tokens += usage.input_tokens
+            self.output_tokens += usage.output_tokens
+            self.cache_read_tokens += cache_read
+            self.cache_write_tokens += cache_write
+        return SimpleNamespace(content=content, usage=usage)
+
+    def _prompt_cache_usage(self, params: dict) -> Tuple[int, int]:
+        # Like the API: the longest previously seen prefix ending at a cache_control block is read
+        # from the cache, and the rest of the prefix up to the last such block is written to it.
+        blocks = params["system"] if isinstance(params["system"], list) else [{"text": params["system"]}]
+        for message in params["messages"]:
+            content = message["content"]
+            blocks = blocks + (content if isinstance(content, list) else [{"text": content}])
+        prefix, read, written = "", 0, 0
+        for block in blocks:
+            prefix += block["text"]
+            if "cache_control" not in block:
+                continue
+            tokens = estimate_claude_tokens(prefix)
+            if tokens < PROMPT_CACHE_MIN_TOKENS:
+                continue
+            if prefix in self._cached_prefixes:
+                read, written = tokens, 0
+            else:
+                self._cached_prefixes.add(prefix)
+                written = tokens - read
+        return read, written
+
+    def _create(self, **params):
+        outcome = self.faults.next_outcome()
+        time.sleep(self.faults.latency.sample())
+        return self._respond(params, outcome)
+
+    def _stream(self, **params):
+        outcome = self.faults.next_outcome()
+        return _FakeStream(self._respond(params, outcome), self.faults.latency.sample())
+
+    async def _create_async(self, **params):
+        outcome = self.faults.next_outcome()
+        await asyncio.sleep(self.faults.latency.sample())
+        return self._respond(params, outcome)
+
+class FakeMessageBatches:
+    """
+    Local Message Batches endpoint. Each request is answered (or fails) as messages.create would,
+    and the whole batch ends one latency sample after it was created.
+    """
+
+    def __init__(self, fake_anthropic: FakeAnthropic):
+        self.fake_anthropic = fake_anthropic
+        self.created = 0
+        self.requests = 0
+        self._batches = {}
+        self._lock = threading.Lock()
+
+    def create(self, requests: list):
+        results = []
+        for request in requests:
+            outcome = self.fake_anthropic.faults.next_outcome()
+            try:
+                result = SimpleNamespace(type="succeeded", message=self.fake_anthropic._respond(request["params"], outcome))
+            except anthropic.APIStatusError as e:
+                result = SimpleNamespace(type="errored", error=SimpleNamespace(type="api_error", message=str(e)))
+            results.append(SimpleNamespace(custom_id=request["custom_id"], result=result))
+        with self._lock:
+            self.created += 1
+            self.requests += len(requests)
+            batch_id = f"msgbatch_fake_{self.created:04d}"
+            self._batches[batch_id] = (time.monotonic() + self.fake_anthropic.faults.latency.sample(), results)
+        return self.retrieve(batch_id)
+
+    def retrieve(self, batch_id: str):
+        with self._lock:
+            ends_at, results = self._batches[batch_id]
+        ended = time.monotonic() >= ends_at
+        counts = {kind: sum(entry.result.type == kind for entry in results) if ended else 0 for kind in ("succeeded", "errored")}
+        return SimpleNamespace(id=batch_id, processing_status="ended" if ended else "in_progress",
+                               request_counts=SimpleNamespace(processing=0 if ended else len(results), **counts))
+
+    def results(self, batch_id: str):
+        if self.retrieve(batch_id).processing_status != "ended":
+            raise anthropic.APIError(f"Batch {batch_id} is still in progress", request=httpx.Request("GET", "https://api.anthropic.com"), body=None)
+        with self._lock:
+            return iter(self._batches[batch_id][1])
+
+class _AsyncFakeMessageBatches:
+    def __init__(self, batches: FakeMessageBatches):
+        self.batches = batches
+
+    async def create(self, requests: list):
+        return self.batches.create(requests)
+
+    async def retrieve(self, batch_id: str):
+        return self.batches.retrieve(batch_id)
+
+    async def results(self, batch_id: str):
+        async def entries():
+            for entry in self.batches.results(batch_id):
+                yield entry
+        return entries()
+
+class FakeTavilyClient:
+    def __init__(self, latency: Optional[LatencyModel] = None, error_rate: float = 0.0, seed: int = 0,
+                 context_tokens: int = 2000):
+        self.api_key = "fake-tavily-key"
+        self.context_tokens = context_tokens  # Roughly the size of a real search context
+        self.faults = _FaultInjector(latency, error_rate, 0.0, seed)
+
+    @property
+    def calls(self) -> int:
+        return self.faults.calls
+
+    def get_search_context(self, query: str, **kwargs) -> str:
+        outcome = self.faults.next_outcome()
+        time.sleep(self.faults.latency.sample())
+        if outcome == "error":
+            raise requests.exceptions.ConnectionError("Injected search error")
+        filler = " Further background on the topic." * int(self.context_tokens * CLAUDE_CHARS_PER_TOKEN / 33)
+        return json.dumps([{"url": "https://example.com", "content": f"Background on: {query[:80]}.{filler}"}])
+
+@contextmanager
+def install_fake_backends(fake_anthropic: Optional[FakeAnthropic] = None, fake_tavily: Optional[FakeTavilyClient] = None,
+                          requests_per_minute: int = 100000, tokens_per_minute: int = 100000000, searches_per_minute: int = 100000,
+                          retry_wait: float = 0.05, use_response_cache: bool = False, token_counter: str = "claude"):
+    """
+    Swap the module-level clients for fakes for the duration of the block. The rate limiter and the
+    search service's Tavily quota are replaced with roomy ones, and retry backoff is shortened to `retry_wait` seconds so that
+    injected failures don't dominate a benchmark run. Token counting defaults to the offline
+    estimate, since tiktoken downloads its encodings on first use. Agents must be created inside the block to
+    pick up the fake search client.
+    """
+    fake_anthropic = fake_anthropic or FakeAnthropic()
+    fake_tavily = fake_tavily or FakeTavilyClient()
+    search_service = SearchService(api_key=fake_tavily.api_key, limiter=TokenBucket("searches", searches_per_minute))
+    search_service.client = fake_tavily
+
+    saved = (api_utils.client, api_utils.get_async_client, api_utils.rate_limiter, api_utils.response_cache,
+             api_utils._exponential_wait, api_utils.TOKEN_COUNTER, agent._search_service)
+    api_utils.client = fake_anthropic
+    api_utils.get_async_client = lambda: fake_anthropic.async_client
+    api_utils.rate_limiter = RateLimiter(requests_per_minute, tokens_per_minute, concurrency=AdaptiveConcurrency(initial=16, maximum=64))
+    if not use_response_cache:
+        api_utils.response_cache = None
+    api_utils._exponential_wait = lambda retry_state: retry_wait
+    api_utils.TOKEN_COUNTER = token_counter
+    agent._search_service = search_service
+    try:
+        yield SimpleNamespace(anthropic=fake_anthropic, tavily=fake_tavily, search_service=search_service)
+    finally:
+        (api_utils.client, api_utils.get_async_client, api_utils.rate_limiter, api_utils.response_cache,
+         api_utils._exponential_wait, api_utils.TOKEN_COUNTER, agent._search_service) = saved
\ No newline at end of file
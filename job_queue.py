@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+from ai_assistant import SOFT_DEADLINE, AIAssistant
+from api_utils import AnthropicAPIError
+
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TIMED_OUT = "timed_out"
+FINISHED = (DONE, FAILED, CANCELLED, TIMED_OUT)
+
+class QueueFullError(Exception):
+    pass
+
+class Job:
+    """A single respond request. Its progress and token events can be read while it runs."""
+
+    def __init__(self, session_id: str, assistant: AIAssistant, user_input: str, concise: bool, timeout: float):
+        self.id = uuid.uuid4().hex
+        self.session_id = session_id
+        self.assistant = assistant
+        self.user_input = user_input
+        self.concise = concise
+        self.timeout = timeout
+        self.status = QUEUED
+        self.response: Optional[str] = None
+        self.error: Optional[str] = None
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def add_event(self, event: Dict[str, Any]):
+        with self._lock:
+            self._events.append(event)
+
+    def events(self, start: int = 0) -> List[Dict[str, Any]]:
+        with self._lock:
+            return self._events[start:]
+
+    @property
+    def partial_response(self) -> str:
+        return "".join(event["text"] for event in self.events() if event["type"] == "token")
+
+    @property
+    def progress_message(self) -> Optional[str]:
+        progress = [event["message"] for event in self.events() if event["type"] == "progress"]
+        return progress[-1] if progress else None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED
+
+    def remaining(self) -> float:
+        return self.timeout - (time.time() - self.started_at) if self.started_at else self.timeout
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._finished.wait(timeout)
+
+    def _finish(self, status: str, response: Optional[str] = None, error: Optional[str] = None):
+        self.status = status
+        self.response = response
+        self.error = error
+        self.finished_at = time.time()
+        self._stop.set()
+        self._finished.set()
+
+class JobQueue:
+    """
+    Bounded pool of worker threads that runs respond requests for every session in the process.
+
+    Sessions are served round-robin and each session has at most one job running at a time, so
+    one user queueing several questions can't starve the others (and a session's conversation
+    history is only ever updated by one job). Each worker keeps its own event loop, so its
+    API client and connection pool are reused from job to job.
+    """
+
+    def __init__(self, max_workers: int = 4, max_queued: int = 64, timeout: float = 180, retention: float = 600):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.retention = retention  # Seconds a finished job stays available for polling
+        self._jobs: Dict[str, Job] = {}
+        self._pending: Dict[str, Deque[Job]] = {}
+        self._last_served: Dict[str, int] = {}  # Session -> turn number of its most recent job
+        self._turn = 0
+        self._running_sessions = set()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self.counts = {status: 0 for status in FINISHED}
+        self._workers = [threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True) for i in range(max_workers)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, session_id: str, assistant: AIAssistant, user_input: str, concise: bool = False,
+               timeout: Optional[float] = None) -> Job:
+        job = Job(session_id, assistant, user_input, concise, timeout or self.timeout)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Job queue has been shut down")
+            self._prune()
+            if self.queued() >= self.max_queued:
+                raise QueueFullError(f"{self.max_queued} requests are already waiting")
+            self._jobs[job.id] = job
+            self._pending.setdefault(session_id, deque()).append(job)
+            self._condition.notify()
+        logger.info(f"Queued job {job.id} for session {session_id}")
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """Number of queued jobs that will start before this one, or None if it isn't queued."""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != QUEUED:
+                return None
+            sessions = self._rotation()
+            ours = sessions.index(job.session_id)
+            turns = list(self._pending[job.session_id]).index(job)
+            # Sessions ahead of ours in the rotation get one more turn than those behind it.
+            return turns + sum(min(len(self._pending[session_id]), turns + (i < ours))
+                               for i, session_id in enumerate(sessions) if i != ours)
+
+    def cancel(self, job_id: str) -> bool:
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.finished:
+                return False
+            if job.status == QUEUED:
+                self._pending[job.session_id].remove(job)
+                if not self._pending[job.session_id]:
+                    del self._pending[job.session_id]
+                self._record(job, CANCELLED, error="Cancelled")
+                return True
+            job._stop.set()
+            if job._loop is not None and job._task is not None:
+                job._loop.call_soon_threadsafe(job._task.cancel)
+        logger.info(f"Cancelling job {job_id}")
+        return True
+
+    def queued(self) -> int:
+        return sum(len(jobs) for jobs in self._pending.values())
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {"queued": self.queued(), "running": len(self._running_sessions), "workers": self.max_workers, **self.counts}
+
+    def shutdown(self, wait: bool = True):
+        with self._condition:
+            self._shutdown = True
+            for jobs in self._pending.values():
+                for job in jobs:
+                    self._record(job, CANCELLED, error="Cancelled")
+            self._pending.clear()
+            self._condition.notify_all()
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+    def _record(self, job: Job, status: str, response: Optional[str] = None, error: Optional[str] = None):
+        self.counts[status] += 1
+        job._finish(status, response, error)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.finished and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+        active = {job.session_id for job in self._jobs.values()}
+        for session_id in [session_id for session_id in self._last_served if session_id not in active]:
+            del self._last_served[session_id]
+
+    def _rotation(self) -> List[str]:
+        # Round-robin order: the session served longest ago (or never) goes first.
+        return sorted(self._pending, key=lambda session_id: self._last_served.get(session_id, 0))
+
+    def _next_job(self) -> Optional[Job]:
+        with self._condition:
+            while True:
+                if self._shutdown:
+                    return None
+                for session_id in self._rotation():
+                    if session_id not in self._running_sessions:
+                        job = self._pending[session_id].popleft()
+                        if not self._pending[session_id]:
+                            del self._pending[session_id]
+                        self._turn += 1
+                        self._last_served[session_id] = self._turn
+                        self._running_sessions.add(session_id)
+                        job.status = RUNNING
+                        job.started_at = time.time()
+                        return job
+                self._condition.wait()
+
+    def _worker(self):
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                job = self._next_job()
+                if job is None:
+                    return
+                try:
+                    loop.run_until_complete(self._run(job))
+                finally:
+                    with self._condition:
+                        self._running_sessions.discard(job.session_id)
+                        self._condition.notify_all()
+        finally:
+            loop.close()
+
+    async def _run(self, job: Job):
+        job._loop = asyncio.get_running_loop()
+        job._task = asyncio.current_task()
+        start_time = time.perf_counter()
+        status, response, error = DONE, None, None
+        request_id = job.assistant.request_id(job.user_input)
+        history_length = len(job.assistant.get_conversation_history())
+        try:
+            if job._stop.is_set():
+                raise asyncio.CancelledError
+            # A job that times out or fails keeps its completed stages; asking again resumes it.
+            response = await asyncio.wait_for(
+                job.assistant.run_pipeline_async(job.user_input, job.concise, request_id, job.remaining() * SOFT_DEADLINE, job.add_event),
+                job.remaining())
+        except asyncio.CancelledError:
+            status, error = CANCELLED, "Cancelled"
+        except asyncio.TimeoutError:
+            status = CANCELLED if job._stop.is_set() and job.remaining() > 0 else TIMED_OUT
+            error = "Cancelled" if status == CANCELLED else "I apologize, but your request took too long to process. Please try again later."
+            if status == TIMED_OUT:
+                response = job.assistant.partial_response(request_id)
+        except AnthropicAPIError as e:
+            logger.error(f"Error in job {job.id}: {str(e)}")
+            status, error = FAILED, "I apologize, but I'm unable to provide a response at the moment. Please try again later."
+        except Exception as e:
+            logger.exception(f"Unexpected error in job {job.id}: {str(e)}")
+            status, error = FAILED, "I apologize, but an unexpected error occurred. Please try again later."
+        if status != DONE:
+            job.assistant.rollback_history(history_length)
+        with self._condition:
+            self._record(job, status, response, error)
+        logger.info(f"Job {job.id} {status} after {time.perf_counter() - start_time:.2f}s")
+
+_job_queue: Optional[JobQueue] = None
+_job_queue_lock = threading.Lock()
+
+def get_job_queue() -> JobQueue:
+    """The process-wide job queue shared by every UI session."""
+    global _job_queue
+    with _job_queue_lock:
+        if _job_queue is None:
+            _job_queue = JobQueue(max_workers=int(os.getenv("JOB_WORKERS", "4")),
+                                  max_queued=int(os.getenv("JOB_QUEUE_SIZE", "64")),
+                                  timeout=float(os.getenv("JOB_TIMEOUT", "180")))
+        return _job_queue
\ No newline at end of file
@@ -1,10 +1,13 @@
 import streamlit as st
+import api_utils
 from ai_assistant import AIAssistant
-from api_utils import AnthropicAPIError
-from tavily import TavilyClient
-import os
+from thought_store import ThoughtStore
+from job_queue import CANCELLED, DONE, QUEUED, TIMED_OUT, QueueFullError, get_job_queue
+import threading
+import time
+import uuid
 from dotenv import load_dotenv
-from agent import Agent
+from agent import Agent, get_search_service
 
 import logging
 logging.basicConfig(level=logging.INFO)
@@ -12,25 +15,48 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+POLL_INTERVAL = 0.5  # Seconds between reruns while a request is in progress
+# Adaptive mode: trivial questions get one API call, and layers or thought trees stop once their outputs agree.
+# Agreement is word-bigram overlap, so even close rewordings of one answer or thought score only 0.3-0.6 (see test_adaptive.py).
+ASSISTANT_OPTIONS = dict(fast_path=True, early_exit_threshold=0.25, tot_options={"convergence_threshold": 0.25, "structured": True})
+
 def verify_tavily_api_key():
+    # Cached per process, so reruns (every widget interaction) don't repeat the network call.
     return Agent.verify_tavily_api_key()
 
-def main():
-    st.title("AI Assistant with Mixture of Agents and Tree of Thought")
-
-    if not verify_tavily_api_key():
-        st.error("Failed to verify Tavily API key. Please check your .env file and try again.")
-        st.stop()
-
-    initialize_session_state()
+def warm_up():
+    # Import the API SDKs and create their clients before the first request needs them.
+    try:
+        api_utils.get_client()
+        get_search_service().client
+        if api_utils.TOKEN_COUNTER == "tiktoken":
+            api_utils.get_encoder()
+    except Exception as e:
+        logger.warning(f"Warm-up failed; clients will be created on first use: {str(e)}")
+
+@st.cache_resource
+def start_warm_up() -> threading.Thread:
+    """Runs once per process, in the background, so the first page doesn't wait for the imports."""
+    thread = threading.Thread(target=warm_up, daemon=True)
+    thread.start()
+    return thread
+
+def new_assistant() -> AIAssistant:
+    # Each session's agents share one thought store. It isn't diversified: with two agents per layer, two
+    # variants would give each agent its own tree and the store would never save a call within a request.
+    return AIAssistant(thought_store=ThoughtStore(), **ASSISTANT_OPTIONS)
 
 def initialize_session_state():
     if 'assistant' not in st.session_state:
-        st.session_state.assistant = AIAssistant()
+        st.session_state.assistant = new_assistant()
     if 'conversation' not in st.session_state:
         st.session_state.conversation = []
     if 'follow_up' not in st.session_state:
         st.session_state.follow_up = False
+    if 'session_id' not in st.session_state:
+        st.session_state.session_id = uuid.uuid4().hex
+    if 'job_id' not in st.session_state:
+        st.session_state.job_id = None
 
 def display_conversation():
     for i, message in enumerate(st.session_state.conversation):
@@ -39,10 +65,52 @@ def display_conversation():
         else:
             st.text_area("Assistant:", value=message["content"], height=200, key=f"assistant_{i}")
 
+def show_job(job):
+    # Progress goes into a collapsible status box; the answer so far is rendered below it.
+    if job.status == QUEUED:
+        position = get_job_queue().position(job.id)
+        status = st.status(f"Waiting for a free worker ({position} requests ahead)..." if position else "Waiting for a free worker...")
+    else:
+        status = st.status(job.progress_message or "Thinking...", expanded=False)
+    for event in job.events():
+        if event["type"] == "progress":
+            status.write(event["message"])
+    st.markdown(job.partial_response)
+    return status
+
+def poll_job():
+    """Render the session's in-progress request. Once it has finished, record the answer."""
+    job = get_job_queue().get(st.session_state.job_id)
+    if job is None:
+        st.session_state.job_id = None
+        return
+
+    status = show_job(job)
+    if not job.finished:
+        if st.button("Cancel"):
+            get_job_queue().cancel(job.id)
+        return
+
+    st.session_state.job_id = None
+    if job.status == DONE:
+        status.update(label="Done", state="complete")
+        st.session_state.conversation.append({"role": "assistant", "content": job.response})
+        st.session_state.follow_up = True
+    else:
+        status.update(label="Cancelled" if job.status == CANCELLED else "Failed", state="error")
+        if job.status != CANCELLED:
+            st.error(job.error)
+            logger.error(f"Request {job.id} {job.status}: {job.error}")
+        if job.status == TIMED_OUT and job.response:
+            # Sending the same question again resumes from the stages that did finish.
+            st.markdown(job.response)
+
 def main():
     st.title("AI Assistant with Mixture of Agents and Tree of Thought")
+    start_warm_up()
 
     if not verify_tavily_api_key():
+        st.error("Failed to verify Tavily API key. Please check your .env file and try again.")
         st.stop()
 
     initialize_session_state()
@@ -52,30 +120,38 @@ def main():
     else:
         user_input = st.text_area("Follow-up question or additional context:", key="follow_up_input", height=100)
 
-    if st.button("Send"):
+    if st.button("Send", disabled=st.session_state.job_id is not None):
         st.session_state.conversation.append({"role": "user", "content": user_input})
         
         try:
-            with st.spinner("Thinking..."):
-                response = st.session_state.assistant.respond(user_input)
-            st.session_state.conversation.append({"role": "assistant", "content": response})
-            st.session_state.follow_up = True
-        
-        except AnthropicAPIError as e:
-            st.error(f"An error occurred while processing your request: {str(e)}")
-            logger.error(f"Error in assistant response: {str(e)}")
+            job = get_job_queue().submit(st.session_state.session_id, st.session_state.assistant, user_input)
+            st.session_state.job_id = job.id
+        except QueueFullError as e:
+            st.error("The assistant is busy right now. Please try again in a minute.")
+            logger.warning(f"Request rejected: {str(e)}")
         except Exception as e:
             st.error(f"An unexpected error occurred: {str(e)}")
             logger.exception("Unexpected error in Streamlit UI")
 
+    if st.session_state.job_id is not None:
+        poll_job()
+
     display_conversation()
 
     if st.button("Clear Conversation"):
+        if st.session_state.job_id is not None:
+            get_job_queue().cancel(st.session_state.job_id)
+            st.session_state.job_id = None
         st.session_state.conversation = []
-        st.session_state.assistant = AIAssistant()
+        st.session_state.assistant = new_assistant()
         st.session_state.follow_up = False
 
     st.info("Note: The assistant's responses are displayed in editable text areas for easy copying, but edits are not saved or processed.")
 
+    # The request runs on the shared job queue; rerun the script to pick up its progress.
+    if st.session_state.job_id is not None:
+        time.sleep(POLL_INTERVAL)
+        st.rerun()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
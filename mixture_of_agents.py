@@ -1,34 +1,82 @@
-from typing import List, Tuple, Dict
+import asyncio
+import time
+from typing import Any, List, Optional, Tuple, Dict
 from agent import Agent
-from api_utils import make_api_call, AnthropicAPIError, chunk_text
+from checkpoints import checkpointed, is_complete
+from conversation_memory import ConversationMemory
+from deadlines import degrade, remaining_time, within_deadline
+from model_routing import stage
+from api_utils import make_api_call_async, run_in_thread, AnthropicAPIError, chunk_text
+from progress import ProgressCallback, report_progress
+from similarity import agreement, medoid
+from thought_store import ThoughtStore
+from tracing import annotate, span
 import logging
 
 logger = logging.getLogger(__name__)
 
 class MixtureOfAgents:
-    def __init__(self, num_layers: int = 2, agents_per_layer: int = 2, tot_depth: int = 2, tot_branching: int = 2):
+    def __init__(self, num_layers: int = 2, agents_per_layer: int = 2, tot_depth: int = 2, tot_branching: int = 2, max_concurrency: int = 4,
+                 tot_options: Optional[Dict[str, Any]] = None, memory: Optional[ConversationMemory] = None,
+                 early_exit_threshold: Optional[float] = None, thought_store: Optional[ThoughtStore] = None):
         self.num_layers = num_layers
         self.agents_per_layer = agents_per_layer
-        self.layers = [[Agent(f"L{i}A{j}", tot_depth, tot_branching) for j in range(agents_per_layer)] for i in range(num_layers)]
+        self.max_concurrency = max_concurrency
+        tot_options = tot_options or {}
+        # Agents share thought_store's expansions; their seed decides which variant they get when it is diversified.
+        # A layer's agents are split into contiguous groups, one per variant, so that agents in a group share
+        # expansions; spreading them round-robin would give two agents two variants and no shared work.
+        self.thought_store = thought_store
+        diversity = thought_store.diversity if thought_store is not None else 1
+        self.layers = [[Agent(f"L{i}A{j}", tot_depth, tot_branching, thought_store=thought_store,
+                              seed=j * diversity // max(agents_per_layer, diversity), **tot_options)
+                        for j in range(agents_per_layer)] for i in range(num_layers)]
         self.conversation_history: List[Dict[str, str]] = []
+        self.memory = memory or ConversationMemory()
+        # Once a layer's agents agree at least this much (0-1), skip its synthesis and the remaining layers.
+        self.early_exit_threshold = early_exit_threshold
+        self.last_layers_run = 0
+
+    async def process_layer_async(self, input: str, layer: int, semaphore: asyncio.Semaphore = None,
+                                  on_progress: Optional[ProgressCallback] = None, context: Optional[str] = None) -> List[str]:
+        if context is None:
+            context = await self.memory.context_async(self.conversation_history)
+        layer_input = f"Context:\n{context}\n\nCurrent Input: {input}"
+        semaphore = semaphore or asyncio.Semaphore(self.max_concurrency)
+        report_progress(on_progress, "layer", f"Layer {layer + 1}/{self.num_layers}: running {len(self.layers[layer])} agents", layer=layer)
+
+        async def run_agent(agent: Agent) -> str:
+            async with semaphore:
+                output = await within_deadline(
+                    checkpointed(f"agent/{agent.name}", lambda: agent.process_async(layer_input, on_progress), keep=is_complete),
+                    lambda: f"Error: Agent {agent.name} ran out of time", f"Agent {agent.name}")
+            report_progress(on_progress, "agent", f"Agent {agent.name} finished", agent=agent.name, layer=layer)
+            return output
+
+        # Agents within a layer are independent, so the layer takes about as long as its slowest agent.
+        with span("layer", layer=layer):
+            return list(await asyncio.gather(*(run_agent(agent) for agent in self.layers[layer])))
 
     def process_layer(self, input: str, layer: int) -> List[str]:
-        context = "\n".join([f"{msg['role']}: {msg['content']}" for msg in self.conversation_history[-5:]])  # Use last 5 messages as context
-        return [agent.process(f"Context:\n{context}\n\nCurrent Input: {input}") for agent in self.layers[layer]]
+        return asyncio.run(self.process_layer_async(input, layer))
 
-    def synthesize_layer_outputs(self, layer_outputs: List[str]) -> str:
+    async def synthesize_layer_outputs_async(self, layer_outputs: List[str]) -> str:
+        with span("layer_synthesis"), stage("layer_synthesis"):
+            return await self._synthesize_layer_outputs_async(layer_outputs)
+
+    async def _synthesize_layer_outputs_async(self, layer_outputs: List[str]) -> str:
         system_prompt = """You are an AI assistant synthesizing multiple agent outputs. Each agent has access to internet search results and Tree of Thought processes. 
         Combine the following outputs into a coherent response, highlighting key insights and differences. If you need more information, you can request another internet search."""
         user_prompt = "\n".join([f"Agent {i+1} output: {output}" for i, output in enumerate(layer_outputs)])
         user_prompt += "\n\nSynthesize these outputs. If you need more information, say 'SEARCH:' followed by your search query:"
         
         try:
-            response = make_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=4096)
+            response = await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=4096)
             
             # Check if the response includes a search request
             if "SEARCH:" in response:
                 search_query = response.split("SEARCH:", 1)[1].strip()
-                new_info = self.layers[0][0].search_internet(search_query)  # Use the first agent to perform the search
+                new_info = await run_in_thread(self.layers[0][0].search_internet, search_query)  # Use the first agent to perform the search
                 
                 if "Error" in new_info:
                     logger.warning(f"Error during internet search: {new_info}")
@@ -36,22 +84,71 @@ class MixtureOfAgents:
                 else:
                     follow_up_prompt = f"{response}\n\nAdditional Internet Information:\n{new_info}\n\nNow, provide your final synthesis:"
                 
-                response = make_api_call(system=system_prompt, messages=[{"role": "user", "content": follow_up_prompt}], max_tokens=4096)
+                response = await make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": follow_up_prompt}], max_tokens=4096)
             
             return response
         except AnthropicAPIError as e:
             logger.error(f"Error in synthesis: {str(e)}")
             return f"Error in synthesis: {str(e)}"
 
-    def process(self, input: str) -> Tuple[str, List[str]]:
-        self.conversation_history.append({"role": "user", "content": input})
+    def synthesize_layer_outputs(self, layer_outputs: List[str]) -> str:
+        return asyncio.run(self.synthesize_layer_outputs_async(layer_outputs))
+
+    def _agents_agree(self, layer_outputs: List[str]) -> bool:
+        if self.early_exit_threshold is None or len(layer_outputs) < 2:
+            return False
+        if any(output.startswith("Error") for output in layer_outputs):
+            return False
+        score = agreement(layer_outputs)
+        logger.info(f"Agent agreement {score:.2f} (early exit threshold {self.early_exit_threshold})")
+        return score >= self.early_exit_threshold
+
+    @staticmethod
+    def _best_output(layer_outputs: List[str]) -> str:
+        # The agent output closest to all the others stands in for a synthesis.
+        usable = [output for output in layer_outputs if is_complete(output)] or layer_outputs
+        return usable[medoid(usable)]
+
+    def add_to_history(self, user_input: str, output: str):
+        self.conversation_history.append({"role": "user", "content": user_input})
+        self.conversation_history.append({"role": "assistant", "content": output})
+
+    async def process_async(self, input: str, on_progress: Optional[ProgressCallback] = None,
+                            record_history: bool = True, context: Optional[str] = None) -> Tuple[str, List[str]]:
         all_outputs = []
         current_input = input
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # The conversation context is the same for every layer and agent in this turn.
+        if context is None:
+            context = await self.memory.context_async(self.conversation_history)
 
+        layer_time = 0.0
         for layer in range(self.num_layers):
-            layer_outputs = self.process_layer(current_input, layer)
+            remaining = remaining_time()
+            if layer > 0 and remaining is not None and remaining < layer_time:
+                # Another layer would take about as long as the last one, so stop at the answer we have.
+                degrade(f"layers {layer + 1}-{self.num_layers}", f"{remaining:.1f}s left, the last layer took {layer_time:.1f}s")
+                report_progress(on_progress, "deadline", f"Layer {layer + 1}/{self.num_layers}: out of time, skipping the remaining layers", layer=layer)
+                annotate(deadline_skipped_layers=self.num_layers - layer)
+                break
+            start_time = time.perf_counter()
+            layer_outputs = await self.process_layer_async(current_input, layer, semaphore, on_progress, context)
             all_outputs.extend(layer_outputs)
-            current_input = self.synthesize_layer_outputs(layer_outputs)
+            self.last_layers_run = layer + 1
+            if self._agents_agree(layer_outputs):
+                report_progress(on_progress, "early_exit", f"Layer {layer + 1}/{self.num_layers}: agents agree, skipping the remaining layers", layer=layer)
+                annotate(early_exit_layer=layer)
+                current_input = layer_outputs[medoid(layer_outputs)]
+                break
+            report_progress(on_progress, "layer_synthesis", f"Layer {layer + 1}/{self.num_layers}: synthesizing agent outputs", layer=layer)
+            current_input = await within_deadline(
+                checkpointed(f"synthesis/L{layer}", lambda: self.synthesize_layer_outputs_async(layer_outputs), keep=is_complete),
+                lambda: self._best_output(layer_outputs), f"synthesis of layer {layer + 1}")
+            layer_time = time.perf_counter() - start_time
+
+        if record_history:
+            self.add_to_history(input, current_input)
+        return current_input, all_outputs
 
-        self.conversation_history.append({"role": "assistant", "content": current_input})
-        return current_input, all_outputs
\ No newline at end of file
+    def process(self, input: str) -> Tuple[str, List[str]]:
+        return asyncio.run(self.process_async(input))
\ No newline at end of file
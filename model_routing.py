@@ -0,0 +1,162 @@
+import contextvars
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Iterator, Optional, Tuple
+from tracing import annotate, record
+
+logger = logging.getLogger(__name__)
+
+LARGE_MODEL = os.getenv("LARGE_MODEL", "claude-3-5-sonnet-20240620")
+SMALL_MODEL = os.getenv("SMALL_MODEL", "claude-3-5-haiku-20241022")
+
+# US dollars per million tokens: input, output, prompt cache write, prompt cache read.
+MODEL_PRICES: Dict[str, Tuple[float, float, float, float]] = {
+    "claude-3-5-sonnet-20240620": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-5-sonnet-20241022": (3.00, 15.00, 3.75, 0.30),
+    "claude-3-5-haiku-20241022": (0.80, 4.00, 1.00, 0.08),
+    "claude-3-haiku-20240307": (0.25, 1.25, 0.30, 0.03),
+    "claude-3-opus-20240229": (15.00, 75.00, 18.75, 1.50),
+}
+
+def estimate_cost(model: str, usage: Dict[str, float]) -> float:
+    """Dollar cost of a call's token usage; 0 for models missing from MODEL_PRICES."""
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return 0.0
+    input_price, output_price, cache_write_price, cache_read_price = prices
+    return (usage.get("input_tokens", 0) * input_price + usage.get("output_tokens", 0) * output_price
+            + usage.get("cache_write_tokens", 0) * cache_write_price + usage.get("cache_read_tokens", 0) * cache_read_price) / 1e6
+
+class StageRoute:
+    """How the API calls of one pipeline stage are made. A max_tokens of None keeps the call site's own limit."""
+
+    def __init__(self, model: str = LARGE_MODEL, max_tokens: Optional[int] = None, temperature: float = 0.7,
+                 escalate_to: Optional[str] = None):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.escalate_to = escalate_to  # Model to retry on when an output fails the stage's validation
+
+    def escalated(self) -> "StageRoute":
+        return StageRoute(self.escalate_to or self.model, self.max_tokens, self.temperature)
+
+    def __repr__(self) -> str:
+        return (f"StageRoute(model={self.model!r}, max_tokens={self.max_tokens}, temperature={self.temperature}, "
+                f"escalate_to={self.escalate_to!r})")
+
+# Inner-loop stages run many times per request and produce short, checkable output, so they go to
+# the small model and escalate only when it gets the format wrong.
+DEFAULT_ROUTES = {
+    "tot_expansion": StageRoute(SMALL_MODEL, escalate_to=LARGE_MODEL),
+    "tot_synthesis": StageRoute(SMALL_MODEL, escalate_to=LARGE_MODEL),
+    "agent": StageRoute(LARGE_MODEL),
+    "layer_synthesis": StageRoute(LARGE_MODEL),
+    "final_synthesis": StageRoute(LARGE_MODEL),
+}
+
+_STAT_KEYS = ("input_tokens", "output_tokens", "cache_read_tokens", "cache_write_tokens")
+
+class ModelRouter:
+    """
+    Routes each pipeline stage's API calls to a model, max_tokens and temperature, and keeps
+    per-stage totals of calls, escalations, latency, tokens and cost. Stages without a route,
+    and calls made outside any stage, use `default`.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, StageRoute]] = None, default: Optional[StageRoute] = None):
+        self.routes = dict(DEFAULT_ROUTES if routes is None else routes)
+        self.default = default or StageRoute()
+        self._stats: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def route(self, stage: Optional[str]) -> StageRoute:
+        return self.routes.get(stage, self.default) if stage else self.default
+
+    def _entry(self, stage: Optional[str]) -> Dict[str, float]:
+        return self._stats.setdefault(stage or "other", {"calls": 0, "escalations": 0, "latency": 0.0, "cost": 0.0,
+                                                          **{key: 0 for key in _STAT_KEYS}})
+
+    def account(self, stage: Optional[str], model: str, usage: Dict[str, float], latency: float) -> float:
+        """Add one call's usage to its stage's totals; returns its cost."""
+        cost = estimate_cost(model, usage)
+        with self._lock:
+            entry = self._entry(stage)
+            entry["calls"] += 1
+            entry["latency"] += latency
+            entry["cost"] += cost
+            for key in _STAT_KEYS:
+                entry[key] += usage.get(key, 0)
+        return cost
+
+    def count_escalation(self, stage: Optional[str]):
+        with self._lock:
+            self._entry(stage)["escalations"] += 1
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            return {stage: dict(entry) for stage, entry in self._stats.items()}
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+def _parse_routes(spec: str) -> Dict[str, StageRoute]:
+    routes = dict(DEFAULT_ROUTES)
+    for stage, options in json.loads(spec).items():
+        base = routes.get(stage, StageRoute())
+        routes[stage] = StageRoute(options.get("model", base.model), options.get("max_tokens", base.max_tokens),
+                                   options.get("temperature", base.temperature), options.get("escalate_to", base.escalate_to))
+    return routes
+
+def _create_model_router() -> ModelRouter:
+    if os.getenv("MODEL_ROUTING", "1") == "0":
+        return ModelRouter(routes={})
+    spec = os.getenv("MODEL_ROUTES")
+    return ModelRouter(_parse_routes(spec) if spec else None)
+
+model_router = _create_model_router()
+
+# (stage name, route) of the API calls made in this context.
+_current_stage: contextvars.ContextVar = contextvars.ContextVar("current_stage", default=(None, None))
+
+@contextmanager
+def stage(name: str) -> Iterator[StageRoute]:
+    """Route the API calls made in this context as pipeline stage `name`."""
+    route = model_router.route(name)
+    token = _current_stage.set((name, route))
+    try:
+        yield route
+    finally:
+        _current_stage.reset(token)
+
+def current_stage() -> Tuple[Optional[str], StageRoute]:
+    name, route = _current_stage.get()
+    return name, route or model_router.default
+
+def account(usage: Dict[str, float], latency: float):
+    """Charge a finished call to the current stage, and record its model and cost on the current span."""
+    name, route = current_stage()
+    cost = model_router.account(name, route.model, usage, latency)
+    annotate(stage=name, model=route.model)
+    record(cost=cost)
+
+async def escalating(call: Callable[[], Awaitable[str]], validate: Callable[[str], bool]) -> str:
+    """
+    call() on the current stage's model. If its output fails `validate` and the stage has a model
+    to escalate to, call() again on that model and return the second output instead.
+    """
+    text = await call()
+    name, route = current_stage()
+    if route.escalate_to is None or route.escalate_to == route.model or validate(text):
+        return text
+    logger.info(f"Escalating {name} from {route.model} to {route.escalate_to}: output failed validation")
+    model_router.count_escalation(name)
+    record(escalations=1)
+    token = _current_stage.set((name, route.escalated()))
+    try:
+        return await call()
+    finally:
+        _current_stage.reset(token)
\ No newline at end of file
@@ -0,0 +1,8 @@
+from typing import Any, Callable, Dict, Optional
+
+# Progress events are plain dicts: {"type": "progress", "stage": ..., "message": ..., **details}.
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+def report_progress(on_progress: Optional[ProgressCallback], stage: str, message: str, **details: Any):
+    if on_progress is not None:
+        on_progress({"type": "progress", "stage": stage, "message": message, **details})
\ No newline at end of file
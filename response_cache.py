@@ -0,0 +1,117 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+def make_cache_key(**request: Any) -> str:
+    """Content address for a request: any change to model, prompts or sampling settings gives a new key."""
+    payload = json.dumps(request, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Two-tier cache of API responses: an in-memory LRU in front of an optional SQLite file.
+
+    Entries older than `ttl` seconds are ignored and eventually evicted. The SQLite tier is
+    trimmed to `max_disk_bytes`, dropping the least recently used entries first.
+    """
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 86400, max_memory_entries: int = 256,
+                 max_disk_bytes: int = 50 * 1024 * 1024):
+        self.path = path
+        self.ttl = ttl
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_bytes = max_disk_bytes
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if path:
+            with closing(self._connect()) as conn, conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS responses "
+                             "(key TEXT PRIMARY KEY, value TEXT, created REAL, accessed REAL, size INTEGER)")
+                conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _remember(self, key: str, value: str, created: float):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[1] < self.ttl:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self._memory.pop(key, None)
+
+        if self.path:
+            conn = self._connect()
+            try:
+                with conn:
+                    row = conn.execute("SELECT value, created FROM responses WHERE key = ? AND created > ?",
+                                       (key, now - self.ttl)).fetchone()
+                    if row:
+                        conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            finally:
+                conn.close()
+            if row:
+                with self._lock:
+                    self._remember(key, row[0], row[1])
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if not self.path:
+            return
+
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO responses (key, value, created, accessed, size) VALUES (?, ?, ?, ?, ?)",
+                             (key, value, now, now, len(value.encode("utf-8"))))
+                conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,))
+                conn.execute("DELETE FROM responses WHERE key IN (SELECT key FROM "
+                             "(SELECT key, SUM(size) OVER (ORDER BY accessed DESC) AS total FROM responses) "
+                             "WHERE total > ?)", (self.max_disk_bytes,))
+        finally:
+            conn.close()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self.hits = self.disk_hits = self.misses = 0
+        if self.path:
+            conn = self._connect()
+            try:
+                with conn:
+                    conn.execute("DELETE FROM responses")
+            finally:
+                conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "memory_entries": len(self._memory)}
\ No newline at end of file
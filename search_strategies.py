@@ -0,0 +1,190 @@
+import heapq
+import itertools
+import logging
+import time
+from collections import deque
+from typing import List, Optional, Tuple, Union
+from similarity import agreement
+from thought import Thought, ThoughtTree
+
+logger = logging.getLogger(__name__)
+
+Node = Tuple[Thought, int]
+
+class SearchBudget:
+    def __init__(self, max_expansions: Optional[int], time_budget: Optional[float]):
+        self.max_expansions = max_expansions
+        self.deadline = time.monotonic() + time_budget if time_budget is not None else None
+        self.expansions = 0
+
+    def remaining_expansions(self) -> Optional[int]:
+        if self.max_expansions is None:
+            return None
+        return max(self.max_expansions - self.expansions, 0)
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def exhausted(self) -> bool:
+        return self.remaining_expansions() == 0 or self.remaining_time() == 0.0
+
+    def take(self, nodes: List[Node]) -> Tuple[List[Node], List[Node]]:
+        """Split nodes into those the remaining expansion budget allows and the rest."""
+        remaining = self.remaining_expansions()
+        if remaining is None or len(nodes) <= remaining:
+            return nodes, []
+        return nodes[:remaining], nodes[remaining:]
+
+def thought_score(thought: Thought) -> float:
+    return thought.score if thought.score is not None else 0.5
+
+class SearchStrategy:
+    """
+    Decides which Tree of Thought nodes get expanded and in what order.
+
+    Strategies only choose nodes; the API calls go through TreeOfThought.expand_nodes, which
+    records them against the SearchBudget and adds the new thoughts to the ThoughtTree.
+    """
+
+    name = None
+
+    def __init__(self, stop_on_sure: bool = True):
+        self.stop_on_sure = stop_on_sure
+
+    def is_leaf(self, tot, thought: Thought, depth: int) -> bool:
+        return depth == tot.max_depth or thought.evaluation == 'sure'
+
+    def converged(self, tot, nodes: List[Node]) -> bool:
+        """True when the thoughts all say much the same thing, so expanding them further is unlikely to help."""
+        if tot.convergence_threshold is None or len(nodes) < 2:
+            return False
+        if agreement([thought.content for thought, _ in nodes]) < tot.convergence_threshold:
+            return False
+        logger.info(f"Tree of Thought converged after {len(nodes)} similar thoughts; skipping further expansion")
+        return True
+
+    async def search(self, tot, tree: ThoughtTree, budget: SearchBudget) -> List[Thought]:
+        raise NotImplementedError
+
+class BFSStrategy(SearchStrategy):
+    name = "bfs"
+
+    def __init__(self, stop_on_sure: bool = False):
+        super().__init__(stop_on_sure)
+
+    async def search(self, tot, tree: ThoughtTree, budget: SearchBudget) -> List[Thought]:
+        frontier = deque([(tree.root, 0)])
+        solution = []
+
+        while frontier and len(solution) < tot.branching_factor:
+            if budget.exhausted():
+                logger.info(f"Tree of Thought budget exhausted after {budget.expansions} expansions")
+                # Fall back to the deepest thoughts explored so far rather than returning nothing.
+                solution.extend(thought for thought, _ in list(frontier)[:tot.branching_factor - len(solution)])
+                break
+
+            # In parallel mode the frontier only ever holds one depth, so this pops the whole level.
+            level = [frontier.popleft() for _ in range(len(frontier) if tot.parallel else 1)]
+            to_expand = []
+            for current_thought, depth in level:
+                if self.is_leaf(tot, current_thought, depth):
+                    if len(solution) < tot.branching_factor:
+                        solution.append(current_thought)
+                else:
+                    to_expand.append((current_thought, depth))
+
+            if self.stop_on_sure and any(t.evaluation == 'sure' for t in solution):
+                break
+            if len(solution) >= tot.branching_factor or not to_expand:
+                continue
+            if self.converged(tot, to_expand):
+                solution.extend(thought for thought, _ in to_expand[:tot.branching_factor - len(solution)])
+                break
+
+            to_expand, deferred = budget.take(to_expand)
+            frontier.extendleft(reversed(deferred))
+            frontier.extend(await tot.expand_nodes(tree, to_expand, budget))
+
+        return solution
+
+class BeamSearchStrategy(SearchStrategy):
+    name = "beam"
+
+    def __init__(self, width: int = 2, stop_on_sure: bool = True):
+        super().__init__(stop_on_sure)
+        self.width = width
+
+    async def search(self, tot, tree: ThoughtTree, budget: SearchBudget) -> List[Thought]:
+        frontier = [(tree.root, 0)]
+        solution = []
+
+        while frontier and len(solution) < tot.branching_factor:
+            # sorted() is stable, so equally scored thoughts keep the order the model gave them.
+            beam = sorted(frontier, key=lambda node: thought_score(node[0]), reverse=True)[:self.width]
+            if budget.exhausted():
+                logger.info(f"Tree of Thought budget exhausted after {budget.expansions} expansions")
+                solution.extend(thought for thought, _ in beam)
+                break
+
+            to_expand = []
+            for current_thought, depth in beam:
+                if self.is_leaf(tot, current_thought, depth):
+                    solution.append(current_thought)
+                else:
+                    to_expand.append((current_thought, depth))
+
+            if self.stop_on_sure and any(t.evaluation == 'sure' for t in solution):
+                break
+            if self.converged(tot, to_expand):
+                solution.extend(thought for thought, _ in to_expand)
+                break
+
+            to_expand, deferred = budget.take(to_expand)
+            frontier = deferred + await tot.expand_nodes(tree, to_expand, budget)
+
+        solution.sort(key=thought_score, reverse=True)
+        return solution[:tot.branching_factor]
+
+class BestFirstStrategy(SearchStrategy):
+    name = "best_first"
+
+    async def search(self, tot, tree: ThoughtTree, budget: SearchBudget) -> List[Thought]:
+        counter = itertools.count()  # Tie-breaker so the heap never compares Thought objects
+        heap = [(-1.0, next(counter), tree.root, 0)]
+        solution = []
+
+        while heap and len(solution) < tot.branching_factor:
+            if budget.exhausted():
+                logger.info(f"Tree of Thought budget exhausted after {budget.expansions} expansions")
+                best = heapq.nsmallest(tot.branching_factor - len(solution), heap)
+                solution.extend(thought for _, _, thought, _ in best)
+                break
+
+            _, _, current_thought, depth = heapq.heappop(heap)
+            if self.is_leaf(tot, current_thought, depth):
+                solution.append(current_thought)
+                if self.stop_on_sure and current_thought.evaluation == 'sure':
+                    break
+                continue
+
+            children = await tot.expand_nodes(tree, [(current_thought, depth)], budget)
+            if self.converged(tot, children):
+                solution.extend(thought for thought, _ in children[:tot.branching_factor - len(solution)])
+                break
+            for child, child_depth in children:
+                heapq.heappush(heap, (-thought_score(child), next(counter), child, child_depth))
+
+        return solution
+
+STRATEGIES = {strategy.name: strategy for strategy in (BFSStrategy, BeamSearchStrategy, BestFirstStrategy)}
+
+def get_search_strategy(strategy: Union[str, SearchStrategy, None]) -> SearchStrategy:
+    if strategy is None:
+        return BFSStrategy()
+    if isinstance(strategy, SearchStrategy):
+        return strategy
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown search strategy '{strategy}'. Expected one of: {', '.join(STRATEGIES)}")
+    return STRATEGIES[strategy]()
\ No newline at end of file
@@ -0,0 +1,62 @@
+import hashlib
+import random
+import re
+from itertools import combinations
+from typing import List, Optional, Sequence, Set, Tuple
+
+# Parameters of the MinHash permutations h(x) = (a * x + b) mod p, fixed so signatures are comparable across runs.
+_MERSENNE_PRIME = (1 << 61) - 1
+_random = random.Random(1)
+_PERMUTATIONS = [(_random.randrange(1, _MERSENNE_PRIME), _random.randrange(0, _MERSENNE_PRIME)) for _ in range(256)]
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    """Word n-grams of the lower-cased text, ignoring punctuation."""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+def minhash(shingle_set: Set[str], num_hashes: int = 128) -> Tuple[int, ...]:
+    """MinHash signature; the fraction of equal positions in two signatures estimates their Jaccard similarity."""
+    if not shingle_set:
+        return ()
+    hashes = [int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big") for s in shingle_set]
+    return tuple(min((a * x + b) % _MERSENNE_PRIME for x in hashes) for a, b in _PERMUTATIONS[:num_hashes])
+
+def minhash_similarity(a: Tuple[int, ...], b: Tuple[int, ...]) -> float:
+    if not a or not b:
+        return 0.0
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+def pairwise_similarities(texts: Sequence[str], shingle_size: int = 2, num_hashes: Optional[int] = 128) -> List[List[float]]:
+    """
+    Similarity matrix of the texts. With `num_hashes` set, Jaccard similarity is estimated from
+    MinHash signatures, which keeps long texts cheap to compare; with None it is computed exactly.
+    """
+    sets = [shingles(text, shingle_size) for text in texts]
+    if num_hashes is None:
+        signatures, similarity = sets, jaccard
+    else:
+        signatures, similarity = [minhash(s, num_hashes) for s in sets], minhash_similarity
+    matrix = [[1.0] * len(texts) for _ in texts]
+    for i, j in combinations(range(len(texts)), 2):
+        matrix[i][j] = matrix[j][i] = similarity(signatures[i], signatures[j])
+    return matrix
+
+def agreement(texts: Sequence[str], shingle_size: int = 2, num_hashes: Optional[int] = 128) -> float:
+    """Mean pairwise similarity of the texts, from 0 (nothing in common) to 1 (identical wording)."""
+    if len(texts) < 2:
+        return 1.0
+    matrix = pairwise_similarities(texts, shingle_size, num_hashes)
+    pairs = list(combinations(range(len(texts)), 2))
+    return sum(matrix[i][j] for i, j in pairs) / len(pairs)
+
+def medoid(texts: Sequence[str], shingle_size: int = 2, num_hashes: Optional[int] = 128) -> int:
+    """Index of the text most similar to all the others: the best single representative of the group."""
+    matrix = pairwise_similarities(texts, shingle_size, num_hashes)
+    return max(range(len(texts)), key=lambda i: sum(matrix[i]))
\ No newline at end of file
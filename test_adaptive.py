@@ -0,0 +1,116 @@
+import pytest
+from agent import Agent
+from ai_assistant import AIAssistant, is_trivial_input
+from fake_backends import FakeAnthropic, install_fake_backends
+from mixture_of_agents import MixtureOfAgents
+from similarity import agreement, jaccard, medoid, minhash, minhash_similarity, shingles
+from tree_of_thought import TreeOfThought
+
+PARIS = "The capital of France is Paris, which is also its largest city."
+PARIS_AGAIN = "Paris is the capital of France, which is also its largest city."
+UNRELATED = "Photosynthesis converts light energy into chemical energy in plants."
+AI_ANSWER = ("Artificial intelligence is the ability of computers to perform tasks that normally need human intelligence, "
+             "such as understanding language, recognising images and making decisions. Systems learn patterns from large amounts of data.")
+AI_ANSWER_REWORDED = ("Artificial intelligence means computers doing tasks that usually need human intelligence, like understanding "
+                      "language, recognising images or making decisions. These systems learn patterns from large amounts of data.")
+AI_ANSWER_DIFFERENT = ("AI is about building machines that can think and learn. For example, a phone assistant answers questions "
+                       "and a photo app recognises faces.")
+STEP = "Define artificial intelligence as computers performing tasks that normally need human intelligence."
+STEP_REWORDED = "Define artificial intelligence as machines doing tasks that normally require human intelligence."
+OTHER_STEP = "Give everyday examples such as voice assistants and recommendation systems."
+
+def test_similarity_measures():
+    assert agreement([PARIS, PARIS]) == 1.0
+    assert agreement([PARIS, UNRELATED]) < 0.1
+    assert agreement([PARIS, PARIS_AGAIN], num_hashes=None) > agreement([PARIS, UNRELATED], num_hashes=None)
+    assert medoid([UNRELATED, PARIS, PARIS_AGAIN]) in (1, 2)
+
+def test_reworded_answers_reach_the_app_threshold():
+    # main.py sets early_exit_threshold=0.25: a reworded answer scores about 0.3, a differently worded one 0.
+    assert agreement([AI_ANSWER, AI_ANSWER_REWORDED]) == pytest.approx(0.3, abs=0.05)
+    assert agreement([AI_ANSWER, AI_ANSWER_REWORDED]) >= 0.25 > agreement([AI_ANSWER, AI_ANSWER_DIFFERENT])
+    assert agreement([PARIS, PARIS_AGAIN]) < 0.7
+
+def test_reworded_thoughts_reach_the_app_threshold():
+    # main.py sets convergence_threshold=0.25: a reworded next step scores about 0.4, a different step 0.
+    assert agreement([STEP, STEP_REWORDED]) == pytest.approx(0.4, abs=0.05)
+    assert agreement([STEP, STEP_REWORDED]) >= 0.25 > agreement([STEP, OTHER_STEP])
+
+def test_minhash_estimates_jaccard():
+    a = shingles(" ".join(f"word{i}" for i in range(300)))
+    b = shingles(" ".join(f"word{i}" for i in range(100, 400)))
+    assert abs(minhash_similarity(minhash(a, 256), minhash(b, 256)) - jaccard(a, b)) < 0.1
+
+@pytest.mark.parametrize("text,expected", [
+    ("What is the capital of France?", True),
+    ("Count from 1 to 5.", True),
+    ("Explain the concept of artificial intelligence in simple terms.", False),
+    ("What is the latest news on the Mars rover?", False),
+    ("Compare heat pumps and gas boilers for a small flat.", False),
+    ("Plan the electrics for a 3 bedroom semi-detached house in the UK, including circuits and sockets.", False),
+])
+def test_trivial_inputs(text, expected):
+    assert is_trivial_input(text) == expected
+
+@pytest.fixture
+def agent_outputs(fake_api_call, monkeypatch):
+    calls = {"synthesis": 0, "agents": 0}
+    outputs = {}
+
+    def synthesize(system, messages):
+        calls["synthesis"] += 1
+        return "Synthesized answer"
+
+    async def fake_process_async(self, input, on_progress=None):
+        calls["agents"] += 1
+        return outputs.get(self.name, PARIS)
+
+    fake_api_call(synthesize)
+    monkeypatch.setattr(Agent, "process_async", fake_process_async)
+    return calls, outputs
+
+def test_moa_exits_early_when_agents_agree(agent_outputs):
+    calls, _ = agent_outputs
+    moa = MixtureOfAgents(num_layers=3, agents_per_layer=2, tot_depth=1, early_exit_threshold=0.8)
+    final_output, all_outputs = moa.process("What is the capital of France?")
+    assert final_output == PARIS
+    assert moa.last_layers_run == 1
+    assert calls == {"synthesis": 0, "agents": 2}
+
+def test_moa_runs_every_layer_when_agents_disagree(agent_outputs):
+    calls, outputs = agent_outputs
+    outputs["L0A1"] = UNRELATED
+    outputs["L1A1"] = UNRELATED
+    moa = MixtureOfAgents(num_layers=2, agents_per_layer=2, tot_depth=1, early_exit_threshold=0.8)
+    final_output, _ = moa.process("Question")
+    assert final_output == "Synthesized answer"
+    assert moa.last_layers_run == 2
+    assert calls == {"synthesis": 2, "agents": 4}
+
+def test_tot_stops_expanding_when_thoughts_converge(fake_api_call):
+    calls = fake_api_call(lambda system, messages: f"Thought 1: {PARIS} - Evaluation: maybe\nThought 2: {PARIS_AGAIN} - Evaluation: maybe")
+    converging = TreeOfThought(max_depth=3, branching_factor=2, convergence_threshold=0.3)
+    assert [t.content for t in converging.search("Capital of France?")] == [PARIS, PARIS_AGAIN]
+    assert len(calls) == 1
+
+    calls.clear()
+    TreeOfThought(max_depth=3, branching_factor=2).search("Capital of France?")
+    assert len(calls) == 1 + 2 + 4
+
+def test_fast_path_answers_trivial_input_with_one_call():
+    fake_anthropic = FakeAnthropic()
+    with install_fake_backends(fake_anthropic) as backends:
+        assistant = AIAssistant(fast_path=True)
+        response, history = assistant.respond("What is the capital of France?")
+        assert response.startswith("Canned answer")
+        assert fake_anthropic.calls == 1 and backends.tavily.calls == 0
+        assert [msg["role"] for msg in history] == ["user", "assistant"]
+
+        events = list(assistant.respond_stream("And of Germany?"))
+        assert events[0]["stage"] == "fast_path"
+        assert events[-1]["type"] == "done" and events[-1]["response"].startswith("Canned answer")
+        assert fake_anthropic.calls == 2
+        assert len(assistant.get_conversation_history()) == 4
+
+        assistant.respond("Explain the concept of artificial intelligence in simple terms.")
+        assert fake_anthropic.calls > 10
\ No newline at end of file
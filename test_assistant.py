@@ -22,12 +22,14 @@ def test_ai_assistant():
             start_time = time.time()
             
             try:
-                response = assistant.respond(input_text, concise=concise)
+                response, _, trace = assistant.respond_with_trace(input_text, concise=concise)
                 end_time = time.time()
                 
                 logger.info(f"{'Concise' if concise else 'Comprehensive'} Response:")
                 logger.info(response)
                 logger.info(f"Time taken: {end_time - start_time:.2f} seconds")
+                for name, totals in trace.summary().items():
+                    logger.info(f"  {name}: {totals}")
             
             except Exception as e:
                 logger.error(f"Error occurred while processing input '{input_text}': {str(e)}")
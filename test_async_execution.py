@@ -0,0 +1,50 @@
+import time
+import pytest
+from agent import Agent
+from mixture_of_agents import MixtureOfAgents
+
+CALL_LATENCY = 0.05
+
+TOT_RESPONSE = """Thought 1: First idea - Evaluation: maybe
+Thought 2: Second idea - Evaluation: maybe
+Synthesis: Both ideas are plausible"""
+
+@pytest.fixture
+def fake_api(fake_api_call, monkeypatch):
+    def reply(system, messages):
+        if system.startswith("Generate and evaluate"):
+            return TOT_RESPONSE
+        return "Agent answer"
+
+    def fake_search_internet(self, query):
+        time.sleep(CALL_LATENCY)
+        return '"search results"'
+
+    monkeypatch.setattr(Agent, "search_internet", fake_search_internet)
+    return fake_api_call(reply, latency=CALL_LATENCY)
+
+def test_sync_wrapper_matches_async(fake_api):
+    moa = MixtureOfAgents(num_layers=1, agents_per_layer=2, tot_depth=1, tot_branching=2)
+    final_output, all_outputs = moa.process("What is the capital of France?")
+    assert final_output == "Agent answer"
+    assert all_outputs == ["Agent answer", "Agent answer"]
+    assert [msg["role"] for msg in moa.conversation_history] == ["user", "assistant"]
+
+def test_layer_agents_run_concurrently(fake_api):
+    moa = MixtureOfAgents(num_layers=1, agents_per_layer=4, tot_depth=1, tot_branching=2, max_concurrency=4)
+    start_time = time.perf_counter()
+    outputs = moa.process_layer("Question", 0)
+    elapsed = time.perf_counter() - start_time
+
+    assert len(outputs) == 4
+    # Each agent makes three sequential calls (ToT expansion, ToT synthesis, response); run one after
+    # another the four agents would need twelve.
+    assert elapsed < CALL_LATENCY * 8
+
+def test_max_concurrency_limits_fan_out(fake_api):
+    moa = MixtureOfAgents(num_layers=1, agents_per_layer=4, tot_depth=1, tot_branching=2, max_concurrency=1)
+    start_time = time.perf_counter()
+    moa.process_layer("Question", 0)
+    elapsed = time.perf_counter() - start_time
+
+    assert elapsed >= CALL_LATENCY * 12
\ No newline at end of file
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import time
+from ai_assistant import AIAssistant
+from api_utils import make_api_call_async, run_in_thread
+from batch_runner import BatchRunner, MessageBatcher, load_questions
+from fake_backends import FakeAnthropic, install_fake_backends
+
+QUESTIONS = [
+    {"id": "1", "question": "What is the capital of France?"},
+    {"id": "2", "question": "Explain the concept of artificial intelligence in simple terms."},
+    {"id": "3", "question": "Count from 1 to 5."},
+]
+
+def new_assistant() -> AIAssistant:
+    return AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=2)
+
+def run(questions, fake_anthropic=None, checkpoint_path=None, output_path=None):
+    with install_fake_backends(fake_anthropic) as backends:
+        runner = BatchRunner(new_assistant, checkpoint_path, poll_interval=0.01)
+        results = runner.run(questions, output_path)
+    return results, runner.batcher, backends.anthropic
+
+def test_all_calls_go_through_batches_stage_by_stage():
+    one, one_batcher, _ = run(QUESTIONS[:1])
+    three, batcher, fake = run(QUESTIONS)
+
+    assert [result["id"] for result in three] == ["1", "2", "3"]
+    assert all(result["answer"].startswith("Canned answer") for result in three)
+    assert fake.calls == fake.batches.requests == batcher.stats["requests"]
+    # More questions make the batches bigger, not more numerous.
+    assert batcher.stages == one_batcher.stages
+    assert batcher.stats["requests"] > one_batcher.stats["requests"]
+
+def test_batch_waits_for_pipelines_busy_in_a_thread():
+    async def pipeline(i: int) -> str:
+        await run_in_thread(time.sleep, 0.5 * i)  # Such as a web search
+        return await make_api_call_async(system="You are helpful.", messages=[{"role": "user", "content": f"Question {i}"}])
+
+    with install_fake_backends():
+        batcher = MessageBatcher(poll_interval=0.01)
+        answers = asyncio.run(batcher.run([pipeline(i) for i in range(3)]))
+    assert all(answer.startswith("Canned answer") for answer in answers)
+    assert batcher.stats["batches"] == 1 and batcher.stats["requests"] == 3
+
+def test_resume_replays_checkpointed_stages(tmp_path):
+    checkpoint, output = str(tmp_path / "checkpoint.jsonl"), str(tmp_path / "answers.jsonl")
+    first, _, _ = run(QUESTIONS, checkpoint_path=checkpoint, output_path=output)
+    stages = {json.loads(line)["stage"] for line in open(checkpoint, encoding="utf-8")}
+    assert len(stages) > 1
+
+    second, batcher, fake = run(QUESTIONS, checkpoint_path=checkpoint)
+    assert second == first
+    assert fake.calls == 0 and batcher.stages == 0
+    assert sorted(json.loads(line)["id"] for line in open(output, encoding="utf-8")) == ["1", "2", "3"]
+
+def test_errored_requests_are_retried_in_a_later_batch():
+    results, batcher, _ = run(QUESTIONS, FakeAnthropic(error_rate=0.1, seed=4))
+    assert batcher.stats["errored"] > 0
+    assert all(result["answer"].startswith("Canned answer") for result in results)
+
+def test_load_questions_accepts_text_and_json_lines(tmp_path):
+    path = tmp_path / "questions.txt"
+    path.write_text('Why is the sky blue?\n\n{"id": "q2", "question": "What is 2 + 2?"}\n', encoding="utf-8")
+    assert load_questions(str(path)) == [{"question": "Why is the sky blue?", "id": "1"}, {"id": "q2", "question": "What is 2 + 2?"}]
\ No newline at end of file
@@ -0,0 +1,141 @@
+import asyncio
+import time
+import pytest
+from ai_assistant import AIAssistant
+from checkpoints import CheckpointStore, checkpoint_run, checkpoint_scope, checkpointed, is_complete
+from deadlines import deadline, within_deadline
+from fake_backends import install_fake_backends
+
+QUESTION = "Explain the concept of artificial intelligence in simple terms."
+
+@pytest.mark.parametrize("on_disk", [False, True])
+def test_store_keeps_stages_per_request(tmp_path, on_disk):
+    store = CheckpointStore(path=str(tmp_path / "checkpoints.db") if on_disk else None, ttl=0.2)
+    store.put("a", "chunk0/agent/L0A0", "first")
+    store.put("a", "chunk0/synthesis/L0", "second")
+    store.put("b", "chunk0/moa", "other")
+    assert list(store.stages("a").items()) == [("chunk0/agent/L0A0", "first"), ("chunk0/synthesis/L0", "second")]
+    store.clear("a")
+    assert store.stages("a") == {} and store.get("b", "chunk0/moa") == "other"
+    time.sleep(0.25)
+    assert store.get("b", "chunk0/moa") is None
+
+def test_only_complete_stages_are_saved_and_dropped_on_success():
+    store = CheckpointStore()
+
+    async def stages():
+        await checkpointed("agent/L0A0", lambda: asyncio.sleep(0, "Agent output"), keep=is_complete)
+        await checkpointed("agent/L0A1", lambda: asyncio.sleep(0, "Error processing input in Agent L0A1"), keep=is_complete)
+        raise RuntimeError("Crashed before the layer synthesis")
+
+    with pytest.raises(RuntimeError):
+        with checkpoint_run(store, "request"), checkpoint_scope("chunk0"):
+            asyncio.run(stages())
+    assert store.stages("request") == {"chunk0/agent/L0A0": "Agent output"}
+
+    with checkpoint_run(store, "request"), checkpoint_scope("chunk0"):
+        assert asyncio.run(checkpointed("agent/L0A0", lambda: asyncio.sleep(0, "Recomputed"))) == "Agent output"
+    assert store.stages("request") == {}
+
+def test_failed_request_resumes_from_last_completed_stage(monkeypatch):
+    store = CheckpointStore()
+    original = AIAssistant._synthesize_final_response_async
+
+    async def failing(self, *args, **kwargs):
+        raise RuntimeError("Connection reset")
+
+    with install_fake_backends() as backends:
+        assistant = AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=1, checkpoints=store)
+        monkeypatch.setattr(AIAssistant, "_synthesize_final_response_async", failing)
+        response, _ = assistant.respond(QUESTION)
+        assert response.startswith("I apologize")
+        assert assistant.get_conversation_history() == []
+        first_calls = backends.anthropic.calls
+
+        monkeypatch.setattr(AIAssistant, "_synthesize_final_response_async", original)
+        response, history = assistant.respond(QUESTION)
+
+    assert response.startswith("Canned answer")
+    assert backends.anthropic.calls - first_calls == 1  # Only the final synthesis is left to do
+    assert len(history) == 2
+    assert store.stages(assistant.request_id(QUESTION)) == {}
+
+def test_assistants_sharing_a_store_keep_their_own_stages(monkeypatch):
+    store = CheckpointStore()
+
+    async def failing(self, *args, **kwargs):
+        raise RuntimeError("Connection reset")
+
+    with install_fake_backends() as backends:
+        small = AIAssistant(num_layers=1, agents_per_layer=2, tot_depth=1, checkpoints=store)
+        with monkeypatch.context() as patched:
+            patched.setattr(AIAssistant, "_synthesize_final_response_async", failing)
+            small.respond(QUESTION)
+        saved = store.stages(small.request_id(QUESTION))
+        calls = backends.anthropic.calls
+
+        large = AIAssistant(num_layers=2, agents_per_layer=3, tot_depth=1, checkpoints=store)
+        response, _ = large.respond(QUESTION)
+
+    assert response.startswith("Canned answer")
+    assert store.resumed == 0 and backends.anthropic.calls - calls > 1
+    # The other assistant finishing doesn't clear this one's stages either.
+    assert saved and store.stages(small.request_id(QUESTION)) == saved
+
+def test_deadline_returns_partial_results(monkeypatch):
+    store = CheckpointStore()
+    original = AIAssistant._synthesize_final_response_async
+
+    async def slow(self, *args, **kwargs):
+        await asyncio.sleep(10)
+
+    with install_fake_backends() as backends:
+        assistant = AIAssistant(num_layers=1, agents_per_layer=2, tot_depth=1, checkpoints=store)
+        monkeypatch.setattr(AIAssistant, "_synthesize_final_response_async", slow)
+        monkeypatch.setattr("ai_assistant.SOFT_DEADLINE", 10)  # Plan past the timeout, so the request is cut off
+        start = time.perf_counter()
+        response, history = assistant.respond(QUESTION, timeout=1)
+        assert time.perf_counter() - start < 3
+        assert response.startswith("I ran out of time") and "Canned answer" in response
+        assert history == []
+
+        monkeypatch.setattr(AIAssistant, "_synthesize_final_response_async", original)
+        calls = backends.anthropic.calls
+        response, _ = assistant.respond(QUESTION)
+    assert response.startswith("Canned answer")
+    assert backends.anthropic.calls - calls == 1
+
+def test_degraded_stages_are_not_saved():
+    store = CheckpointStore()
+
+    async def cut_short():
+        return await within_deadline(asyncio.sleep(5, "Agent output"), lambda: "Tree of Thought synthesis", "agent")
+
+    async def stages():
+        with deadline(0.05):
+            await checkpointed("agent/L0A0", cut_short, keep=is_complete)
+        await checkpointed("agent/L0A1", lambda: asyncio.sleep(0, "Agent output"), keep=is_complete)
+        raise RuntimeError("Ran out of time")
+
+    with pytest.raises(RuntimeError):
+        with checkpoint_run(store, "request"):
+            asyncio.run(stages())
+    assert store.stages("request") == {"agent/L0A1": "Agent output"}
+
+def test_respond_stream_resumes_a_failed_request(monkeypatch):
+    store = CheckpointStore()
+
+    async def failing(self, *args, **kwargs):
+        raise RuntimeError("Connection reset")
+
+    with install_fake_backends() as backends:
+        assistant = AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=1, checkpoints=store)
+        with monkeypatch.context() as patched:
+            patched.setattr(AIAssistant, "_synthesize_final_response_async", failing)
+            assistant.respond(QUESTION)
+        calls = backends.anthropic.calls
+        events = list(assistant.respond_stream(QUESTION))
+
+    assert events[-1]["type"] == "done" and events[-1]["response"].startswith("Canned answer")
+    assert backends.anthropic.calls - calls == 1  # Only the streamed final synthesis is left to do
+    assert store.stages(assistant.request_id(QUESTION)) == {}
\ No newline at end of file
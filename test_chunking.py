@@ -0,0 +1,44 @@
+from types import SimpleNamespace
+import pytest
+import api_utils
+from api_utils import chunk_text, count_tokens, count_tokens_batch
+
+@pytest.fixture
+def word_encoder(monkeypatch):
+    batches = []
+
+    def encode_ordinary_batch(texts):
+        batches.append(list(texts))
+        return [text.split() for text in texts]
+
+    monkeypatch.setattr(api_utils, "get_encoder", lambda: SimpleNamespace(encode_ordinary_batch=encode_ordinary_batch))
+    return batches
+
+def test_chunks_reassemble_to_original_text(word_encoder):
+    text = "The cat sat. The dog ran far away. Birds sing. " * 20
+    chunks = chunk_text(text, max_tokens=10)
+    assert "".join(chunks) == text
+    assert all(count_tokens(chunk) <= 10 for chunk in chunks)
+
+def test_sentences_are_counted_in_one_batch(word_encoder):
+    chunk_text("One. Two. Three. Four.", max_tokens=2)
+    assert word_encoder == [["One. ", "Two. ", "Three. ", "Four."]]
+
+def test_oversized_sentence_gets_its_own_chunk(word_encoder):
+    chunks = chunk_text("a b c d e f. g", max_tokens=3)
+    assert chunks == ["a b c d e f. ", "g"]
+
+def test_short_text_is_a_single_chunk(word_encoder):
+    assert chunk_text("Hello world", max_tokens=100) == ["Hello world"]
+
+def test_claude_counter_does_not_need_tiktoken(monkeypatch):
+    def unavailable():
+        raise AssertionError("tiktoken should not be used")
+
+    monkeypatch.setattr(api_utils, "get_encoder", unavailable)
+    assert count_tokens_batch(["", "abcdefg"], counter="claude") == [0, 2]
+    assert len(chunk_text("x" * 35 + ". " + "y" * 35, max_tokens=11, counter="claude")) == 2
+
+def test_unknown_counter_is_rejected():
+    with pytest.raises(ValueError):
+        count_tokens("text", counter="words")
\ No newline at end of file
@@ -0,0 +1,32 @@
+import os
+import subprocess
+import sys
+import agent
+import api_utils
+from agent import Agent
+
+def test_imports_leave_the_sdks_for_first_use():
+    code = ("import sys, ai_assistant, batch_runner, job_queue\n"
+            "print(','.join(name for name in ('anthropic', 'tavily', 'tiktoken', 'requests') if name in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+    assert result.stdout.strip() == ""
+
+def test_clients_are_created_once(monkeypatch):
+    monkeypatch.setattr(api_utils, "client", None)
+    assert api_utils.get_client() is api_utils.get_client()
+    service = agent.SearchService(api_key="test-key")
+    assert service.client is service.client and service.client.api_key == "test-key"
+
+def test_key_check_is_cached_per_process(monkeypatch):
+    checks = []
+    monkeypatch.setattr(agent, "_key_check", None)
+    monkeypatch.setattr(agent, "_check_tavily_api_key", lambda: checks.append(1) or True)
+    assert Agent.verify_tavily_api_key() and Agent.verify_tavily_api_key()
+    assert len(checks) == 1
+
+    monkeypatch.setattr(agent, "TAVILY_KEY_CHECK_TTL", 0)
+    monkeypatch.setattr(agent, "_key_check", None)
+    Agent.verify_tavily_api_key()
+    Agent.verify_tavily_api_key()
+    assert len(checks) == 3
\ No newline at end of file
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from agent import Agent
+from api_utils import AnthropicAPIError, count_tokens
+from conversation_memory import ConversationMemory
+from mixture_of_agents import MixtureOfAgents
+
+@pytest.fixture
+def summaries(fake_api_call):
+    calls = []
+
+    def reply(system, messages):
+        if not system.startswith("You maintain a running summary"):
+            return "Agent answer"
+        calls.append(messages[0]["content"])
+        return f"summary {len(calls)}"
+
+    fake_api_call(reply)
+    return calls
+
+def conversation(turns: int, answer_words: int = 50):
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"Question {i}?"})
+        history.append({"role": "assistant", "content": " ".join(f"answer{i}" for _ in range(answer_words))})
+    return history
+
+def test_short_conversation_is_kept_verbatim(summaries):
+    memory = ConversationMemory(recent_tokens=1000, counter="claude")
+    context = asyncio.run(memory.context_async(conversation(2, answer_words=5)))
+    assert context.splitlines()[0] == "user: Question 0?"
+    assert "Summary" not in context
+    assert summaries == []
+
+def test_old_messages_are_summarized_incrementally(summaries):
+    memory = ConversationMemory(recent_tokens=200, counter="claude")
+    history = conversation(6)
+    context = asyncio.run(memory.context_async(history))
+    assert context.startswith("Summary of earlier conversation: summary 1")
+    assert "Question 5?" in context and "Question 0?" not in context
+    assert count_tokens(context, "claude") < 300
+    assert "Question 0?" in summaries[0]
+
+    # Cached until the history changes.
+    asyncio.run(memory.context_async(history))
+    assert len(summaries) == 1
+
+    # The next turn only folds the newly evicted messages into the existing summary.
+    history.extend(conversation(8)[12:])
+    asyncio.run(memory.context_async(history))
+    assert len(summaries) == 2
+    assert "summary 1" in summaries[1]
+    assert "Question 0?" not in summaries[1]
+
+def test_long_messages_are_trimmed(summaries):
+    memory = ConversationMemory(recent_tokens=1000, max_message_tokens=50, counter="claude")
+    history = [{"role": "user", "content": "Tell me everything."},
+               {"role": "assistant", "content": "A long sentence about many things. " * 200}]
+    context = asyncio.run(memory.context_async(history))
+    assert context.endswith("[...]")
+    assert count_tokens(context, "claude") < 100
+
+def test_failed_summary_is_retried_next_turn(fake_api_call):
+    def failing_call(system, messages):
+        raise AnthropicAPIError("API call failed")
+
+    fake_api_call(failing_call)
+    memory = ConversationMemory(recent_tokens=200, counter="claude")
+    context = asyncio.run(memory.context_async(conversation(6)))
+    assert "Summary" not in context and "Question 5?" in context
+    assert memory._summarized == 0
+
+def test_context_is_computed_once_per_turn(summaries, monkeypatch):
+    layer_inputs = []
+
+    async def fake_process_async(self, input, on_progress=None):
+        layer_inputs.append(input)
+        return "Agent answer"
+
+    monkeypatch.setattr(Agent, "process_async", fake_process_async)
+    moa = MixtureOfAgents(num_layers=2, agents_per_layer=2, tot_depth=1,
+                          memory=ConversationMemory(recent_tokens=200, counter="claude"))
+    moa.conversation_history.extend(conversation(6))
+    moa.process("Follow-up question")
+
+    assert len(summaries) == 1
+    contexts = {layer_input.split("\n\nCurrent Input:")[0] for layer_input in layer_inputs}
+    assert len(layer_inputs) == 4 and len(contexts) == 1
\ No newline at end of file
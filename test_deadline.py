@@ -0,0 +1,76 @@
+import asyncio
+import time
+import pytest
+from ai_assistant import AIAssistant
+from api_utils import AnthropicAPIError, make_api_call_async
+from checkpoints import CheckpointStore
+from deadlines import deadline, remaining_time, reserve, within_deadline
+from fake_backends import FakeAnthropic, LatencyModel, install_fake_backends
+from tracing import tally
+
+QUESTION = "Explain the concept of artificial intelligence in simple terms."
+
+def test_deadlines_nest_and_reserve_time():
+    assert remaining_time() is None
+    with deadline(10):
+        with deadline(20):
+            assert 9 < remaining_time() <= 10  # The enclosing deadline is sooner
+        with reserve(0.25):
+            assert 7 < remaining_time() <= 7.5
+        with deadline(1):
+            assert remaining_time() <= 1
+    assert remaining_time() is None
+
+def test_within_deadline_cancels_and_falls_back():
+    async def run():
+        with deadline(0.1):
+            slow = await within_deadline(asyncio.sleep(5, "done"), lambda: "fallback", "slow step")
+            after = await within_deadline(asyncio.sleep(0, "done"), lambda: "fallback", "late step")
+        unbounded = await within_deadline(asyncio.sleep(0, "done"), lambda: "fallback", "step")
+        return slow, after, unbounded
+
+    start = time.perf_counter()
+    with tally() as usage:
+        assert asyncio.run(run()) == ("fallback", "fallback", "done")
+    assert time.perf_counter() - start < 1
+    assert usage["degraded"] == 2
+
+def test_retries_stop_at_the_deadline():
+    async def call():
+        with deadline(3):
+            return await make_api_call_async(system="You are helpful.", messages=[{"role": "user", "content": "Hi"}])
+
+    with install_fake_backends(FakeAnthropic(error_rate=1.0), retry_wait=5) as backends:
+        start = time.perf_counter()
+        with pytest.raises(AnthropicAPIError):
+            asyncio.run(call())
+    # The first backoff would already outlast the deadline.
+    assert time.perf_counter() - start < 1
+    assert backends.anthropic.calls == 1
+
+@pytest.mark.parametrize("timeout", [1.5, 3])
+def test_respond_degrades_to_answer_on_time(timeout):
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.2))):
+        assistant = AIAssistant(num_layers=3, agents_per_layer=2, tot_depth=2, checkpoints=CheckpointStore())
+        start = time.perf_counter()
+        with tally() as usage:
+            response, history = assistant.respond(QUESTION, timeout=timeout)
+        elapsed = time.perf_counter() - start
+
+    # Without a deadline the pipeline takes about 4s at this latency.
+    assert elapsed < timeout
+    assert response.startswith("Canned answer")
+    assert len(history) == 2
+    assert usage["degraded"] > 0
+    assert assistant.moa.last_layers_run < 3
+
+def test_respond_stream_keeps_the_deadline():
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.2))):
+        assistant = AIAssistant(num_layers=3, agents_per_layer=2, tot_depth=2, checkpoints=CheckpointStore())
+        start = time.perf_counter()
+        events = list(assistant.respond_stream(QUESTION, timeout=3))
+        elapsed = time.perf_counter() - start
+
+    assert elapsed < 3
+    assert events[-1]["type"] == "done" and events[-1]["response"].startswith("Canned answer")
+    assert assistant.moa.last_layers_run < 3
\ No newline at end of file
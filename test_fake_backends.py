@@ -0,0 +1,44 @@
+import time
+import agent
+import api_utils
+from ai_assistant import AIAssistant
+from fake_backends import FakeAnthropic, FakeTavilyClient, LatencyModel, canned_response, install_fake_backends
+from tree_of_thought import TreeOfThought
+
+def test_canned_response_is_parsed_as_thoughts():
+    tot = TreeOfThought(branching_factor=3)
+    system = "Generate and evaluate 3 thoughts as next steps for the given prompt."
+    thoughts = tot._parse_thoughts(canned_response(system, "Depth: 1\nPrompt: Why?"))
+    assert len(thoughts) == 3
+    assert all(t.evaluation in ("sure", "maybe") and t.score is not None for t in thoughts)
+
+def test_latency_model_is_seeded():
+    first = LatencyModel.parse("lognormal:0.1,0.5", seed=3)
+    second = LatencyModel.parse("lognormal:0.1,0.5", seed=3)
+    assert [first.sample() for _ in range(5)] == [second.sample() for _ in range(5)]
+    assert LatencyModel.parse("fixed:0.25").sample() == 0.25
+
+def test_respond_runs_offline_and_restores_clients():
+    original_client, original_service = api_utils.client, agent._search_service
+    with install_fake_backends() as backends:
+        response, history = AIAssistant(num_layers=1, agents_per_layer=2, tot_depth=1).respond("What is 2 + 2?")
+    assert response.startswith("Canned answer")
+    assert backends.anthropic.calls == 2 * 3 + 1 + 1  # Expansion, ToT synthesis and answer per agent, then two syntheses
+    assert backends.tavily.calls == 1  # Both agents share one cached search
+    assert api_utils.client is original_client
+    assert agent._search_service is original_service
+
+def test_fake_searches_are_not_held_to_the_tavily_quota():
+    with install_fake_backends() as backends:
+        start_time = time.perf_counter()
+        for i in range(25):
+            backends.search_service.search(f"Query {i}")
+    assert time.perf_counter() - start_time < 5
+    assert backends.tavily.calls == 25
+
+def test_injected_failures_are_retried():
+    fake_anthropic = FakeAnthropic(error_rate=0.2, rate_limit_rate=0.2, retry_after=0.01, seed=1)
+    with install_fake_backends(fake_anthropic, FakeTavilyClient()):
+        response, _ = AIAssistant(num_layers=1, agents_per_layer=2, tot_depth=1).respond("What is 2 + 2?")
+    assert response.startswith("Canned answer")
+    assert fake_anthropic.faults.errors + fake_anthropic.faults.rate_limited > 0
\ No newline at end of file
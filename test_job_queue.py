@@ -0,0 +1,123 @@
+import threading
+import time
+import pytest
+from ai_assistant import AIAssistant
+from checkpoints import CheckpointStore
+from fake_backends import FakeAnthropic, LatencyModel, install_fake_backends
+from job_queue import CANCELLED, DONE, TIMED_OUT, JobQueue, QueueFullError
+
+QUESTION = "Explain the concept of artificial intelligence in simple terms."
+
+@pytest.fixture
+def backends():
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.02))) as backends:
+        yield backends
+
+def make_assistant() -> AIAssistant:
+    return AIAssistant(num_layers=1, agents_per_layer=1, tot_depth=1)
+
+def test_job_streams_progress_and_answer(backends):
+    queue = JobQueue(max_workers=2)
+    assistant = make_assistant()
+    job = queue.submit("alice", assistant, "What is the capital of France?")
+    assert job.wait(10)
+    assert job.status == DONE
+    assert job.response.startswith("Canned answer")
+    assert job.partial_response == job.response
+    assert any(event["stage"] == "final_synthesis" for event in job.events() if event["type"] == "progress")
+    assert len(assistant.get_conversation_history()) == 2
+    assert queue.stats()["done"] == 1
+    queue.shutdown()
+
+def test_sessions_are_served_round_robin(backends, monkeypatch):
+    started = []
+    queue = JobQueue(max_workers=1)
+    original = AIAssistant._map_reduce_async
+
+    async def recording_map_reduce(self, user_input, on_progress=None):
+        started.append(user_input)
+        return await original(self, user_input, on_progress)
+
+    monkeypatch.setattr(AIAssistant, "_map_reduce_async", recording_map_reduce)
+    alice, bob = make_assistant(), make_assistant()
+    jobs = [queue.submit("alice", alice, f"alice {i}") for i in range(3)]
+    jobs.append(queue.submit("bob", bob, "bob 0"))
+    for job in jobs:
+        assert job.wait(10)
+    assert started[:3] == ["alice 0", "bob 0", "alice 1"]
+    queue.shutdown()
+
+def test_worker_pool_bounds_concurrency(backends):
+    queue = JobQueue(max_workers=2)
+    running, peak, lock = [0], [0], threading.Lock()
+    original = backends.anthropic._create_async
+
+    async def counting_create(**params):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        try:
+            return await original(**params)
+        finally:
+            with lock:
+                running[0] -= 1
+
+    backends.anthropic.async_client.messages.create = counting_create
+    jobs = [queue.submit(f"user{i}", make_assistant(), "Hello") for i in range(6)]
+    for job in jobs:
+        assert job.wait(20)
+    assert all(job.status == DONE for job in jobs)
+    assert peak[0] <= 2 * 2  # Two jobs, each with at most its search/ToT calls in flight together
+    queue.shutdown()
+
+def test_cancel_queued_and_running_jobs():
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.5))):
+        queue = JobQueue(max_workers=1)
+        running = queue.submit("alice", make_assistant(), "slow")
+        waiting = queue.submit("bob", make_assistant(), "never started")
+        time.sleep(0.1)
+        assert queue.position(waiting.id) == 0
+        assert queue.cancel(waiting.id)
+        assert queue.cancel(running.id)
+        assert running.wait(5)
+        assert (running.status, waiting.status) == (CANCELLED, CANCELLED)
+        queue.shutdown()
+
+def test_job_times_out():
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.5))):
+        queue = JobQueue(max_workers=1, timeout=0.3)
+        job = queue.submit("alice", make_assistant(), "slow")
+        assert job.wait(5)
+        assert job.status == TIMED_OUT
+        assert "took too long" in job.error
+        queue.shutdown()
+
+def test_full_queue_rejects_new_jobs():
+    with install_fake_backends(FakeAnthropic(LatencyModel("fixed", 0.5))):
+        queue = JobQueue(max_workers=1, max_queued=1)
+        queue.submit("alice", make_assistant(), "running")
+        time.sleep(0.1)
+        queue.submit("bob", make_assistant(), "queued")
+        with pytest.raises(QueueFullError):
+            queue.submit("carol", make_assistant(), "rejected")
+        queue.shutdown(wait=False)
+
+def test_job_resumes_a_failed_respond(backends, monkeypatch):
+    # The queue runs the same pipeline as respond(), so it picks up the stages respond() checkpointed.
+    async def failing(self, *args, **kwargs):
+        raise RuntimeError("Connection reset")
+
+    assistant = AIAssistant(num_layers=1, agents_per_layer=2, tot_depth=1, checkpoints=CheckpointStore())
+    with monkeypatch.context() as patched:
+        patched.setattr(AIAssistant, "_synthesize_final_response_async", failing)
+        response, _ = assistant.respond(QUESTION)
+    assert response.startswith("I apologize")
+
+    calls = backends.anthropic.calls
+    queue = JobQueue(max_workers=1)
+    job = queue.submit("alice", assistant, QUESTION)
+    assert job.wait(10) and job.status == DONE
+    assert job.response.startswith("Canned answer")
+    assert backends.anthropic.calls - calls == 1  # Only the final synthesis is left to do
+    assert assistant.checkpoints.stages(assistant.request_id(QUESTION)) == {}
+    queue.shutdown()
\ No newline at end of file
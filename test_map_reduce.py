@@ -0,0 +1,60 @@
+import time
+import pytest
+import ai_assistant
+from agent import Agent
+from ai_assistant import AIAssistant
+
+CALL_LATENCY = 0.05
+
+@pytest.fixture
+def fake_pipeline(fake_api_call, monkeypatch):
+    calls = {"merge": [], "final": []}
+
+    def reply(system, messages):
+        content = messages[0]["content"]
+        if system.startswith("Generate and evaluate"):
+            return "Thought 1: Idea - Evaluation: sure\nThought 2: Other - Evaluation: sure"
+        if system.startswith("You are an AI assistant merging"):
+            calls["merge"].append(content)
+            return f"merged({content.count('Partial answer ')})"
+        if system.startswith("You are an AI assistant with access to a large context window"):
+            calls["final"].append(content)
+            return "Final answer"
+        return "Layer answer"
+
+    fake_api_call(reply, latency=CALL_LATENCY)
+    monkeypatch.setattr(Agent, "search_internet", lambda self, query: '"search results"')
+    monkeypatch.setattr(ai_assistant, "chunk_text", lambda text, max_tokens=4000: text.split("|"))
+    return calls
+
+def test_chunks_are_processed_concurrently(fake_pipeline):
+    assistant = AIAssistant(num_layers=1, agents_per_layer=1, tot_depth=1, max_parallel_chunks=8, reduce_fan_in=8)
+    start_time = time.perf_counter()
+    response, history = assistant.respond("|".join(f"Section {i}" for i in range(8)))
+    elapsed = time.perf_counter() - start_time
+
+    assert response == "Final answer"
+    # One MoA pass is ToT expansion, ToT synthesis, agent response and layer synthesis; then one merge and
+    # the final synthesis. Eight sequential chunks would need about 34 round trips.
+    assert elapsed < CALL_LATENCY * 12
+    assert len(fake_pipeline["merge"]) == 1
+
+def test_partials_are_reduced_tree_style(fake_pipeline):
+    assistant = AIAssistant(num_layers=1, agents_per_layer=1, tot_depth=1, reduce_fan_in=2)
+    assistant.respond("|".join(f"Section {i}" for i in range(5)))
+
+    # 5 partials -> 3 -> 2 -> 1 takes 2 + 1 + 1 merges, and the final synthesis sees one merged answer.
+    assert [merge.count("Partial answer ") for merge in fake_pipeline["merge"]] == [2, 2, 2, 2]
+    assert len(fake_pipeline["final"]) == 1
+    assert "merged(2)" in fake_pipeline["final"][0]
+
+def test_turn_is_recorded_once_in_history(fake_pipeline):
+    assistant = AIAssistant(num_layers=1, agents_per_layer=1, tot_depth=1)
+    _, history = assistant.respond("Section A|Section B")
+    assert [msg["role"] for msg in history] == ["user", "assistant"]
+    assert history[0]["content"] == "Section A|Section B"
+
+def test_single_chunk_needs_no_merge(fake_pipeline):
+    AIAssistant(num_layers=1, agents_per_layer=1, tot_depth=1).respond("Only section")
+    assert fake_pipeline["merge"] == []
+    assert len(fake_pipeline["final"]) == 1
\ No newline at end of file
@@ -0,0 +1,85 @@
+from collections import Counter
+from types import SimpleNamespace
+import pytest
+import model_routing
+from ai_assistant import AIAssistant
+from api_utils import make_api_call, prompt_text
+from fake_backends import FakeAnthropic, install_fake_backends
+from model_routing import LARGE_MODEL, SMALL_MODEL, ModelRouter, StageRoute, estimate_cost, stage
+from tree_of_thought import TreeOfThought
+from tracing import tally
+
+QUESTION = "Explain the concept of artificial intelligence in simple terms."
+
+class RecordingAnthropic(FakeAnthropic):
+    """Records each call's model; with `garbled_model`, Tree of Thought expansions on that model come back unparseable."""
+
+    def __init__(self, garbled_model=None, **kwargs):
+        super().__init__(**kwargs)
+        self.garbled_model = garbled_model
+        self.models = []
+
+    def _respond(self, params, outcome):
+        self.models.append((params["model"], params["max_tokens"], params["temperature"]))
+        response = super()._respond(params, outcome)
+        if params["model"] == self.garbled_model and prompt_text(params["system"]).startswith("Generate and evaluate"):
+            response.content = [SimpleNamespace(type="text", text="I would rather not say.")]
+        return response
+
+@pytest.fixture
+def router(monkeypatch):
+    router = ModelRouter()
+    monkeypatch.setattr(model_routing, "model_router", router)
+    return router
+
+def test_stages_use_their_routes(router):
+    router.routes["merge"] = StageRoute("claude-3-haiku-20240307", max_tokens=100, temperature=0.2)
+    with install_fake_backends(RecordingAnthropic()) as backends:
+        make_api_call(system="You are helpful.", messages=[{"role": "user", "content": "Hi"}], max_tokens=1000)
+        with stage("merge"):
+            make_api_call(system="You are helpful.", messages=[{"role": "user", "content": "Hi"}], max_tokens=1000)
+    assert backends.anthropic.models == [(LARGE_MODEL, 1000, 0.7), ("claude-3-haiku-20240307", 100, 0.2)]
+    assert router.stats()["merge"]["calls"] == 1 and router.stats()["other"]["calls"] == 1
+
+def test_respond_routes_inner_loop_to_the_small_model(router):
+    with install_fake_backends(RecordingAnthropic()) as backends:
+        assistant = AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=2)
+        with tally() as usage:
+            response, _ = assistant.respond(QUESTION)
+    assert response.startswith("Canned answer")
+
+    stats = router.stats()
+    assert stats["tot_expansion"]["calls"] > 0 and stats["tot_synthesis"]["calls"] > 0
+    assert stats["agent"]["calls"] == 4 and stats["layer_synthesis"]["calls"] == 2 and stats["final_synthesis"]["calls"] == 1
+    models = Counter(model for model, _, _ in backends.anthropic.models)
+    assert models[SMALL_MODEL] == stats["tot_expansion"]["calls"] + stats["tot_synthesis"]["calls"]
+    assert models[LARGE_MODEL] == 7
+    assert sum(entry["escalations"] for entry in stats.values()) == 0
+    assert usage["cost"] == pytest.approx(sum(entry["cost"] for entry in stats.values()))
+    assert all(entry["latency"] > 0 and entry["input_tokens"] > 0 for entry in stats.values())
+
+def test_unparseable_expansions_escalate(router):
+    with install_fake_backends(RecordingAnthropic(garbled_model=SMALL_MODEL)) as backends:
+        with tally() as usage:
+            thoughts = TreeOfThought(branching_factor=3).generate_and_evaluate_thoughts(QUESTION, 1)
+    assert [thought.content for thought in thoughts] == [f"Step 1.{i} towards an answer" for i in range(1, 4)]
+    assert [model for model, _, _ in backends.anthropic.models] == [SMALL_MODEL, LARGE_MODEL]
+    assert router.stats()["tot_expansion"]["escalations"] == 1
+    assert usage["escalations"] == 1
+
+def test_routing_off_uses_one_model(monkeypatch):
+    monkeypatch.setenv("MODEL_ROUTING", "0")
+    router = model_routing._create_model_router()
+    assert router.route("tot_expansion").model == LARGE_MODEL and router.route("tot_expansion").escalate_to is None
+
+def test_routes_from_env(monkeypatch):
+    monkeypatch.setenv("MODEL_ROUTES", '{"tot_expansion": {"max_tokens": 800}, "merge": {"model": "claude-3-haiku-20240307"}}')
+    router = model_routing._create_model_router()
+    assert router.route("tot_expansion").model == SMALL_MODEL and router.route("tot_expansion").max_tokens == 800
+    assert router.route("merge").model == "claude-3-haiku-20240307"
+    assert router.route("agent").model == LARGE_MODEL
+
+def test_estimate_cost():
+    usage = {"input_tokens": 1_000_000, "output_tokens": 100_000, "cache_read_tokens": 1_000_000}
+    assert estimate_cost("claude-3-5-sonnet-20240620", usage) == pytest.approx(3.00 + 1.50 + 0.30)
+    assert estimate_cost("unknown-model", usage) == 0
\ No newline at end of file
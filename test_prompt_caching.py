@@ -0,0 +1,67 @@
+import asyncio
+from types import SimpleNamespace
+import api_utils
+import agent as agent_module
+from agent import Agent
+from ai_assistant import AIAssistant
+from api_utils import cache_breakpoint, prompt_text
+from fake_backends import FakeAnthropic, install_fake_backends
+from tracing import start_trace
+
+def test_system_prompt_ends_a_cacheable_prefix(monkeypatch):
+    params = api_utils._request_params("Static instructions", [{"role": "user", "content": "Hi"}], 100)
+    assert params["system"] == [{"type": "text", "text": "Static instructions", "cache_control": {"type": "ephemeral"}}]
+
+    monkeypatch.setattr(api_utils, "PROMPT_CACHING", False)
+    assert api_utils._request_params("Static instructions", [], 100)["system"] == "Static instructions"
+    assert "cache_control" not in cache_breakpoint("text")
+
+def test_prompt_text_flattens_blocks():
+    assert prompt_text("plain") == "plain"
+    assert prompt_text([cache_breakpoint("shared"), {"type": "text", "text": "own"}]) == "shared\n\nown"
+    assert api_utils.estimate_request_tokens([cache_breakpoint("x" * 35)], [{"role": "user", "content": "y" * 35}]) == 21
+
+def test_agents_share_the_prefix_before_their_own_output(fake_api_call, monkeypatch):
+    requests = []
+
+    def reply(system, messages):
+        requests.append((system, messages[0]["content"]))
+        return "Answer"
+
+    async def fake_tot(self, input):
+        return [], "Synthesis"
+
+    fake_api_call(reply)
+    monkeypatch.setattr(Agent, "search_internet", lambda self, query: '"results"')
+    monkeypatch.setattr(agent_module.TreeOfThought, "process_async", fake_tot)
+    for name in ("L0A0", "L0A1"):
+        Agent(name).process("Question")
+
+    (system_a, content_a), (system_b, content_b) = requests
+    assert system_a == system_b
+    assert content_a[0] == content_b[0] and "cache_control" in content_a[0]
+    assert "Question" in content_a[0]["text"] and '"results"' in content_a[0]["text"]
+    assert "L0A0" in content_a[1]["text"] and "L0A1" in content_b[1]["text"]
+
+def test_cache_tokens_are_recorded_per_call(monkeypatch):
+    async def create(**params):
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5, cache_read_input_tokens=1500, cache_creation_input_tokens=0)
+        return SimpleNamespace(content=[SimpleNamespace(text="Answer")], usage=usage)
+
+    monkeypatch.setattr(api_utils, "get_async_client", lambda: SimpleNamespace(messages=SimpleNamespace(create=create)))
+    monkeypatch.setattr(api_utils, "response_cache", None)
+    with start_trace() as trace:
+        asyncio.run(api_utils.make_api_call_async("System", [{"role": "user", "content": "Hi"}]))
+    assert trace.summary()["api_call"]["cache_read_tokens"] == 1500
+    assert trace.summary()["api_call"]["cache_write_tokens"] == 0
+
+def test_fan_out_reads_the_shared_prefix_from_the_cache():
+    fake_anthropic = FakeAnthropic()
+    with install_fake_backends(fake_anthropic):
+        with start_trace() as trace:
+            AIAssistant(num_layers=1, agents_per_layer=3, tot_depth=1).respond("What is the capital of France?")
+    totals = trace.summary()["api_call"]
+    assert totals["cache_write_tokens"] > 0
+    # The first agent writes the input and search results to the cache; the other two read them.
+    assert totals["cache_read_tokens"] >= 2 * 1024
+    assert fake_anthropic.cache_read_tokens == totals["cache_read_tokens"]
\ No newline at end of file
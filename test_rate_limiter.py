@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+import anthropic
+import httpx
+import pytest
+import api_utils
+from api_utils import (AdaptiveConcurrency, MemoryRateLimitBackend, RateLimiter,
+                       SQLiteRateLimitBackend, TokenBucket)
+
+def test_token_bucket_allows_burst_then_paces():
+    bucket = TokenBucket("requests", per_minute=60)
+    assert [bucket.reserve() for _ in range(60)] == [0.0] * 60
+    # The bucket is empty, so the next request has to wait for one refill (one second at 60/min).
+    assert bucket.reserve() == pytest.approx(1.0, abs=0.05)
+    assert bucket.reserve() == pytest.approx(2.0, abs=0.05)
+
+def test_rate_limiter_waits_on_the_tighter_budget():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=60)
+    assert limiter._reserve(60) == 0.0
+    assert limiter._reserve(30) == pytest.approx(30.0, abs=0.1)
+
+def test_sqlite_backend_shares_quota_between_instances(tmp_path):
+    path = str(tmp_path / "ratelimit.db")
+    first = TokenBucket("requests", per_minute=2, backend=SQLiteRateLimitBackend(path))
+    second = TokenBucket("requests", per_minute=2, backend=SQLiteRateLimitBackend(path))
+    assert first.reserve() == 0.0
+    assert second.reserve() == 0.0
+    assert first.reserve() > 0.0
+
+def test_retry_after_blocks_every_caller(tmp_path):
+    backend = SQLiteRateLimitBackend(str(tmp_path / "ratelimit.db"))
+    limiter = RateLimiter(backend=backend)
+    other_worker = RateLimiter(backend=SQLiteRateLimitBackend(backend.path))
+    limiter.on_rate_limited(retry_after=5)
+    assert other_worker.is_blocked()
+    assert other_worker._reserve(1) == pytest.approx(5.0, abs=0.1)
+
+def test_aimd_concurrency():
+    concurrency = AdaptiveConcurrency(initial=4, maximum=5)
+    concurrency.on_rate_limited()
+    assert concurrency.limit == 2
+    for _ in range(2):
+        concurrency.on_success()
+    assert concurrency.limit == 3
+    for _ in range(10):
+        concurrency.on_success()
+    assert concurrency.limit == 5
+
+def test_concurrency_limit_is_enforced_across_threads_and_tasks():
+    concurrency = AdaptiveConcurrency(initial=1)
+    concurrency.acquire()
+    released = threading.Timer(0.1, concurrency.release)
+    released.start()
+
+    async def acquire_async():
+        start_time = time.perf_counter()
+        await concurrency.acquire_async()
+        return time.perf_counter() - start_time
+
+    assert asyncio.run(acquire_async()) >= 0.09
+    concurrency.release()
+
+def test_cancelled_waiter_does_not_strand_a_slot():
+    concurrency = AdaptiveConcurrency(initial=1)
+    concurrency.acquire()
+
+    async def run():
+        cancelled = asyncio.create_task(concurrency.acquire_async())
+        waiting = asyncio.create_task(concurrency.acquire_async())
+        await asyncio.sleep(0.01)
+        concurrency.release()
+        cancelled.cancel()
+        await asyncio.wait_for(waiting, timeout=1)
+
+    asyncio.run(run())
+    assert concurrency.in_flight == 1
+
+def test_rate_limit_error_backs_off_with_retry_after(monkeypatch):
+    limiter = RateLimiter(backend=MemoryRateLimitBackend())
+    monkeypatch.setattr(api_utils, "rate_limiter", limiter)
+    response = httpx.Response(429, headers={"retry-after": "0.2"}, request=httpx.Request("POST", "https://api.anthropic.com"))
+    attempts = []
+
+    @api_utils.rate_limited_api_call
+    def flaky_call(system, messages, max_tokens=4096):
+        attempts.append(time.perf_counter())
+        if len(attempts) == 1:
+            raise anthropic.RateLimitError("Too many requests", response=response, body=None)
+        return "ok"
+
+    assert flaky_call(system="s", messages=[{"role": "user", "content": "hi"}]) == "ok"
+    assert limiter.concurrency.limit == 2
+    # The retry waited for retry-after rather than the multi-second exponential backoff.
+    assert 0.15 <= attempts[1] - attempts[0] < 2
\ No newline at end of file
@@ -0,0 +1,72 @@
+import time
+from types import SimpleNamespace
+import pytest
+import api_utils
+from response_cache import ResponseCache, make_cache_key
+
+def test_cache_key_depends_on_every_request_field():
+    base = dict(model="m", system="s", messages=[{"role": "user", "content": "hi"}], max_tokens=10, temperature=0.7)
+    assert make_cache_key(**base) == make_cache_key(**dict(base))
+    for field, value in [("model", "other"), ("system", "other"), ("max_tokens", 11), ("temperature", 0.0),
+                         ("messages", [{"role": "user", "content": "hello"}])]:
+        assert make_cache_key(**dict(base, **{field: value})) != make_cache_key(**base)
+
+def test_memory_tier_is_lru():
+    cache = ResponseCache(max_memory_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    cache.get("a")
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.stats() == {"hits": 2, "disk_hits": 0, "misses": 1, "memory_entries": 2}
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "cache.db"), ttl=0.05)
+    cache.set("a", "1")
+    time.sleep(0.1)
+    assert cache.get("a") is None
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.db")
+    ResponseCache(path=path).set("a", "1")
+    cache = ResponseCache(path=path)
+    assert cache.get("a") == "1"
+    assert cache.disk_hits == 1
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.db")
+    cache = ResponseCache(path=path, max_disk_bytes=20)
+    cache.set("old", "x" * 10)
+    time.sleep(0.01)
+    cache.set("new", "y" * 10)
+    time.sleep(0.01)
+    cache.set("newest", "z" * 10)
+    fresh = ResponseCache(path=path)
+    assert fresh.get("old") is None
+    assert fresh.get("newest") == "z" * 10
+
+@pytest.fixture
+def fake_client(monkeypatch):
+    calls = []
+
+    def create(**params):
+        calls.append(params)
+        return SimpleNamespace(content=[SimpleNamespace(text=f"answer {len(calls)}")], usage=SimpleNamespace(input_tokens=5, output_tokens=2))
+
+    monkeypatch.setattr(api_utils, "client", SimpleNamespace(messages=SimpleNamespace(create=create)))
+    monkeypatch.setattr(api_utils, "response_cache", ResponseCache())
+    return calls
+
+def test_make_api_call_serves_repeats_from_cache(fake_client):
+    messages = [{"role": "user", "content": "What is the capital of France?"}]
+    first = api_utils.make_api_call(system="s", messages=messages)
+    second = api_utils.make_api_call(system="s", messages=messages)
+    assert first == second == "answer 1"
+    assert len(fake_client) == 1
+
+def test_use_cache_false_bypasses_cache(fake_client):
+    messages = [{"role": "user", "content": "What is the capital of France?"}]
+    api_utils.make_api_call(system="s", messages=messages)
+    assert api_utils.make_api_call(system="s", messages=messages, use_cache=False) == "answer 2"
+    assert len(fake_client) == 2
\ No newline at end of file
@@ -0,0 +1,91 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+import agent as agent_module
+from agent import Agent, SearchService
+from ai_assistant import AIAssistant
+from api_utils import TokenBucket
+from fake_backends import FakeTavilyClient, LatencyModel
+
+SEARCH_LATENCY = 0.1
+
+class RecordingTavilyClient(FakeTavilyClient):
+    def __init__(self):
+        super().__init__(latency=LatencyModel("fixed", SEARCH_LATENCY))
+        self.queries = []
+
+    def get_search_context(self, query, **kwargs):
+        self.queries.append(query)
+        return super().get_search_context(query, **kwargs)
+
+@pytest.fixture
+def stub_tavily():
+    return RecordingTavilyClient()
+
+@pytest.fixture
+def service(stub_tavily):
+    service = SearchService(api_key="test-key")
+    service.client = stub_tavily
+    return service
+
+def test_concurrent_identical_queries_share_one_request(service, stub_tavily):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(service.search, ["What is the capital of France?"] * 8))
+
+    assert len(set(results)) == 1
+    assert len(stub_tavily.queries) == 1
+    assert service.stats()["requests_sent"] == 1
+
+def test_normalized_repeat_is_served_from_cache(service, stub_tavily):
+    service.search("What is the capital of France?")
+    service.search("  what is the CAPITAL of   france? ")
+    assert len(stub_tavily.queries) == 1
+    assert service.stats()["cache_hits"] == 1
+
+def test_each_service_has_its_own_search_quota(service, stub_tavily):
+    spent = SearchService(api_key="test-key", limiter=TokenBucket("searches", per_minute=1))
+    spent.client = stub_tavily
+    spent.search("First query")
+    assert spent.limiter.reserve() > 30
+
+    start_time = time.perf_counter()
+    service.search("Second query")
+    assert time.perf_counter() - start_time < 1
+
+def test_agents_share_one_client(service):
+    assert Agent("A", search_service=service).tavily_client is Agent("B", search_service=service).tavily_client
+
+def test_errors_are_not_cached(service, monkeypatch):
+    import requests
+    attempts = []
+
+    def failing_fetch(query, search_depth, max_results):
+        attempts.append(query)
+        raise requests.exceptions.ConnectionError("down")
+
+    monkeypatch.setattr(service, "_fetch", failing_fetch)
+    agent = Agent("A", search_service=service)
+    assert agent.search_internet("query").startswith("Error:")
+    assert agent.search_internet("query").startswith("Error:")
+    assert len(attempts) == 2
+
+def test_searches_saved_per_respond(service, stub_tavily, fake_api_call, monkeypatch):
+    def reply(system, messages):
+        if system.startswith("Generate and evaluate"):
+            return "Thought 1: Idea - Evaluation: sure\nThought 2: Other - Evaluation: sure"
+        return "Final answer"
+
+    fake_api_call(reply)
+    monkeypatch.setattr("ai_assistant.chunk_text", lambda text, max_tokens=4000: [text])
+    monkeypatch.setattr(agent_module, "_search_service", service)
+
+    searches = []
+    original_search = service.search
+    monkeypatch.setattr(service, "search", lambda query, *args: searches.append(query) or original_search(query, *args))
+
+    response, _ = AIAssistant(num_layers=2, agents_per_layer=4, tot_depth=1).respond("What is the capital of France?")
+
+    assert response == "Final answer"
+    # Every agent in a layer searches for the same layer input, so only one request per layer goes out.
+    assert len(searches) == 8
+    assert len(stub_tavily.queries) == 2
\ No newline at end of file
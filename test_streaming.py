@@ -0,0 +1,77 @@
+import inspect
+from types import SimpleNamespace
+import pytest
+import api_utils
+from agent import Agent
+from ai_assistant import AIAssistant
+from response_cache import ResponseCache
+
+class FakeStream:
+    def __init__(self, pieces):
+        self.pieces = pieces
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    @property
+    def text_stream(self):
+        return iter(self.pieces)
+
+    def get_final_message(self):
+        return SimpleNamespace(usage=SimpleNamespace(input_tokens=10, output_tokens=len(self.pieces)))
+
+@pytest.fixture
+def fake_stream_client(monkeypatch):
+    requests = []
+
+    def stream(**params):
+        requests.append(params)
+        return FakeStream(["Paris ", "is the ", "capital."])
+
+    monkeypatch.setattr(api_utils, "client", SimpleNamespace(messages=SimpleNamespace(stream=stream)))
+    monkeypatch.setattr(api_utils, "response_cache", ResponseCache())
+    return requests
+
+def test_stream_api_call_yields_deltas_and_caches(fake_stream_client):
+    messages = [{"role": "user", "content": "What is the capital of France?"}]
+    assert list(api_utils.stream_api_call(system="s", messages=messages)) == ["Paris ", "is the ", "capital."]
+    assert list(api_utils.stream_api_call(system="s", messages=messages)) == ["Paris is the capital."]
+    assert len(fake_stream_client) == 1
+
+def test_respond_stream_reports_progress_then_tokens(fake_stream_client, fake_api_call, monkeypatch):
+    def reply(system, messages):
+        if system.startswith("Generate and evaluate"):
+            return "Thought 1: Idea - Evaluation: sure\nThought 2: Other - Evaluation: sure"
+        return "Agent answer"
+
+    fake_api_call(reply)
+    monkeypatch.setattr(Agent, "search_internet", lambda self, query: '"search results"')
+    monkeypatch.setattr(api_utils, "TOKEN_COUNTER", "claude")
+
+    assistant = AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=1, tot_branching=2)
+    events = list(assistant.respond_stream("What is the capital of France?"))
+    types = [event["type"] for event in events]
+
+    assert types[-1] == "done"
+    assert events[-1]["response"] == "Paris is the capital."
+    assert "".join(event["text"] for event in events if event["type"] == "token") == "Paris is the capital."
+    # Every progress event arrives before the first token.
+    assert types.index("token") > max(i for i, t in enumerate(types) if t == "progress")
+    stages = [event["stage"] for event in events if event["type"] == "progress"]
+    assert stages.count("layer") == 2
+    assert stages.count("agent") == 4
+    assert stages[-1] == "final_synthesis"
+
+def test_respond_stream_takes_the_arguments_of_respond():
+    assert list(inspect.signature(AIAssistant.respond_stream).parameters) == list(inspect.signature(AIAssistant.respond).parameters)
+
+def test_respond_stream_reports_errors(fake_stream_client, monkeypatch):
+    def failing_chunk_text(*args, **kwargs):
+        raise RuntimeError("boom")
+
+    monkeypatch.setattr("ai_assistant.chunk_text", failing_chunk_text)
+    events = list(AIAssistant(num_layers=1, agents_per_layer=1).respond_stream("Hi"))
+    assert events[-1]["type"] == "error"
\ No newline at end of file
@@ -0,0 +1,103 @@
+import time
+import api_utils
+from fake_backends import install_fake_backends
+from thought_parser import THOUGHTS_TOOL, parse_thoughts
+from tree_of_thought import TreeOfThought
+
+# Expansion responses in the shapes models actually return, with the number of thoughts each holds.
+RECORDED_RESPONSES = [
+    ("""Thought 1: Compare the two algorithms on their worst case - Evaluation: sure - Score: 8
+Thought 2: Look for a counterexample - Evaluation: maybe - Score: 5
+Synthesis: The worst-case comparison settles the question.""", 2),
+    ("""Thought 1: Start from the definition - Evaluation: Sure - Score: 9/10
+Thought 2: Try small cases first - Evaluation: Maybe - Score: 6/10
+Synthesis: Working from the definition is the most direct route.""", 2),
+    ("""**Thought 1:** Estimate the memory footprint - **Evaluation:** sure - **Score:** 8
+**Thought 2:** Profile the allocation hot spots - **Evaluation:** maybe - **Score:** 6
+
+**Synthesis:** Measure before optimizing.""", 2),
+    ("""Thought 1: Break the problem into subproblems
+Evaluation: sure
+Score: 7
+
+Thought 2: Search for a closed-form solution
+Evaluation: maybe
+Score: 4
+
+Synthesis: Divide and conquer is the safer path.""", 2),
+    ("""1. Thought 1: Check the input constraints (Evaluation: sure, Score: 9)
+2. Thought 2: Consider a greedy approach (Evaluation: maybe, Score: 5)
+Synthesis: Constraints first, then pick the algorithm.""", 2),
+    ("""Here are my thoughts:
+
+- Thought 1 - Cache the intermediate results - Evaluation: likely - Score: 7
+- Thought 2 - Recompute on demand - Evaluation: unlikely - Score: 3
+
+Synthesis: Caching wins for repeated queries.""", 2),
+    ("""Thought 1: Ask what the user already knows - Evaluation: maybe
+Thought 2: Give a short definition first - Evaluation: sure
+Synthesis: Lead with the definition.""", 2),
+    ("""Thought 1: Use a hash map for lookups - Evaluation: sure - Score: 85/100
+Thought 2: Sort and binary search - Evaluation: maybe - Score: 60/100
+Thought 3: Linear scan - Evaluation: impossible - Score: 5/100
+Synthesis: Hash map lookups are fastest.""", 3),
+    ("""Thought 1: Reframe the question as an optimization problem
+Thought 2: Look at the constraints that bind
+Synthesis: It is a constrained optimization.""", 2),
+    ("""1. Read the error message carefully
+2. Reproduce the bug with a minimal example
+Synthesis: Reproduce first.""", 2),
+    ('{"thoughts": [{"content": "Check the logs", "evaluation": "sure", "score": 8}, '
+     '{"content": "Restart the service", "evaluation": "maybe", "score": 4}], "synthesis": "Logs first."}', 2),
+    ('```json\n{"thoughts": [{"content": "Normalize the schema", "evaluation": "sure", "score": 7},'
+     ' {"content": "Denormalize for reads", "evaluation": "maybe", "score": 6},], "synthesis": "Normalize."}\n```', 2),
+    ('{"thoughts": [{"content": "Split the dataset", "evaluation": "sure", "score": 9}, '
+     '{"content": "Tune the learning rate", "evaluation": "maybe", "score": 6}, {"content": "Add more la', 2),
+    ("""thought 1: lower-case labels still count - evaluation: sure - score: 6
+THOUGHT 2: and so do upper-case ones - EVALUATION: MAYBE - SCORE: 5
+synthesis: case does not matter.""", 2),
+    ("""Thought #1: Use the standard library - Evaluation: sure - Score: 8.5
+Thought #2: Write a custom parser - Evaluation: maybe - Score: 4.5
+Synthesis: The standard library is enough.""", 2),
+    ("""Thought 1: Rewrite the loop as a vectorized expression – Evaluation: sure – Score: 8
+Thought 2: Move the work to a background thread – Evaluation: maybe – Score: 5
+Synthesis: Vectorize the loop.""", 2),
+]
+
+def test_recorded_responses_parse():
+    parsed = [parse_thoughts(response) for response, _ in RECORDED_RESPONSES]
+    successes = sum(len(result.thoughts) == expected for result, (_, expected) in zip(parsed, RECORDED_RESPONSES))
+    assert successes / len(RECORDED_RESPONSES) == 1.0
+    assert all(t.content and not t.content.startswith(("Thought", "*", "-")) for result in parsed for t in result.thoughts)
+    assert all(result.synthesis for result, (response, _) in zip(parsed, RECORDED_RESPONSES) if "ynthesis" in response)
+
+def test_recorded_responses_parse_quickly():
+    responses = [response for response, _ in RECORDED_RESPONSES] * 50
+    start = time.perf_counter()
+    for response in responses:
+        parse_thoughts(response)
+    assert (time.perf_counter() - start) / len(responses) < 0.001
+
+def test_scores_and_evaluations_are_normalized():
+    thoughts = parse_thoughts(RECORDED_RESPONSES[7][0]).thoughts
+    assert [(t.evaluation, t.score) for t in thoughts] == [("sure", 0.85), ("maybe", 0.6), ("impossible", 0.05)]
+    thoughts = parse_thoughts(RECORDED_RESPONSES[5][0]).thoughts
+    assert [t.evaluation for t in thoughts] == ["maybe", "maybe"]
+
+def test_broken_json_is_repaired_without_another_call():
+    result = parse_thoughts(RECORDED_RESPONSES[12][0])
+    assert result.method == "repaired"
+    assert [t.content for t in result.thoughts] == ["Split the dataset", "Tune the learning rate"]
+    assert parse_thoughts("I'm not sure how to approach this.").method == "failed"
+
+def test_structured_mode_uses_the_tool():
+    with install_fake_backends() as backends:
+        thoughts = TreeOfThought(branching_factor=2, structured=True).generate_and_evaluate_thoughts("Why?", 1)
+    assert [t.content for t in thoughts] == ["Step 1.1 towards an answer", "Step 1.2 towards an answer"]
+    assert all(t.score is not None for t in thoughts)
+    assert backends.anthropic.calls == 1
+
+def test_tools_are_part_of_the_cache_key():
+    params = dict(system="System", messages=[{"role": "user", "content": "Hi"}])
+    tool_params = dict(tools=[THOUGHTS_TOOL], tool_choice={"type": "tool", "name": THOUGHTS_TOOL["name"]})
+    assert api_utils._cache_key((), params) != api_utils._cache_key((), dict(params, **tool_params))
\ No newline at end of file
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from ai_assistant import AIAssistant
+from checkpoints import CheckpointStore
+from fake_backends import install_fake_backends
+from mixture_of_agents import MixtureOfAgents
+from thought import Thought
+from thought_store import ThoughtStore
+from tree_of_thought import TreeOfThought
+
+@pytest.fixture
+def fake_api(fake_api_call):
+    return fake_api_call(lambda system, messages: "Thought 1: Idea A - Evaluation: maybe\nThought 2: Idea B - Evaluation: maybe",
+                         latency=0.02)
+
+def test_trees_reuse_each_others_expansions(fake_api):
+    store = ThoughtStore()
+    first = TreeOfThought(max_depth=2, branching_factor=2, thought_store=store).search("Root prompt")
+    calls = len(fake_api)
+    second = TreeOfThought(max_depth=2, branching_factor=2, thought_store=store).search("  root PROMPT ")
+    assert len(fake_api) == calls == 3
+    assert [t.content for t in second] == [t.content for t in first]
+    assert store.stats()["saved"] == 3
+
+def test_concurrent_trees_share_in_flight_expansions(fake_api):
+    store = ThoughtStore()
+
+    async def run_trees():
+        trees = [TreeOfThought(max_depth=2, branching_factor=2, thought_store=store, seed=i) for i in range(4)]
+        return await asyncio.gather(*(tree.search_async("Root prompt") for tree in trees))
+
+    asyncio.run(run_trees())
+    # One root and two distinct children, instead of three calls per tree.
+    assert len(fake_api) == 3
+    assert store.deduplicated + store.hits == 9
+
+def test_diversity_gives_each_variant_its_own_tree(fake_api):
+    store = ThoughtStore(diversity=2)
+
+    async def run_trees():
+        trees = [TreeOfThought(max_depth=1, branching_factor=2, thought_store=store, seed=i) for i in range(4)]
+        return await asyncio.gather(*(tree.search_async("Root prompt") for tree in trees))
+
+    asyncio.run(run_trees())
+    assert len(fake_api) == 2
+    assert sum("Variant 2" in prompt for prompt in fake_api) == 1
+
+def test_default_assistant_shares_expansions_within_a_request():
+    # The app's configuration: AIAssistant's defaults (two agents per layer) with one shared store.
+    store = ThoughtStore()
+    with install_fake_backends() as backends:
+        assistant = AIAssistant(thought_store=store, checkpoints=CheckpointStore())
+        response, _ = assistant.respond("Explain the concept of artificial intelligence in simple terms.")
+    assert response.startswith("Canned answer")
+    # A layer's agents explore the same input, so the second agent's tree comes from the first one's expansions.
+    assert store.saved >= store.misses > 0
+    # Expansions, then per agent a Tree of Thought synthesis and a response, two layer syntheses and the final one.
+    assert backends.anthropic.calls == store.misses + 2 * 2 * 2 + 2 + 1
+
+def test_diversified_layer_shares_each_variant():
+    moa = MixtureOfAgents(num_layers=1, agents_per_layer=4, thought_store=ThoughtStore(diversity=2))
+    assert [agent.tot.seed for agent in moa.layers[0]] == [0, 0, 1, 1]
+
+def test_store_is_bounded(fake_api):
+    store = ThoughtStore(max_entries=1)
+    tot = TreeOfThought(max_depth=1, branching_factor=2, thought_store=store)
+    tot.search("First prompt")
+    tot.search("Second prompt")
+    tot.search("First prompt")
+    assert len(fake_api) == 3
+    assert store.stats()["entries"] == 1
+
+def test_waiters_retry_when_the_shared_call_fails():
+    store = ThoughtStore()
+    attempts = []
+
+    async def failing():
+        attempts.append("owner")
+        await asyncio.sleep(0.02)
+        raise RuntimeError("boom")
+
+    async def succeeding():
+        attempts.append("waiter")
+        return [Thought("Idea", "maybe")]
+
+    async def run():
+        return await asyncio.gather(store.get_or_generate("p", 1, 2, 0, failing),
+                                    store.get_or_generate("p", 1, 2, 0, succeeding), return_exceptions=True)
+
+    owner_result, waiter_result = asyncio.run(run())
+    assert isinstance(owner_result, RuntimeError)
+    assert [t.content for t in waiter_result] == ["Idea"]
+    assert attempts == ["owner", "waiter"]
\ No newline at end of file
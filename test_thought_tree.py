@@ -0,0 +1,58 @@
+import pytest
+from api_utils import prompt_text
+from fake_backends import install_fake_backends
+from thought import Thought, ThoughtTree
+from tree_of_thought import TreeOfThought
+
+@pytest.fixture
+def fake_api(fake_api_call):
+    def reply(system, messages):
+        prompt = prompt_text(messages[0]["content"]).split("Prompt: ", 1)[1].split("\n", 1)[0]
+        return f"""Thought 1: {prompt}/a - Evaluation: maybe - Score: 6
+Thought 2: {prompt}/b - Evaluation: impossible - Score: 1
+Synthesis: fake synthesis"""
+
+    fake_api_call(reply, latency=0.01)
+
+def test_search_returns_whole_tree(fake_api):
+    tree = TreeOfThought(max_depth=2, branching_factor=2).search_tree("Root")
+
+    assert [node.content for node in tree.nodes] == ["Root", "Root/a", "Root/b", "Root/a/a", "Root/a/b"]
+    assert [(node.parent, node.depth) for node in tree.nodes] == [(-1, 0), (0, 1), (0, 1), (1, 2), (1, 2)]
+    assert [node.content for node in tree.path(tree.nodes[3])] == ["Root", "Root/a", "Root/a/a"]
+    assert [tree.nodes[index].content for index in tree.solution] == ["Root/a/a"]
+    assert [child.content for child in tree.children(tree.root)] == ["Root/a", "Root/b"]
+    # Only expanded nodes have a cost.
+    assert tree.root.latency > 0 and tree.nodes[1].latency > 0 and tree.nodes[3].latency == 0
+
+def test_expansion_tokens_are_charged_to_the_expanded_node():
+    with install_fake_backends():
+        tree = TreeOfThought(max_depth=2, branching_factor=2).search_tree("Why is the sky blue?")
+
+    expanded = [node for node in tree.nodes if node.output_tokens]
+    assert tree.root in expanded and all(node.depth < 2 for node in expanded)
+    cost = tree.subtree_cost(tree.root)
+    assert cost["output_tokens"] == sum(node.output_tokens for node in tree.nodes)
+    assert tree.subtree_cost(tree.nodes[-1])["output_tokens"] == 0
+
+def test_jsonl_round_trip(fake_api, tmp_path):
+    tree = TreeOfThought(max_depth=2, branching_factor=2).search_tree("Root")
+    path = str(tmp_path / "tree.jsonl")
+    tree.write_jsonl(path)
+
+    loaded = ThoughtTree.read_jsonl(path)
+    assert list(loaded.to_records()) == list(tree.to_records())
+    assert loaded.solution == tree.solution
+
+def test_msgpack_round_trip(fake_api):
+    pytest.importorskip("msgpack")
+    tree = TreeOfThought(max_depth=2, branching_factor=2).search_tree("Root")
+    loaded = ThoughtTree.from_msgpack(tree.to_msgpack())
+    assert list(loaded.to_records()) == list(tree.to_records())
+
+def test_nodes_are_compact_and_not_shared():
+    thought = Thought("Shared", "maybe")
+    assert not hasattr(thought, "__dict__")
+    first, second = ThoughtTree("One"), ThoughtTree("Two")
+    assert first.add(thought, first.root) is not second.add(thought, second.root)
+    assert thought.index == -1
\ No newline at end of file
@@ -0,0 +1,90 @@
+import asyncio
+import json
+from types import SimpleNamespace
+import pytest
+import api_utils
+from agent import Agent
+from ai_assistant import AIAssistant
+from tracing import add_span, record, span, start_trace
+
+TOT_RESPONSE = "Thought 1: Idea - Evaluation: sure\nThought 2: Other - Evaluation: sure"
+
+@pytest.fixture
+def fake_async_client(monkeypatch):
+    async def create(**params):
+        await asyncio.sleep(0.01)
+        text = TOT_RESPONSE if api_utils.prompt_text(params["system"]).startswith("Generate and evaluate") else "Answer"
+        return SimpleNamespace(content=[SimpleNamespace(text=text)], usage=SimpleNamespace(input_tokens=100, output_tokens=20))
+
+    monkeypatch.setattr(api_utils, "get_async_client", lambda: SimpleNamespace(messages=SimpleNamespace(create=create)))
+    monkeypatch.setattr(api_utils, "response_cache", None)
+    monkeypatch.setattr(api_utils, "TOKEN_COUNTER", "claude")
+    monkeypatch.setattr(Agent, "search_internet", lambda self, query: '"results"')
+
+def test_spans_are_noops_without_a_trace():
+    with span("orphan") as current:
+        record(input_tokens=5)
+    assert current is None
+
+def test_nested_spans_follow_tasks_and_threads():
+    def in_thread():
+        with span("in_thread"):
+            pass
+
+    async def child():
+        with span("child"):
+            await api_utils.run_in_thread(in_thread)
+
+    async def parent():
+        with span("parent"):
+            await asyncio.gather(child(), child())
+
+    with start_trace() as trace:
+        asyncio.run(parent())
+
+    by_name = {}
+    for s in trace.spans:
+        by_name.setdefault(s.name, []).append(s)
+    parent_span = by_name["parent"][0]
+    assert all(s.parent_id == parent_span.id for s in by_name["child"])
+    assert {s.parent_id for s in by_name["in_thread"]} == {s.id for s in by_name["child"]}
+
+def test_respond_with_trace_records_every_stage(fake_async_client, tmp_path):
+    assistant = AIAssistant(num_layers=2, agents_per_layer=2, tot_depth=1, tot_branching=2)
+    response, _, trace = assistant.respond_with_trace("What is the capital of France?")
+
+    assert response == "Answer"
+    summary = trace.summary()
+    assert summary["layer"]["count"] == 2
+    assert summary["agent"]["count"] == 4
+    assert summary["tot_expansion"]["count"] == 4
+    assert summary["final_synthesis"]["count"] == 1
+    # 4 ToT expansions, 4 ToT syntheses, 4 agent responses, 2 layer syntheses and the final synthesis.
+    assert summary["api_call"]["count"] == 15
+    assert summary["api_call"]["input_tokens"] == 1500
+    assert summary["api_call"]["output_tokens"] == 300
+    assert "wait_time" in summary["api_call"]
+
+    api_call_parents = {s.parent_id for s in trace.spans if s.name == "api_call"}
+    expansion_ids = {s.id for s in trace.spans if s.name == "tot_expansion"}
+    assert expansion_ids <= api_call_parents
+    assert [s.name for s in trace.critical_path()][:2] == ["respond", "final_synthesis"]
+
+    jsonl_path = tmp_path / "trace.jsonl"
+    trace.to_jsonl(str(jsonl_path))
+    rows = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+    assert len(rows) == len(trace.spans)
+    assert all(row["wall_time"] >= 0 for row in rows)
+
+    chrome_path = tmp_path / "trace.json"
+    trace.to_chrome_trace(str(chrome_path))
+    events = json.loads(chrome_path.read_text())["traceEvents"]
+    assert sum(1 for event in events if event["ph"] == "X") == len(trace.spans)
+
+def test_add_span_records_finished_span():
+    with start_trace() as trace:
+        with span("outer"):
+            add_span("streamed", 0.0, output_tokens=3)
+    streamed = [s for s in trace.spans if s.name == "streamed"][0]
+    assert streamed.parent_id == trace.spans[0].id
+    assert streamed.attributes["output_tokens"] == 3
\ No newline at end of file
@@ -0,0 +1,99 @@
+import time
+import pytest
+from api_utils import prompt_text
+from search_strategies import BeamSearchStrategy, get_search_strategy
+from tree_of_thought import TreeOfThought
+
+CALL_LATENCY = 0.05
+
+@pytest.fixture
+def fake_api(fake_api_call):
+    return fake_api_call(lambda system, messages: """Thought 1: Idea A - Evaluation: maybe
+Thought 2: Idea B - Evaluation: maybe
+Thought 3: Idea C - Evaluation: maybe
+Synthesis: Ideas A, B and C""", latency=CALL_LATENCY)
+
+def test_parallel_search_expands_level_at_once(fake_api):
+    tot = TreeOfThought(max_depth=2, branching_factor=3, parallel=True)
+    start_time = time.perf_counter()
+    solution = tot.search("Root prompt")
+    elapsed = time.perf_counter() - start_time
+
+    assert len(solution) == 3
+    assert len(fake_api) == 4  # The root plus its three children
+    assert elapsed < CALL_LATENCY * 3
+
+def test_sequential_search_matches_parallel_solution(fake_api):
+    parallel = TreeOfThought(max_depth=2, branching_factor=2, parallel=True).search("Root prompt")
+    sequential = TreeOfThought(max_depth=2, branching_factor=2, parallel=False).search("Root prompt")
+    assert [t.content for t in parallel] == [t.content for t in sequential]
+
+def test_max_expansions_caps_calls(fake_api):
+    tot = TreeOfThought(max_depth=3, branching_factor=2, max_expansions=2)
+    solution = tot.search("Root prompt")
+
+    assert len(fake_api) == 2
+    assert len(solution) == 2
+
+def test_time_budget_returns_fallback(fake_api):
+    tot = TreeOfThought(max_depth=3, branching_factor=2, time_budget=CALL_LATENCY / 2)
+    start_time = time.perf_counter()
+    solution = tot.search("Root prompt")
+    elapsed = time.perf_counter() - start_time
+
+    assert [t.content for t in solution] == ["Root prompt"]
+    assert elapsed < CALL_LATENCY * 2
+
+def test_impossible_thoughts_are_pruned(fake_api_call):
+    fake_api_call(lambda system, messages: """Thought 1: Dead end - Evaluation: impossible
+Thought 2: Answer - Evaluation: sure""")
+    solution = TreeOfThought(max_depth=2, branching_factor=2).search("Root prompt")
+    assert [t.content for t in solution] == ["Answer"]
+
+@pytest.fixture
+def scored_api(fake_api_call):
+    calls = []
+
+    def reply(system, messages):
+        prompt = prompt_text(messages[0]["content"]).split("Prompt: ", 1)[1].split("\n", 1)[0]
+        calls.append(prompt)
+        if prompt == "Good branch":
+            return """Thought 1: Answer - Evaluation: sure - Score: 9
+Thought 2: Weak answer - Evaluation: maybe - Score: 4"""
+        return """Thought 1: Weak branch - Evaluation: maybe - Score: 3
+Thought 2: Good branch - Evaluation: maybe - Score: 8
+Thought 3: Other branch - Evaluation: maybe - Score: 5"""
+
+    fake_api_call(reply)
+    return calls
+
+def test_parse_thoughts_reads_scores():
+    tot = TreeOfThought(branching_factor=3)
+    thoughts = tot._parse_thoughts("""Thought 1: A - Evaluation: sure - Score: 9
+Thought 2: B - Evaluation: maybe
+Thought 3: C - Evaluation: impossible - Score: n/a""")
+    assert [(t.evaluation, t.score) for t in thoughts] == [("sure", 0.9), ("maybe", 0.5), ("impossible", 0.0)]
+
+def test_best_first_follows_highest_score_and_stops_on_sure(scored_api):
+    tot = TreeOfThought(max_depth=3, branching_factor=3, strategy="best_first")
+    solution = tot.search("Root prompt")
+
+    assert scored_api == ["Root prompt", "Good branch"]
+    assert [t.content for t in solution] == ["Answer"]
+    assert tot.last_expansions == 2
+
+def test_beam_expands_only_top_k(scored_api):
+    tot = TreeOfThought(max_depth=3, branching_factor=3, strategy=BeamSearchStrategy(width=1))
+    solution = tot.search("Root prompt")
+
+    assert scored_api == ["Root prompt", "Good branch"]
+    assert solution[0].content == "Answer"
+
+def test_bfs_expands_every_branch(scored_api):
+    tot = TreeOfThought(max_depth=2, branching_factor=3, strategy="bfs")
+    tot.search("Root prompt")
+    assert len(scored_api) == 4
+
+def test_unknown_strategy_is_rejected():
+    with pytest.raises(ValueError):
+        get_search_strategy("depth_first")
\ No newline at end of file
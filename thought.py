@@ -1,3 +1,8 @@
+import json
+from typing import Any, Dict, IO, Iterator, List, Optional, Union
+
+EVALUATION_SCORES = {'sure': 1.0, 'maybe': 0.5, 'impossible': 0.0}
+
 class Thought:
     """
     Represents a single thought in the Tree of Thought algorithm.
@@ -5,14 +10,132 @@ class Thought:
     Attributes:
         content (str): The content of the thought.
         evaluation (str, optional): The evaluation of the thought ('sure', 'maybe', 'impossible').
+        score (float, optional): How promising the thought is, from 0 to 1. Derived from the
+            evaluation when the model does not give an explicit score.
+
+    Once added to a ThoughtTree, a thought also knows its position in the tree (index, parent
+    index and depth) and what expanding it cost: tokens sent, read from the prompt cache and
+    generated, and seconds spent waiting for the expansion.
     """
 
-    def __init__(self, content: str, evaluation: str = None):
+    __slots__ = ("content", "evaluation", "score", "index", "parent", "depth",
+                 "input_tokens", "cached_tokens", "output_tokens", "latency")
+
+    def __init__(self, content: str, evaluation: str = None, score: float = None):
         self.content = content
         self.evaluation = evaluation
+        self.score = score if score is not None else EVALUATION_SCORES.get(evaluation)
+        self.index = -1
+        self.parent = -1
+        self.depth = 0
+        self.input_tokens = 0
+        self.cached_tokens = 0
+        self.output_tokens = 0
+        self.latency = 0.0
 
     def __str__(self):
         return f"Thought: {self.content} - Evaluation: {self.evaluation}"
 
     def __repr__(self):
-        return self.__str__()
\ No newline at end of file
+        return self.__str__()
+
+class ThoughtTree:
+    """
+    Every thought a Tree of Thought search explored, stored in a flat list with parent indices.
+    Node 0 is the prompt the search started from; `solution` holds the indices of the thoughts
+    the search returned.
+    """
+
+    FIELDS = Thought.__slots__
+
+    def __init__(self, prompt: str):
+        self.nodes: List[Thought] = []
+        self.solution: List[int] = []
+        self.add(Thought(prompt))
+
+    @property
+    def root(self) -> Thought:
+        return self.nodes[0]
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def add(self, thought: Thought, parent: Optional[Thought] = None) -> Thought:
+        """Add a copy of `thought` as a child of `parent`; thoughts can be shared between trees, nodes can't."""
+        node = Thought(thought.content, thought.evaluation, thought.score)
+        node.index = len(self.nodes)
+        if parent is not None:
+            node.parent = parent.index
+            node.depth = parent.depth + 1
+        self.nodes.append(node)
+        return node
+
+    def children(self, node: Thought) -> List[Thought]:
+        return [child for child in self.nodes[node.index + 1:] if child.parent == node.index]
+
+    def path(self, node: Thought) -> List[Thought]:
+        """The thoughts from the root down to `node`."""
+        path = [node]
+        while path[-1].parent >= 0:
+            path.append(self.nodes[path[-1].parent])
+        return path[::-1]
+
+    def subtree_cost(self, node: Thought) -> Dict[str, float]:
+        """Tokens and expansion time spent on `node` and everything below it."""
+        # Children always come after their parent, so one forward pass finds the whole subtree.
+        inside = {node.index}
+        totals = dict(input_tokens=0, cached_tokens=0, output_tokens=0, latency=0.0)
+        for current in self.nodes[node.index:]:
+            if current.index != node.index and current.parent not in inside:
+                continue
+            inside.add(current.index)
+            for key in totals:
+                totals[key] += getattr(current, key)
+        return totals
+
+    def to_records(self) -> Iterator[Dict[str, Any]]:
+        solution = set(self.solution)
+        for node in self.nodes:
+            record = {field: getattr(node, field) for field in self.FIELDS}
+            record["solution"] = node.index in solution
+            yield record
+
+    @classmethod
+    def from_records(cls, records: List[Dict[str, Any]]) -> "ThoughtTree":
+        tree = cls.__new__(cls)
+        tree.nodes, tree.solution = [], []
+        for record in records:
+            node = Thought(record["content"], record["evaluation"], record["score"])
+            for field in cls.FIELDS[3:]:
+                setattr(node, field, record[field])
+            tree.nodes.append(node)
+            if record.get("solution"):
+                tree.solution.append(node.index)
+        return tree
+
+    def write_jsonl(self, file: Union[str, IO[str]]):
+        """Write one JSON object per node. `file` is a path or an open text file, so trees can be appended to one log."""
+        if isinstance(file, str):
+            with open(file, "w", encoding="utf-8") as f:
+                return self.write_jsonl(f)
+        for record in self.to_records():
+            file.write(json.dumps(record) + "\n")
+
+    @classmethod
+    def read_jsonl(cls, path: str) -> "ThoughtTree":
+        with open(path, encoding="utf-8") as f:
+            return cls.from_records([json.loads(line) for line in f if line.strip()])
+
+    def to_msgpack(self) -> bytes:
+        """Column names once, then one array per node. Needs the msgpack package."""
+        import msgpack
+        return msgpack.packb({"fields": list(self.FIELDS), "solution": self.solution,
+                              "nodes": [[getattr(node, field) for field in self.FIELDS] for node in self.nodes]})
+
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> "ThoughtTree":
+        import msgpack
+        packed = msgpack.unpackb(data)
+        tree = cls.from_records([dict(zip(packed["fields"], values)) for values in packed["nodes"]])
+        tree.solution = packed["solution"]
+        return tree
\ No newline at end of file
@@ -0,0 +1,192 @@
+import json
+import logging
+import re
+from typing import Any, List, Optional
+from thought import EVALUATION_SCORES, Thought
+
+logger = logging.getLogger(__name__)
+
+# Tool the model is made to call in structured mode, so that thoughts come back as JSON instead of text to be parsed.
+THOUGHTS_TOOL = {
+    "name": "record_thoughts",
+    "description": "Record the candidate next-step thoughts, how promising each one is, and a brief synthesis.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "thoughts": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "content": {"type": "string", "description": "The thought, as one or two sentences."},
+                        "evaluation": {"type": "string", "enum": sorted(EVALUATION_SCORES)},
+                        "score": {"type": "number", "minimum": 0, "maximum": 10,
+                                  "description": "How promising the thought is, from 0 to 10."},
+                    },
+                    "required": ["content", "evaluation", "score"],
+                },
+            },
+            "synthesis": {"type": "string", "description": "A brief synthesis of the thoughts, directly addressing the prompt."},
+        },
+        "required": ["thoughts", "synthesis"],
+    },
+}
+
+# Words models use instead of the three evaluations they are asked for.
+_EVALUATION_ALIASES = {
+    "sure": "sure", "certain": "sure", "definitely": "sure", "high": "sure",
+    "maybe": "maybe", "likely": "maybe", "possible": "maybe", "possibly": "maybe", "unsure": "maybe",
+    "unlikely": "maybe", "medium": "maybe", "low": "maybe",
+    "impossible": "impossible", "infeasible": "impossible",
+}
+
+_SEPARATOR = r"[\s\-–—|,;(\[]*"
+
+# One pattern for every line we care about, so a response is scanned exactly once. The content of a
+# thought is a single line; its evaluation and score may follow on the same line or on the next ones.
+_LINE = re.compile(
+    r"^[ \t>#*\-]*(?:\d+[.)][ \t]*)?\**[ \t]*(?:"
+    r"(?P<synthesis>Synthesis)\**[ \t]*[:=]"
+    r"|Thought[ \t]*\#?[ \t]*\d*[ \t]*\**[ \t]*[:.)\-–—][ \t]*\**[ \t]*(?P<content>[^\n]*?)"
+    r"(?:" + _SEPARATOR + r"\**Evaluation\**[ \t]*[:=][ \t]*\**[ \t]*(?P<evaluation>[A-Za-z]+)"
+    r"(?:" + _SEPARATOR + r"\**Score\**[ \t]*[:=][ \t]*\**[ \t]*(?P<score>\d+(?:\.\d+)?)"
+    r"(?:[ \t]*/[ \t]*(?P<scale>\d+(?:\.\d+)?))?)?"
+    r"[^\n]*|[ \t]*)$)",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Last resort when no line looks like a thought: a plain numbered or bulleted list.
+_LIST_ITEM = re.compile(r"^[ \t]*(?:\d+[.)]|[-*•])[ \t]+(?P<content>\S[^\n]*)", re.MULTILINE)
+
+_TRAILING_COMMA = re.compile(r",\s*([\]}])")
+_CODE_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+class ParsedThoughts:
+    """Thoughts and synthesis read from one expansion response, and how they were read."""
+
+    def __init__(self, thoughts: List[Thought], synthesis: str = "", method: str = "text"):
+        self.thoughts = thoughts
+        self.synthesis = synthesis
+        self.method = method  # "json", "text", "repaired" or "failed"
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.thoughts)
+
+def normalize_evaluation(evaluation: Optional[str]) -> Optional[str]:
+    if not evaluation:
+        return None
+    return _EVALUATION_ALIASES.get(evaluation.lower())
+
+def normalize_score(score: Any, scale: Any = None) -> Optional[float]:
+    """A 0-10 score (or one out of `scale`) as a fraction from 0 to 1."""
+    try:
+        score = float(score)
+        scale = float(scale) if scale else (100.0 if score > 10 else 10.0)
+        return min(max(score / scale, 0.0), 1.0)
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+
+def _clean(content: str) -> str:
+    return content.strip(" \t*-–—|[]\"")
+
+def _from_json(data: Any) -> Optional[ParsedThoughts]:
+    if isinstance(data, list):
+        data = {"thoughts": data}
+    if not isinstance(data, dict) or not isinstance(data.get("thoughts"), list):
+        return None
+    thoughts = []
+    for item in data["thoughts"]:
+        if isinstance(item, str):
+            item = {"content": item}
+        if not isinstance(item, dict) or not str(item.get("content") or "").strip():
+            continue
+        thoughts.append(Thought(_clean(str(item["content"])), normalize_evaluation(str(item.get("evaluation") or "")),
+                                normalize_score(item.get("score"))))
+    return ParsedThoughts(thoughts, str(data.get("synthesis") or "").strip(), "json")
+
+def _repair_json(text: str) -> Optional[Any]:
+    """Fix the usual ways JSON from a model is broken: code fences, trailing commas and truncation."""
+    text = _CODE_FENCE.sub("", text.strip())
+    text = _TRAILING_COMMA.sub(r"\1", text)
+    # Close whatever a truncated response left open, dropping a dangling string or key.
+    stack, in_string, escaped, last_complete = [], False, False, 0
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+            last_complete = i + 1
+    candidates = [text]
+    if stack or in_string:
+        head = text[:last_complete]
+        closers = []
+        for char in head:
+            if char in "{[":
+                closers.append("}" if char == "{" else "]")
+            elif char in "}]" and closers:
+                closers.pop()
+        candidates.append(_TRAILING_COMMA.sub(r"\1", head.rstrip().rstrip(",") + "".join(reversed(closers))))
+    for candidate in candidates:
+        try:
+            return json.loads(candidate)
+        except ValueError:
+            continue
+    return None
+
+def _parse_json(response: str) -> Optional[ParsedThoughts]:
+    start = min((i for i in (response.find("{"), response.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        return None
+    try:
+        data = json.loads(response[start:])
+        method = "json"
+    except ValueError:
+        data = _repair_json(response[start:])
+        method = "repaired"
+    parsed = _from_json(data)
+    if parsed is not None:
+        parsed.method = method
+    return parsed
+
+def _parse_text(response: str) -> ParsedThoughts:
+    thoughts, synthesis = [], ""
+    for match in _LINE.finditer(response):
+        if match.group("synthesis"):
+            synthesis = response[match.end():].strip()
+            break
+        content = _clean(match.group("content") or "")
+        if content:
+            thoughts.append(Thought(content, normalize_evaluation(match.group("evaluation")),
+                                    normalize_score(match.group("score"), match.group("scale"))))
+    return ParsedThoughts(thoughts, synthesis, "text")
+
+def parse_thoughts(response: str, limit: Optional[int] = None) -> ParsedThoughts:
+    """
+    Read the thoughts out of an expansion response: the JSON input of a record_thoughts tool call,
+    or the "Thought N: ... - Evaluation: ... - Score: ..." text format and the variations models
+    drift into. Broken JSON and lists without the expected labels are repaired locally rather than
+    by asking the model again. Thoughts with an unrecognized evaluation or score keep None for it.
+    """
+    stripped = response.lstrip()
+    parsed = _parse_json(stripped) if stripped[:1] in "{[`" else None
+    if parsed is None or not parsed.ok:
+        parsed = _parse_text(response)
+    if not parsed.ok:
+        head = response.split("Synthesis", 1)[0]
+        thoughts = [Thought(_clean(match.group("content"))) for match in _LIST_ITEM.finditer(head)]
+        parsed = ParsedThoughts(thoughts, parsed.synthesis, "repaired" if thoughts else "failed")
+    if not parsed.ok:
+        logger.warning(f"Could not parse any thoughts from response: {response[:200]!r}")
+    if limit is not None:
+        parsed.thoughts = parsed.thoughts[:limit]
+    return parsed
\ No newline at end of file
@@ -0,0 +1,90 @@
+import asyncio
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, Hashable, List
+from thought import Thought
+from tracing import record
+
+logger = logging.getLogger(__name__)
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+class ThoughtStore:
+    """
+    Memoizes Tree of Thought expansions, so trees that reach the same prompt at the same depth
+    share one generate-and-evaluate call instead of each making their own.
+
+    Results live in a bounded LRU. Concurrent requests for the same key wait for the call that is
+    already in flight, even when they come from different event loops. With `diversity` > 1,
+    agents are spread over that many variants by seed, and each variant gets its own expansions
+    so that the agents don't all end up exploring the same tree.
+    """
+
+    def __init__(self, max_entries: int = 1024, diversity: int = 1):
+        self.max_entries = max_entries
+        self.diversity = max(diversity, 1)
+        self._entries: "OrderedDict[Hashable, List[Thought]]" = OrderedDict()
+        self._in_flight: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.deduplicated = 0
+        self.misses = 0
+
+    def variant(self, seed: int) -> int:
+        return seed % self.diversity
+
+    @property
+    def saved(self) -> int:
+        """Expansions answered without an API call of their own."""
+        return self.hits + self.deduplicated
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "deduplicated": self.deduplicated,
+                    "misses": self.misses, "saved": self.saved}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    async def get_or_generate(self, prompt: str, depth: int, branching_factor: int, variant: int,
+                              generate: Callable[[], Awaitable[List[Thought]]]) -> List[Thought]:
+        key = (normalize_prompt(prompt), depth, branching_factor, variant)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                record(saved_expansions=1)
+                return list(self._entries[key])
+            future = self._in_flight.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = self._in_flight[key] = Future()
+                self.misses += 1
+            else:
+                self.deduplicated += 1
+
+        if not is_owner:
+            record(saved_expansions=1)
+            thoughts = await asyncio.wrap_future(future)
+            if thoughts is not None:
+                return list(thoughts)
+            # The call we were waiting for was cancelled or failed, so make our own.
+            return await generate()
+
+        thoughts = None
+        try:
+            thoughts = await generate()
+            return thoughts
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                # An empty list means the call failed; don't remember that.
+                if thoughts:
+                    self._entries[key] = list(thoughts)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+            future.set_result(thoughts)
\ No newline at end of file
@@ -0,0 +1,179 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("current_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+_current_tallies: contextvars.ContextVar = contextvars.ContextVar("current_tallies", default=())
+
+class Span:
+    __slots__ = ("id", "parent_id", "name", "start", "end", "lane", "attributes")
+
+    def __init__(self, id: int, parent_id: Optional[int], name: str, start: float, lane: str, attributes: Dict[str, Any]):
+        self.id = id
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.lane = lane
+        self.attributes = attributes
+
+    @property
+    def wall_time(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def to_dict(self, origin: float = 0.0) -> Dict[str, Any]:
+        return {"id": self.id, "parent_id": self.parent_id, "name": self.name, "start": self.start - origin,
+                "wall_time": self.wall_time, "lane": self.lane, **self.attributes}
+
+class Trace:
+    """
+    Spans recorded while handling one request. Use start_trace() to make a trace current; every
+    span() opened in that context, including inside asyncio tasks and run_in_thread calls, lands here.
+    """
+
+    def __init__(self, name: str = "request"):
+        self.name = name
+        self.origin = time.perf_counter()
+        self.spans: List[Span] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _open(self, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Span:
+        with self._lock:
+            span = Span(next(self._ids), parent.id if parent else None, name, time.perf_counter(), _lane(), attributes)
+            self.spans.append(span)
+        return span
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """Totals per span name: count, wall time and any numeric attributes such as tokens or wait time."""
+        totals: Dict[str, Dict[str, float]] = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, {"count": 0, "wall_time": 0.0})
+            entry["count"] += 1
+            entry["wall_time"] += span.wall_time
+            for key, value in span.attributes.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    entry[key] = entry.get(key, 0) + value
+        return totals
+
+    def critical_path(self) -> List[Span]:
+        """From the root that finished last, repeatedly follow the child that finished last."""
+        children: Dict[Optional[int], List[Span]] = {}
+        for span in self.spans:
+            children.setdefault(span.parent_id, []).append(span)
+        path = []
+        candidates = children.get(None, [])
+        while candidates:
+            current = max(candidates, key=lambda span: span.start + span.wall_time)
+            path.append(current)
+            candidates = children.get(current.id, [])
+        return path
+
+    def to_jsonl(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            for span in self.spans:
+                f.write(json.dumps(span.to_dict(self.origin)) + "\n")
+
+    def to_chrome_trace(self, path: str):
+        """Write a Chrome trace-event file; open it in chrome://tracing or https://ui.perfetto.dev."""
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.spans:
+            events.append({
+                "name": span.name,
+                "ph": "X",
+                "ts": (span.start - self.origin) * 1e6,
+                "dur": span.wall_time * 1e6,
+                "pid": 1,
+                "tid": lanes.setdefault(span.lane, len(lanes) + 1),
+                "args": span.attributes,
+            })
+        events.extend({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}} for lane, tid in lanes.items())
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+def _lane() -> str:
+    # Concurrent spans only nest cleanly in a trace viewer when each task or thread has its own row.
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        return task.get_name()
+    return threading.current_thread().name
+
+def get_current_trace() -> Optional[Trace]:
+    return _current_trace.get()
+
+@contextmanager
+def start_trace(name: str = "request") -> Iterator[Trace]:
+    trace = Trace(name)
+    trace_token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(trace_token)
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Record a span in the current trace. Does nothing (and yields None) when no trace is active."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    current = trace._open(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.attributes["error"] = type(e).__name__
+        raise
+    finally:
+        current.end = time.perf_counter()
+        _current_span.reset(token)
+
+def add_span(name: str, start: float, **attributes: Any):
+    """Record an already finished span (started at perf_counter() value `start`) under the current span.
+
+    For code that can't hold a span open across its lifetime, such as generators, where a context
+    variable set inside would leak into the caller between yields.
+    """
+    trace = _current_trace.get()
+    if trace is not None:
+        finished = trace._open(name, _current_span.get(), attributes)
+        finished.start = start
+        finished.end = time.perf_counter()
+
+def record(**values: float):
+    """Add numeric values (tokens, wait time, retries) to the current span and to any open tallies."""
+    current = _current_span.get()
+    if current is not None:
+        for key, value in values.items():
+            current.attributes[key] = current.attributes.get(key, 0) + value
+    for totals in _current_tallies.get():
+        for key, value in values.items():
+            totals[key] = totals.get(key, 0) + value
+
+@contextmanager
+def tally() -> Iterator[Dict[str, float]]:
+    """Sum everything record()ed in this context, whether or not a trace is active. Tallies nest."""
+    totals: Dict[str, float] = {}
+    token = _current_tallies.set(_current_tallies.get() + (totals,))
+    try:
+        yield totals
+    finally:
+        _current_tallies.reset(token)
+
+def annotate(**values: Any):
+    """Set attributes on the current span."""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes.update(values)
\ No newline at end of file
@@ -1,67 +1,170 @@
+import asyncio
 import logging
-from typing import List, Tuple
-from thought import Thought
-from api_utils import make_api_call, AnthropicAPIError, chunk_text
+import time
+from typing import List, Optional, Tuple, Union
+from thought import Thought, ThoughtTree
+from search_strategies import SearchBudget, SearchStrategy, get_search_strategy
+from thought_parser import THOUGHTS_TOOL, parse_thoughts
+from thought_store import ThoughtStore
+from api_utils import make_api_call_async, AnthropicAPIError, cache_breakpoint, chunk_text
+from deadlines import cap, degrade, expired, reserve, within_deadline
+from model_routing import escalating, stage
+from tracing import annotate, span, tally
 
 logger = logging.getLogger(__name__)
 
 class TreeOfThought:
-    def __init__(self, max_depth: int = 2, branching_factor: int = 2):
+    def __init__(self, max_depth: int = 2, branching_factor: int = 2, parallel: bool = True,
+                 max_expansions: Optional[int] = None, time_budget: Optional[float] = None,
+                 strategy: Union[str, SearchStrategy] = "bfs", convergence_threshold: Optional[float] = None,
+                 thought_store: Optional[ThoughtStore] = None, seed: int = 0, structured: bool = False):
         self.max_depth = max_depth
         self.branching_factor = branching_factor
+        self.parallel = parallel  # Expand every node at a depth at once instead of one node per round trip
+        self.max_expansions = max_expansions  # Cap on generate_and_evaluate_thoughts calls per search
+        self.time_budget = time_budget  # Wall-clock seconds per search
+        self.strategy = get_search_strategy(strategy)
+        self.convergence_threshold = convergence_threshold  # Stop expanding once a level's thoughts agree this much (0-1)
+        self.thought_store = thought_store  # Shares expansions with other trees that reach the same prompt
+        self.seed = seed  # Picks this tree's variant when the store is diversified
+        self.structured = structured  # Have the model call the record_thoughts tool instead of writing the text format
+        self.last_expansions = 0
+        self.last_tree: Optional[ThoughtTree] = None
 
-    def generate_and_evaluate_thoughts(self, prompt: str, depth: int) -> List[Thought]:
+    def _parse_thoughts(self, response: str) -> List[Thought]:
+        parsed = parse_thoughts(response, self.branching_factor)
+        annotate(parse=parsed.method)
+        return parsed.thoughts
+
+    async def generate_and_evaluate_thoughts_async(self, prompt: str, depth: int) -> List[Thought]:
+        if self.thought_store is None:
+            return await self._generate_and_evaluate_thoughts_async(prompt, depth, 0)
+        variant = self.thought_store.variant(self.seed)
+        return await self.thought_store.get_or_generate(prompt, depth, self.branching_factor, variant,
+                                                        lambda: self._generate_and_evaluate_thoughts_async(prompt, depth, variant))
+
+    async def _generate_and_evaluate_thoughts_async(self, prompt: str, depth: int, variant: int) -> List[Thought]:
         system_prompt = f"""Generate and evaluate {self.branching_factor} thoughts as next steps for the given prompt.
-        For each thought, provide an evaluation of 'sure', 'maybe', or 'impossible'.
+        For each thought, provide an evaluation of 'sure', 'maybe', or 'impossible', and a score from 0 to 10 for how promising it is."""
+        if self.structured:
+            system_prompt += "\n        Record them, with a brief synthesis that directly addresses the prompt, using the record_thoughts tool."
+            tool_params = dict(tools=[THOUGHTS_TOOL], tool_choice={"type": "tool", "name": THOUGHTS_TOOL["name"]})
+        else:
+            system_prompt += """
         Format your response as follows:
-        Thought 1: [content] - Evaluation: [evaluation]
-        Thought 2: [content] - Evaluation: [evaluation]
+        Thought 1: [content] - Evaluation: [evaluation] - Score: [score]
+        Thought 2: [content] - Evaluation: [evaluation] - Score: [score]
         Synthesis: [A brief synthesis of the thoughts, directly addressing the prompt]"""
+            tool_params = {}
 
-        user_prompt = f"Depth: {depth}\nPrompt: {prompt}\n\nGenerate and evaluate {self.branching_factor} thoughts:"
+        # The prompt comes first: at the root it is the same for every agent in a layer, so it can be cached.
+        instructions = f"Depth: {depth}\n\nGenerate and evaluate {self.branching_factor} thoughts:"
+        if variant:
+            instructions += f"\n(Variant {variant + 1}: prefer thoughts that differ from the most obvious approaches.)"
+        user_content = [cache_breakpoint(f"Prompt: {prompt}"), {"type": "text", "text": instructions}]
         
         try:
-            response = make_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}])
-            thoughts = []
-            for line in response.split('\n'):
-                if 'Thought' in line and 'Evaluation:' in line:
-                    content, evaluation = line.split(' - Evaluation:')
-                    content = content.split(':', 1)[1].strip()
-                    thoughts.append(Thought(content.strip(), evaluation.strip()))
-            return thoughts[:self.branching_factor]
+            with span("tot_expansion", depth=depth), stage("tot_expansion"):
+                # A small model's expansion that can't be parsed is redone by the larger model.
+                response = await escalating(
+                    lambda: make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_content}], **tool_params),
+                    lambda text: parse_thoughts(text, self.branching_factor).ok)
+                return self._parse_thoughts(response)
         except AnthropicAPIError as e:
             logger.error(f"Error generating and evaluating thoughts: {str(e)}")
             return []
 
-    def search(self, initial_prompt: str) -> List[Thought]:
-        frontier = [(Thought(initial_prompt), 0)]
-        solution = []
+    def generate_and_evaluate_thoughts(self, prompt: str, depth: int) -> List[Thought]:
+        return asyncio.run(self.generate_and_evaluate_thoughts_async(prompt, depth))
 
-        while frontier and len(solution) < self.branching_factor:
-            current_thought, depth = frontier.pop(0)
-            
-            if depth == self.max_depth or current_thought.evaluation == 'sure':
-                solution.append(current_thought)
-                continue
+    async def search_tree_async(self, initial_prompt: str) -> ThoughtTree:
+        """Run the search and return every thought it explored, with the chosen ones in `solution`."""
+        with span("tot_search", strategy=self.strategy.name):
+            # Under a request deadline the search stops early and keeps the best thoughts it has.
+            budget = SearchBudget(self.max_expansions, cap(self.time_budget))
+            tree = ThoughtTree(initial_prompt)
+            solution = await self.strategy.search(self, tree, budget)
+            tree.solution = [thought.index for thought in solution]
+            self.last_expansions = budget.expansions
+            self.last_tree = tree
+            annotate(expansions=budget.expansions, nodes=len(tree))
+        return tree
 
-            if depth < self.max_depth:
-                children = self.generate_and_evaluate_thoughts(current_thought.content, depth + 1)
-                frontier.extend((child, depth + 1) for child in children if child.evaluation != "impossible")
+    async def search_async(self, initial_prompt: str) -> List[Thought]:
+        tree = await self.search_tree_async(initial_prompt)
+        return [tree.nodes[index] for index in tree.solution]
 
-        return solution
+    def search_tree(self, initial_prompt: str) -> ThoughtTree:
+        return asyncio.run(self.search_tree_async(initial_prompt))
 
-    def process(self, input: str) -> Tuple[List[Thought], str]:
-        thoughts = self.search(input)
-        synthesis = self.synthesize_thoughts(thoughts)
+    async def _expand(self, thought: Thought, depth: int) -> List[Thought]:
+        # Charge the expansion to the node it expands; answers from the thought store cost nothing.
+        start_time = time.perf_counter()
+        with tally() as usage:
+            children = await self.generate_and_evaluate_thoughts_async(thought.content, depth + 1)
+        thought.latency = time.perf_counter() - start_time
+        thought.input_tokens = usage.get("input_tokens", 0) + usage.get("cache_write_tokens", 0)
+        thought.cached_tokens = usage.get("cache_read_tokens", 0)
+        thought.output_tokens = usage.get("output_tokens", 0)
+        return children
+
+    async def expand_nodes(self, tree: ThoughtTree, nodes: List[Tuple[Thought, int]], budget: SearchBudget) -> List[Tuple[Thought, int]]:
+        if not nodes:
+            return []
+        budget.expansions += len(nodes)
+        tasks = [asyncio.ensure_future(self._expand(thought, depth)) for thought, depth in nodes]
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=budget.remaining_time())
+        except asyncio.CancelledError:
+            # asyncio.wait leaves its tasks running when the caller is cancelled.
+            for task in tasks:
+                task.cancel()
+            raise
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"Tree of Thought time budget hit with {len(pending)} expansions still in flight")
+            if expired():
+                degrade("Tree of Thought search", f"{len(pending)} expansions cut off")
+
+        expanded = []
+        for (thought, depth), task in zip(nodes, tasks):
+            if task in done:
+                # Impossible thoughts stay in the tree for the record but are not explored.
+                children = [tree.add(child, thought) for child in task.result()]
+                expanded.extend((child, depth + 1) for child in children if child.evaluation != "impossible")
+            else:
+                # Keep the parent so it can still serve as a fallback answer.
+                expanded.append((thought, depth))
+        return expanded
+
+    def search(self, initial_prompt: str) -> List[Thought]:
+        return asyncio.run(self.search_async(initial_prompt))
+
+    async def process_async(self, input: str) -> Tuple[List[Thought], str]:
+        with reserve(0.25):  # Time for the synthesis
+            thoughts = await self.search_async(input)
+        synthesis = await within_deadline(self.synthesize_thoughts_async(thoughts), lambda: " ".join(t.content for t in thoughts),
+                                          "Tree of Thought synthesis")
         return thoughts, synthesis
 
-    def synthesize_thoughts(self, thoughts: List[Thought]) -> str:
+    def process(self, input: str) -> Tuple[List[Thought], str]:
+        return asyncio.run(self.process_async(input))
+
+    async def synthesize_thoughts_async(self, thoughts: List[Thought]) -> str:
         thought_contents = [t.content for t in thoughts]
         system_prompt = "Synthesize the following thoughts into a brief, coherent response:"
         user_prompt = "\n".join(f"Thought {i+1}: {content}" for i, content in enumerate(thought_contents))
         
         try:
-            return make_api_call(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=500)
+            with span("tot_synthesis"), stage("tot_synthesis"):
+                return await escalating(
+                    lambda: make_api_call_async(system=system_prompt, messages=[{"role": "user", "content": user_prompt}], max_tokens=500),
+                    lambda text: bool(text.strip()))
         except AnthropicAPIError as e:
             logger.error(f"Error synthesizing thoughts: {str(e)}")
-            return "Unable to synthesize thoughts due to an error."
\ No newline at end of file
+            return "Unable to synthesize thoughts due to an error."
+
+    def synthesize_thoughts(self, thoughts: List[Thought]) -> str:
+        return asyncio.run(self.synthesize_thoughts_async(thoughts))
\ No newline at end of file